@@ -1,327 +1,18 @@
 # coding=utf-8
-import io
+import io, os
+import numpy as np
 from struct import unpack
-from itertools import chain
-import array
-from itertools import chain
 from Tkinter import *
 from ttk import *
 import tkMessageBox
-
-class MKFDecoder:
-    """
-    MKF文件解码《仙剑》MKF文件的结构组成，以ABC.MKF为例：
-    偏移         数据            含义
-    00000000     6C 02 00 00     偏移表的长度，此值 / 4 - 2 = 包含文件个数
-    00000004     6C 02 00 00     第1个子文件的偏移
-    　     　                    第2-152个子件的偏移
-    00000264     C2 6F 0F 00     第153个子文件的偏移
-    00000268     64 9A 0F 00     此值指向文件末尾，也就是文件的长度
-    0000026C     59 4A 5F 31     第1个子文件从这里开始，"YJ_1"是压缩文件的标志
-    00000270     A0 08 00 00     这个值是文件的原始的长度
-    00000274     12 07 00 00     这个值是文件压缩后的长度
-    00000278     01 00           这个值是文件压缩占64K段的个数，通常为1
-    0000027A     00 4A           这个值是数据压缩特征串表的长度
-    0000027C     01 02 。。      从这开始是数据压缩特征串表
-    000002C4     87 7B 02 4C     从这开始是压缩后的文件数据
-    　     　                    其他压缩文件
-    000F9A60     0B 12 80 38     文件的末尾
-    """
-
-    def __init__(self, path=None, data=None):
-        # path和data不能同时是None
-        assert path or data
-        self.yj1 = YJ1Decoder()
-        try:
-            # 优先使用path（优先从文件读取）
-            if path:
-                f = open(path, 'rb')
-                self.content = f.read()
-            else:
-                self.content = data
-            # ===================================================================
-            # 偏移（索引）表长度，假设文件前4位为6C 02 00 00（little-end的int值为
-            # 26CH = 620），说明索引表长度为620字节，即620/4 = 155个整数，由于第一个
-            # 整数被用于存储表长度，因此实际上只有后面154个整数存的是偏移量。另一方面，
-            # 最后一个整数指向文件末尾，也就是文件的长度，因此实际上MKF内部的文件是由
-            # 前后两个偏移量之间的byte表示的。这样由于一共有154个个偏移量，因此共有
-            # 153个文件
-            #
-            # ！！！补充：第一个int（前四位）不仅是偏移表长度，也是第一个文件的开头
-            # ABC.MFK中前面两个4位分别相等只是巧合（第一个文件为0）
-            # ===================================================================
-            self.count = unpack('I', self.content[:4])[0] / 4  # - 1
-            self.indexes = []
-            self.cache = {}
-            for i in xrange(self.count):
-                index = unpack('I', self.content[i << 2: (i + 1) << 2])[0]
-                self.indexes.append(index)
-            # 减去最后一个偏移量，对外而言，count就表示mkf文件中的子文件个数
-            self.count -= 1
-        except IOError:
-            print 'error occurs when try to open file', path
-        finally:
-            if 'f' in dir():
-                f.close()
-
-    def check(self, index):
-        assert index <= self.count and index >= 0
-
-    def getFileCount(self):
-        return self.count
-
-    def isYJ1(self, index):
-        '''
-        判断文件是否为YJ_1压缩
-        '''
-        self.check(index)
-        return self.content[self.indexes[index]:self.indexes[index] + 4] == '\x59\x4A\x5F\x31'
-
-    def read(self, index):
-        '''
-        读取并返回指定文件，如果文件是经过YJ_1压缩的话，返回解压以后的内容
-        '''
-        self.check(index + 1)
-        if not self.cache.has_key(index):
-            data = self.content[self.indexes[index]:self.indexes[index + 1]]
-            if self.isYJ1(index):
-                data = self.yj1.decode(data)
-            self.cache[index] = data
-        return self.cache[index]
-
-class YJ1Decoder:
-    """
-    YJ_1文件解析
-    YJ_1文件结构：
-    0000000: 594a5f31 fe520000 321b0000                02（即data[0xC]) 00 00 57（即data[0xF]）
-              Y J _ 1 新文件长 源文件长（包含'YJ_1'头）block数                loop数
-    """
-
-    def __init__(self):
-        pass
-
-    def decode(self, data):
-        '''
-        解析YJ_1格式的压缩文件，如果文件不是YJ_1格式或者文件为空，则直接返回原始数据
-        '''
-        self.si = self.di = 0  # 记录文件位置的指针 记录解开后保存数据所在数组中的指向位置
-        self.first = 1
-        self.key_0x12 = self.key_0x13 = 0
-        self.flags = 0
-        self.flagnum = 0
-
-        pack_length = 0
-        ext_length = 0
-        if not data:
-            print 'no data to decode'
-            return ''
-        self.data = data
-        self.dataLen = len(data)
-        if self.readInt() != 0x315f4a59:  # '1' '_' 'J' 'Y'
-            print 'not YJ_1 data'
-            return data
-        self.orgLen = self.readInt()
-        self.fileLen = self.readInt()
-        self.finalData = ['\x00' for _ in xrange(self.orgLen)]
-        self.keywords = [0 for _ in xrange(0x14)]
-
-        prev_src_pos = self.si
-        prev_dst_pos = self.di
-
-        blocks = self.readByte(0xC)
-
-        self.expand()
-
-        prev_src_pos = self.si
-        self.di = prev_dst_pos
-        for _ in xrange(blocks):
-            if self.first == 0:
-                prev_src_pos += pack_length
-                prev_dst_pos += ext_length
-                self.si = prev_src_pos
-                self.di = prev_dst_pos
-            self.first = 0
-
-            ext_length = self.readShort()
-            pack_length = self.readShort()
-
-            if not pack_length:
-                pack_length = ext_length + 4
-                for _ in xrange(ext_length):
-                    self.finalData[self.di] = self.data[self.si]
-                    self.di += 1
-                    self.si += 1
-                ext_length = pack_length - 4
-            else:
-                d = 0
-                for _ in xrange(0x14):
-                    self.keywords[d] = self.readByte()
-                    d += 1
-                self.key_0x12 = self.keywords[0x12]
-                self.key_0x13 = self.keywords[0x13]
-                self.flagnum = 0x20
-                self.flags = ((self.readShort() << 16) | self.readShort()) & 0xffffffff
-                self.analysis()
-
-        return ''.join([x for x in self.finalData if x != 0])
-
-    def analysis(self):
-        loop = 0
-        numbytes = 0
-        while True:
-            loop = self.decodeloop()
-            if loop == 0xffff:
-                return
-            for _ in xrange(loop):
-                m = 0
-                self.update(0x10)
-                while True:
-                    m = self.trans_topflag_to(m, self.flags, self.flagnum, 1)
-                    self.flags = (self.flags << 1) & 0xffffffff
-                    self.flagnum -= 1
-                    if self.assist[m] == 0:
-                        break
-                    m = self.table[m]
-                self.finalData[self.di] = chr(self.table[m] & 0xff)
-                self.di += 1
-            loop = self.decodeloop()
-            if loop == 0xffff:
-                return
-            for _ in xrange(loop):
-                numbytes = self.decodenumbytes()
-                self.update(0x10)
-                m = self.trans_topflag_to(0, self.flags, self.flagnum, 2)
-                self.flags = (self.flags << 2) & 0xffffffff
-                self.flagnum -= 2
-                t = self.keywords[m + 8]
-                n = self.trans_topflag_to(0, self.flags, self.flagnum, t)
-                self.flags = (self.flags << t) & 0xffffffff
-                self.flagnum -= t
-                for _ in xrange(numbytes):
-                    self.finalData[self.di] = self.finalData[self.di - n]
-                    self.di += 1
-
-    def readShort(self, si=None):
-        if si:
-            self.si = si
-        if self.si >= self.dataLen:
-            result = 0
-        else:
-            result, = unpack('H', self.data[self.si: self.si + 2])
-        self.si += 2
-        return result
-
-    def readByte(self, si=None):
-        if si:
-            self.si = si
-        if self.si >= self.dataLen:
-            result = 0
-        else:
-            result, = unpack('B', self.data[self.si])
-        self.si += 1
-        return result
-
-    def readInt(self, si=None):
-        if si:
-            self.si = si
-        if self.si >= self.dataLen:
-            result = 0
-        else:
-            result, = unpack('I', self.data[self.si: self.si + 4])
-        self.si += 4
-        return result
-
-    def move_top(self, x):
-        t = x >> 15
-        return t & 0xffff
-
-    def get_topflag(self, x, y):
-        t = x >> 31
-        return t & 0xffffffff
-
-    def trans_topflag_to(self, x, y, z, n):
-        for _ in xrange(n):
-            x <<= 1
-            x |= self.get_topflag(y, z)
-            y = (y << 1) & 0xffffffff
-            z -= 1
-        return x & 0xffffffff
-
-    def update(self, x):
-        if self.flagnum < x:
-            self.flags |= self.readShort() << (0x10 - self.flagnum) & 0xffffffff
-            self.flagnum += 0x10
-
-    def decodeloop(self):
-        self.update(3)
-        loop = self.key_0x12
-        if self.get_topflag(self.flags, self.flagnum) == 0:
-            self.flags = (self.flags << 1) & 0xffffffff
-            self.flagnum -= 1
-            t = 0
-            t = self.trans_topflag_to(t, self.flags, self.flagnum, 2)
-            self.flags = (self.flags << 2) & 0xffffffff
-            self.flagnum -= 2
-            loop = self.key_0x13
-            if t != 0:
-                t = self.keywords[t + 0xE]
-                self.update(t)
-                loop = self.trans_topflag_to(0, self.flags, self.flagnum, t)
-                if loop == 0:
-                    self.flags = (self.flags << t) & 0xffffffff
-                    self.flagnum -= t
-                    return 0xffff
-                else:
-                    self.flags = (self.flags << t) & 0xffffffff
-                    self.flagnum -= t
-        else:
-            self.flags = (self.flags << 1) & 0xffffffff
-            self.flagnum -= 1
-        return loop
-
-    def decodenumbytes(self):
-        self.update(3)
-        numbytes = self.trans_topflag_to(0, self.flags, self.flagnum, 2)
-        if numbytes == 0:
-            self.flags = (self.flags << 2) & 0xffffffff
-            self.flagnum -= 2
-            numbytes = (self.keywords[1] << 8) | self.keywords[0]
-        else:
-            self.flags = (self.flags << 2) & 0xffffffff
-            self.flagnum -= 2
-            if self.get_topflag(self.flags, self.flagnum) == 0:
-                self.flags = (self.flags << 1) & 0xffffffff
-                self.flagnum -= 1
-                numbytes = (self.keywords[numbytes * 2 + 1] << 8) | self.keywords[numbytes * 2]
-            else:
-                self.flags = (self.flags << 1) & 0xffffffff
-                self.flagnum -= 1
-                t = self.keywords[numbytes + 0xB]
-                self.update(t)
-                numbytes = 0
-                numbytes = self.trans_topflag_to(numbytes, self.flags, self.flagnum, t)
-                self.flags = (self.flags << t) & 0xffffffff
-                self.flagnum -= t
-        return numbytes
-
-    def expand(self):
-        loop = self.readByte(0xF)
-        offset, flags = 0, 0
-        self.di = self.si
-        self.si += 2 * loop
-        self.table = []
-        self.assist = []
-        for _ in xrange(loop):
-            if offset % 16 == 0:
-                flags = self.readShort()
-            self.table.append(unpack('B', self.data[self.di])[0])
-            self.table.append(unpack('B', self.data[self.di + 1])[0])
-            self.di += 2
-            self.assist.append(self.move_top(flags))
-            flags = (flags << 1) & 0xffff
-            self.assist.append(self.move_top(flags))
-            flags = (flags << 1) & 0xffff
-            offset += 2
+from mkf_unpack import MKFDecoder, DiskChunkCache
+from mkf_pack import MKFEncoder
+from sprite import decode_bitmaps
+from palette import Palette
+from text import WordStore, MessageStore
+from objects import ObjectTable, ITEM_RANGE, MAGIC_RANGE, ENEMY_RANGE, item_flags
+from datatables import DataTables, lookup, record_fields, get_field, set_field
+from text_index import open_index, word_key, split_key
 
 class PAL_Inventory:
     # inventory[0] => image in ball.mkf [0..232]
@@ -337,12 +28,17 @@ class PAL_Inventory:
     ]
 
     beginAddressInSSS2 = 0x3D
-    def __init__(self, data, objId):
+    propertyMask = 0xFFF
+    def __init__(self, data, objId, properties=None):
         self.data = data
         self.objId = objId
         self.inventoryId = objId + PAL_Inventory.beginAddressInSSS2
-        self.property = [0]*12
-        self.init_property()
+        # properties为App中一次解出的所有道具标志位矩阵的一行
+        if properties is None:
+            self.property = [0]*12
+            self.init_property()
+        else:
+            self.property = [int(p) for p in properties]
 
     def set_image_id(self, nid):
         self.data[0] = nid & 0xFFFF
@@ -380,48 +76,89 @@ class PAL_Inventory:
 
     def set_property(self, prop, value):
         self.property[prop] = value & 1
-        for j in xrange(0, 12):
-            self.data[5] |= self.property[j] << j
+        self.write_properties()
 
     def set_properties(self, props):
-        self.property = props
-        for j in xrange(0, 12):
-            self.data[5] |= self.property[j] << j
+        self.property = [p & 1 for p in props]
+        self.write_properties()
 
-def get_chunks(l, n):
-    llen = len(l)
-    return [l[i:i+n] for i in xrange(0, llen, n)]
+    def write_properties(self):
+        # 先清除低12位再写入，取消勾选的属性才能真正清除
+        flags = 0
+        for j in xrange(0, 12):
+            flags |= self.property[j] << j
+        self.data[5] = (self.data[5] & ~PAL_Inventory.propertyMask & 0xFFFF) | flags
 
 class WordData:
-    def __init__(self):
+    """
+    word.dat中的物件名称，未修改的词条从WordStore中按需解码，修改和新增的放在names中，
+    名称均为utf8的str，退出时有修改则写入同目录下的WORDEX.DAT
+    index为text_index.TextIndex时，修改名称会同时更新内存中的索引，但不写回TEXT.IDX：
+    索引对应的是word.dat，而编辑器下次启动仍然读入word.dat，修改过的名称不会被再次搜索到
+    """
+
+    def __init__(self, path='WORD.DAT'):
         self.changed = False
-        with open('WORD.DAT', mode='rb') as file: # b is important -> binary
-            fileContent = file.read()
-            theBuffer = get_chunks(fileContent, 10)
-            self.words = [ss.strip().decode('big5').encode('utf8') for ss in theBuffer]
+        self.path = path
+        self.store = WordStore(path)
+        self.count = self.store.getWordCount()
+        self.names = {}
+        self.index = None
 
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, trace):
         if self.changed:
-            self.write_to_file('WORDEX.DAT')
+            self.write_to_file(os.path.join(os.path.dirname(self.path), 'WORDEX.DAT'))
+        self.store.close()
+
+    def getWordCount(self):
+        return self.count
 
     def get_object_name(self, objId):
-        return self.words[objId]
+        name = self.names.get(objId)
+        if name is None:
+            if objId < 0 or objId >= self.count:
+                raise IndexError('word %d does not exist' % objId)
+            name = self.store.get(objId)
+        return name
 
     def set_object_name(self, objId, name):
+        if isinstance(name, unicode):
+            name = name.encode('utf8')
         self.changed = True
-        self.words[objId] = name
+        self.names[objId] = name
+        if self.index is not None:
+            self.index.update(word_key(objId), name.decode('utf8'))
 
     def add_object_name(self, name):
+        if isinstance(name, unicode):
+            name = name.encode('utf8')
         self.changed = True
-        self.words.append(name)
-        return len(self.words)
+        self.names[self.count] = name
+        if self.index is not None:
+            self.index.add(word_key(self.count), name.decode('utf8'))
+        self.count += 1
+        return self.count
+
+    def search(self, query):
+        '''
+        返回名称中包含query（utf8）的物件编号，没有索引时返回None
+        '''
+        if self.index is None:
+            return None
+        return [n for kind, n in map(split_key, self.index.search(query.decode('utf8'))) if kind == 'word']
 
     def words_to_str(self):
-        biglist = ["{:10}".format(ss.decode('utf8').encode('big5')) for ss in self.words]
-        return biglist
+        for objId in xrange(self.count):
+            name = self.names.get(objId)
+            if name is None:
+                # 未修改的词条直接复制原始数据
+                raw = self.store.raw(objId)
+                yield raw + ' ' * (10 - len(raw))
+            else:
+                yield "{:10}".format(name.decode('utf8').encode('big5'))
 
     def write_to_file(self, filename):
         with open(filename, mode='wb') as file:
@@ -430,13 +167,34 @@ class WordData:
 
 class App:
     def __init__(self):
-        self.sss = MKFDecoder(path='./SSS.MKF', data=None)
-        self.arrayH = array.array('H', self.sss.read(2))
-        self.allObjDef = get_chunks(self.arrayH, 6)
-        i = 0
-        self.inventories = [PAL_Inventory(obj, i) for i, obj in enumerate(self.allObjDef[0x3D:0x127])]
-        # self.magics = [PAL_Magic(obj) for obj in self.allObjDef[0x127:0x18E]]
-        # self.monsters = [PAL_Monster(obj) for obj in self.allObjDef[0x18E:0x227]]
+        self.sss = MKFDecoder(path='./SSS.MKF', data=None, disk_cache=DiskChunkCache())
+        # 物件定义表，allObjDef的每一行以及objects.items等都是同一块内存的视图，修改直接写回
+        self.objects = ObjectTable(self.sss.read(2))
+        self.allObjDef = self.objects.raw
+        # 所有道具的标志位一次解成布尔矩阵，批量修改用itemFlags.set/clear/assign
+        self.itemFlags = item_flags(self.objects)
+        properties = self.itemFlags.matrix()
+        self.inventories = [PAL_Inventory(obj, i, properties[i])
+                            for i, obj in enumerate(self.allObjDef[ITEM_RANGE[0]:ITEM_RANGE[1]])]
+        # 道具图像（ball.mkf），启动时一次解出所有图像，没有ball.mkf时为None
+        self.itemImages = None
+        if os.path.exists('./BALL.MKF'):
+            with MKFDecoder(path='./BALL.MKF', use_mmap=True) as ball:
+                self.itemImages = decode_bitmaps(ball)
+        self.palette = None
+        if os.path.exists('./PAT.MKF'):
+            with MKFDecoder(path='./PAT.MKF', use_mmap=True) as pat:
+                self.palette = Palette(pat)
+        # 对话（m.msg），偏移表在SSS.MKF第3个子文件中，对话在用到时才解码
+        self.messages = None
+        if os.path.exists('./M.MSG'):
+            self.messages = MessageStore(self.sss, './M.MSG')
+        # data.mkf中的表（商店、敌人、法术等），都是可以直接修改的结构化数组，没有DATA.MKF时为None
+        self.data = None
+        self.tables = None
+        if os.path.exists('./DATA.MKF'):
+            self.data = MKFDecoder(path='./DATA.MKF')
+            self.tables = DataTables(self.data)
         # self.poisons = [PAL_Poison(obj) for obj in self.allObjDef[0x227:0x235]
 
     def __enter__(self):
@@ -445,12 +203,33 @@ class App:
     def __exit__(self, type, value, trace):
         pass
 
-    def save_inventory(self, filename):
-        # TODO - finish the correct saving procedure
-        newFileByteArray = bytearray(list(chain.from_iterable(self.allObjDef)))
-        newFile = open ("./sss2.bin", "wb")
-        newFile.write(newFileByteArray)
-        newFile.close()
+    def get_item_image(self, imageId):
+        '''
+        返回第imageId个道具图像的 (pixels, opaque)，没有该图像时返回None
+        有pat.mkf时pixels为用0号调色板转换后的RGB，否则为调色板索引
+        '''
+        if self.itemImages is None or imageId >= len(self.itemImages[0]):
+            return None
+        pixels, opaque, sizes = self.itemImages
+        w, h = sizes[imageId]
+        pixels = pixels[imageId, :h, :w]
+        if self.palette is not None:
+            pixels = self.palette.apply(pixels, 0)
+        return pixels, opaque[imageId, :h, :w]
+
+    def save_inventory(self, filename='./SSS.MKF'):
+        # 只替换第2个子文件（物件定义），其余子文件原样复制
+        encoder = MKFEncoder(source=self.sss)
+        encoder.set_chunk(2, self.objects.tostring())
+        encoder.write(filename)
+
+    def save_data(self, filename='./DATA.MKF'):
+        # 只替换修改过的表
+        if self.tables is not None:
+            self.tables.save(filename)
+
+    def object_ids(self, objRange):
+        return range(objRange[0], min(objRange[1], self.objects.getObjectCount()))
 
     def change_object_name(self, objId, name, word_data):
         word_data.set_object_name(objId, name)
@@ -469,8 +248,30 @@ class PALEditorUI(Frame):
         self.app = app_data
         self.word = word_data
         self.currentInventory = None
+        self.photoImages = {}
         self._create_widgets()
 
+    def _get_photo_image(self, imageId):
+        # 没有调色板时按灰度显示调色板索引，透明像素显示为背景色
+        if imageId not in self.photoImages:
+            image = self.app.get_item_image(imageId)
+            if image is None:
+                return None
+            pixels, opaque = image
+            h, w = opaque.shape
+            photo = PhotoImage(width=max(w, 1), height=max(h, 1))
+            if w and h:
+                if pixels.ndim == 2:
+                    pixels = pixels[..., None].repeat(3, axis=2)
+                rows = []
+                for y in xrange(h):
+                    row = ['#%02x%02x%02x' % tuple(c) if o else '#f0f0f0'
+                           for c, o in zip(pixels[y].tolist(), opaque[y].tolist())]
+                    rows.append('{%s}' % ' '.join(row))
+                photo.put(' '.join(rows))
+            self.photoImages[imageId] = photo
+        return self.photoImages[imageId]
+
     def _create_widgets(self):
         mainPanel = Frame(self, name='mainPanel')
         mainPanel.pack(side=TOP, fill=BOTH, expand=Y, pady=(0, 30))
@@ -493,12 +294,33 @@ class PALEditorUI(Frame):
         frame = Frame(nb)
 
         listBoxFrame = Frame(frame, width=130)
+        # 搜索框，按名称过滤道具列表，shownInventories为列表中显示的道具
+        searchVar = StringVar()
+        Entry(listBoxFrame, textvariable=searchVar).pack(side=TOP, fill=X)
         scrollbar = Scrollbar(listBoxFrame)
         scrollbar.pack(side=RIGHT, fill=Y)
         listbox = Listbox(listBoxFrame, name='inventoryList', yscrollcommand=scrollbar.set, selectmode=SINGLE)
-        for inv in self.app.inventories:
+        shownInventories = list(self.app.inventories)
+        for inv in shownInventories:
             listbox.insert(END, self.word.get_object_name(inv.inventoryId))
         listbox.pack(side=LEFT, fill=BOTH)
+
+        def onSearch(*args):
+            query = searchVar.get()
+            if isinstance(query, unicode):
+                query = query.encode('utf8')
+            found = self.word.search(query) if query else None
+            if found is None:
+                shown = list(self.app.inventories)
+            else:
+                found = set(found)
+                shown = [inv for inv in self.app.inventories if inv.inventoryId in found]
+            shownInventories[:] = shown
+            listbox.delete(0, END)
+            for inv in shown:
+                listbox.insert(END, self.word.get_object_name(inv.inventoryId))
+
+        searchVar.trace('w', onSearch)
         scrollbar.config(command=listbox.yview)
         listBoxFrame.pack(side=LEFT, fill=Y)
 
@@ -542,7 +364,7 @@ class PALEditorUI(Frame):
         inventoryImageIdVar = StringVar()
         Entry(objectDataFrame, textvariable=inventoryImageIdVar).grid(row=r+1, column=1)
 
-        labelImage = Label(objectDataFrame, text="HAHA")
+        labelImage = Label(objectDataFrame, text="")
         labelImage.grid(row=r+2, column=0, columnspan=2, rowspan=2, sticky=W+E+N+S, padx=5, pady=5)
 
         def onSaveButtonCallback():
@@ -553,6 +375,9 @@ class PALEditorUI(Frame):
                 if (self.currentInventory.get_price() != newPrice and newPrice <= 0xFFFF and newPrice >= 0):
                     self.currentInventory.set_price(newPrice)
                 newName = inventoryNameVar.get()
+                # Tk返回的是unicode，词条名称为utf8
+                if isinstance(newName, unicode):
+                    newName = newName.encode('utf8')
                 oldName = self.word.get_object_name(self.currentInventory.inventoryId)
                 if (oldName != newName):
                     self.word.set_object_name(self.currentInventory.inventoryId, newName)
@@ -564,15 +389,24 @@ class PALEditorUI(Frame):
 
         def onSelect(ev):
             w = ev.widget
+            if not w.curselection():
+                return
             index = int(w.curselection()[0])
             inventoryNameVar.set(w.get(index))
-            self.currentInventory = self.app.inventories[index]
+            self.currentInventory = shownInventories[index]
             inventoryImageIdVar.set(hex(self.currentInventory.get_image_id()))
+            photo = self._get_photo_image(self.currentInventory.get_image_id())
+            if photo is None:
+                labelImage.configure(image='', text='(no image)')
+            else:
+                labelImage.configure(image=photo, text='')
             inventoryPriceVar.set(self.currentInventory.get_price())
             inventoryUseScriptVar.set(hex(self.currentInventory.get_script_use()))
             inventoryEquipScriptVar.set(hex(self.currentInventory.get_script_equip()))
             inventoryThrowScriptVar.set(hex(self.currentInventory.get_script_throw()))
 
+            # 标志位可能被批量修改过，重新从数据中读取
+            self.currentInventory.init_property()
             for i in xrange(12):
                 inventoryProperties[i].set(self.currentInventory.property[i])
 
@@ -581,68 +415,158 @@ class PALEditorUI(Frame):
         nb.add(frame, text='Inventory', padding=5)
 
     # =============================================================================
-    def _create_tab_magic(self, nb):
-        frame = Frame(nb)
-
-        myframe=Frame(frame, width=130)
-        scrollbar = Scrollbar(myframe)
+    def _create_record_form(self, parent, dtype, row, columns=1):
+        # 每个字段一个输入框，分columns栏排列，返回 (字段列表, StringVar列表, 下一行)
+        fields = record_fields(dtype)
+        variables = []
+        for k, (name, i) in enumerate(fields):
+            text = name if i is None else '%s[%s]' % (name, ','.join(map(str, i)))
+            r, c = row + k // columns, (k % columns) * 2
+            Label(parent, text=text).grid(row=r, column=c, sticky=W)
+            var = StringVar()
+            Entry(parent, textvariable=var, width=8).grid(row=r, column=c + 1, sticky=E)
+            variables.append(var)
+        return fields, variables, row + (len(fields) + columns - 1) // columns
+
+    def _load_record(self, records, n, fields, variables):
+        for field, var in zip(fields, variables):
+            var.set(get_field(records, n, field) if n is not None else '')
+
+    def _store_record(self, records, n, fields, variables):
+        try:
+            values = [int(var.get(), 0) for var in variables]
+        except ValueError:
+            tkMessageBox.showerror("Error", "Please input integers")
+            return
+        for field, value in zip(fields, values):
+            set_field(records, n, field, value & 0xFFFF)
+
+    def _create_object_list(self, parent, objIds):
+        listBoxFrame = Frame(parent, width=130)
+        scrollbar = Scrollbar(listBoxFrame)
         scrollbar.pack(side=RIGHT, fill=Y)
-        listbox = Listbox(myframe, yscrollcommand=scrollbar.set)
-        for line in xrange(100):
-            listbox.insert(END, "This is line number %d" % line)
-        listbox.pack( side = LEFT, fill = BOTH )
+        listbox = Listbox(listBoxFrame, yscrollcommand=scrollbar.set, selectmode=SINGLE)
+        for objId in objIds:
+            listbox.insert(END, self.word.get_object_name(objId))
+        listbox.pack(side=LEFT, fill=BOTH, expand=Y)
         scrollbar.config(command=listbox.yview)
-        myframe.pack(side=LEFT, fill=Y)
+        listBoxFrame.pack(side=LEFT, fill=Y)
+        return listbox
 
+    # =============================================================================
+    def _create_tab_magic(self, nb):
+        frame = Frame(nb)
+        magicIds = self.app.object_ids(MAGIC_RANGE)
+        listbox = self._create_object_list(frame, magicIds)
+
+        objectDataFrame = Frame(frame)
+        Label(objectDataFrame, text="法术信息").grid(row=0, columnspan=2)
+        objectDataFrame.pack(side=LEFT, fill=Y)
         nb.add(frame, text='Magic', padding=5)
+        if self.app.tables is None:
+            Label(objectDataFrame, text="(no DATA.MKF)").grid(row=1, columnspan=2)
+            return
 
+        magics = self.app.tables.magics
+        numberVar = StringVar()
+        Label(objectDataFrame, textvariable=numberVar).grid(row=1, columnspan=2, sticky=W)
+        fields, variables, r = self._create_record_form(objectDataFrame, magics.dtype, 2)
+        current = [None]
+
+        def onSelect(ev):
+            w = ev.widget
+            if not w.curselection():
+                return
+            index = int(w.curselection()[0])
+            # 法术物件的wMagicNumber为data.mkf中MAGIC表的下标
+            n = int(self.app.objects.magics['wMagicNumber'][index])
+            current[0] = n if n < len(magics) else None
+            numberVar.set('wMagicNumber: %#x' % n)
+            self._load_record(magics, current[0], fields, variables)
+
+        def onSaveButtonCallback():
+            if current[0] is None:
+                tkMessageBox.showerror("Error", "Please select the magic you want to change")
+            else:
+                self._store_record(magics, current[0], fields, variables)
+
+        Button(objectDataFrame, text='SAVE!', command=onSaveButtonCallback).grid(row=r, column=0)
+        listbox.bind('<<ListboxSelect>>', onSelect)
 
     # =============================================================================
     def _create_tab_monster(self, nb):
-        # ad hoc all view!
         frame = Frame(nb)
-
-        listBoxFrame = Frame(frame, width=130)
-        scrollbar = Scrollbar(listBoxFrame)
-        scrollbar.pack(side=RIGHT, fill=Y)
-        listbox = Listbox(listBoxFrame, name='inventoryList', yscrollcommand=scrollbar.set, selectmode=SINGLE)
-        for i, obj in enumerate(self.app.allObjDef):
-            listbox.insert(END, self.word.get_object_name(i))
-        listbox.pack(side=LEFT, fill=BOTH)
-        scrollbar.config(command=listbox.yview)
-        listBoxFrame.pack(side=LEFT, fill=Y)
+        enemyIds = self.app.object_ids(ENEMY_RANGE)
+        # shownEnemies为列表中按当前排序显示的敌人物件编号
+        shownEnemies = list(enemyIds)
+        listbox = self._create_object_list(frame, shownEnemies)
 
         objectDataFrame = Frame(frame)
-        Label(objectDataFrame, text="道具信息").grid(row=0, column=0)
-        T = Text(objectDataFrame, height=3, width=30)
-        T.grid(row=1, column=0)
-        # T.insert(0, '')
-
+        Label(objectDataFrame, text="敌人信息").grid(row=0, columnspan=4)
+        T = Text(objectDataFrame, height=2, width=30)
+        T.grid(row=1, columnspan=4)
         objectDataFrame.pack(side=LEFT, fill=Y)
+        nb.add(frame, text='Monster', padding=5)
+        tables = self.app.tables
+        enemies = tables.enemies if tables is not None else None
+
+        if enemies is not None:
+            Label(objectDataFrame, text="排序：").grid(row=2, column=0, sticky=W)
+            sortVar = StringVar()
+            names = [name for name, i in record_fields(enemies.dtype) if i is None]
+            Combobox(objectDataFrame, textvariable=sortVar, values=['object'] + names,
+                     state='readonly', width=18).grid(row=2, column=1, sticky=E)
+            fields, variables, r = self._create_record_form(objectDataFrame, enemies.dtype, 3, columns=2)
+        current = [None]
+
+        def enemyNumbers():
+            start = ENEMY_RANGE[0]
+            return self.app.objects.enemies['wEnemyID'][[i - start for i in enemyIds]]
+
+        def onSort(*args):
+            # 整列比较排序，越界的敌人编号排在最后
+            field = sortVar.get()
+            if field == 'object':
+                order = range(len(enemyIds))
+            else:
+                records, valid = lookup(enemies, enemyNumbers())
+                keys = records[field].astype(np.int64)
+                keys[~valid] = 1 << 32
+                order = np.argsort(keys, kind='mergesort').tolist()
+            shownEnemies[:] = [enemyIds[i] for i in order]
+            listbox.delete(0, END)
+            for objId in shownEnemies:
+                listbox.insert(END, self.word.get_object_name(objId))
 
         def onSelect(ev):
             w = ev.widget
-            index = int(w.curselection()[0])
+            if not w.curselection():
+                return
+            objId = shownEnemies[int(w.curselection()[0])]
             T.delete('1.0', END)
-            T.insert('1.0', ["{0:#0{1}x}".format(i,6) for i in self.app.allObjDef[index]])
-            # inventoryNameVar.set(w.get(index))
-            # self.currentInventory = self.app.inventories[index]
-            # inventoryImageIdVar.set(hex(self.currentInventory.get_image_id()))
-            # inventoryPriceVar.set(self.currentInventory.get_price())
-            # inventoryUseScriptVar.set(hex(self.currentInventory.get_script_use()))
-            # inventoryEquipScriptVar.set(hex(self.currentInventory.get_script_equip()))
-            # inventoryThrowScriptVar.set(hex(self.currentInventory.get_script_throw()))
-            #
-            # for i in xrange(12):
-            #     inventoryProperties[i].set(self.currentInventory.property[i])
+            T.insert('1.0', ' '.join("{0:#0{1}x}".format(i, 6) for i in self.app.allObjDef[objId]))
+            if enemies is None:
+                return
+            # 敌人物件的wEnemyID为data.mkf中ENEMY表的下标
+            n = int(self.app.objects.enemies['wEnemyID'][objId - ENEMY_RANGE[0]])
+            current[0] = n if n < len(enemies) else None
+            self._load_record(enemies, current[0], fields, variables)
 
-        listbox.bind('<<ListboxSelect>>', onSelect)
+        def onSaveButtonCallback():
+            if current[0] is None:
+                tkMessageBox.showerror("Error", "Please select the monster you want to change")
+            else:
+                self._store_record(enemies, current[0], fields, variables)
 
-        nb.add(frame, text='Monster', padding=5)
+        if enemies is not None:
+            sortVar.trace('w', onSort)
+            Button(objectDataFrame, text='SAVE!', command=onSaveButtonCallback).grid(row=r, column=0)
+        listbox.bind('<<ListboxSelect>>', onSelect)
 
 
 if __name__ == '__main__':
     with WordData() as word, App() as app:
+        word.index = open_index(word.store, app.messages, './SSS.MKF' if app.messages else None)
         PALEditorUI(app, word).mainloop()
     # with window("This is a window"):
     #     label(word.get_object_name(objId=app.inventories[2].inventoryId), font = "Verdana 24 bold underline")
@@ -0,0 +1,409 @@
+# coding=utf-8
+"""
+用蒙特卡洛方法估计队伍打一组敌人（ENEMYTEAM）的结果：回合数、受到的伤害、每分钟得到的经验和金钱
+
+伤害公式与fight.c一致：
+    我方普通攻击    PAL_CalcPhysicalAttackDamage + 会心一击、全体攻击（装备效果中的rgwAttackAll）的伤害递减
+    敌人普通攻击    PAL_CalcPhysicalAttackDamage(str, def, 2)，有7/17的几率被自动防御
+    敌人法术        PAL_CalcMagicDamage，按法术的wType攻击一人或全体，各成员有1/3的几率自动防御
+    行动顺序        每回合按身法（乘以0.9~1.1的随机数）排序，wDualMove的敌人可能行动两次
+我方只使用普通攻击并自动选择目标，不使用法术和道具；不模拟异常状态、毒、偷窃、敌人的回合脚本和逃跑
+
+每次模拟是一行，所有trials次战斗作为numpy数组同时进行，已经结束的战斗会被移出数组；
+为了能一次处理所有行，一个回合内的行动顺序由所有战斗共用（每回合重新随机）
+
+用法：python battle.py [-d 数据目录] [-s 存档] [-t 队伍编号] [-n 次数] [--field 战场] [--hp 0.5]
+                      [--round 每回合秒数] [-j 进程数] [-o 结果.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from gamedata import *
+from datatables import DataTables, lookup
+from script import load_scripts
+from simulate import ScriptRunner, load_state, set_hp_mp
+
+MAX_ROUNDS = 100
+
+# MAGIC.wType
+kMagicTypeNormal = 0
+
+# 全体攻击时依次攻击的敌人位置（fight.c中的index），伤害依次除以1、2、3
+ATTACK_ALL_ORDER = (2, 1, 0, 4, 3)
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def base_damage(attack, defense):
+    '''
+    PAL_CalcBaseDamage，attack/defense为数组
+    '''
+    a = np.asarray(attack, dtype=np.float64)
+    d = np.asarray(defense, dtype=np.float64)
+    damage = np.where(a > d, a * 2 - d * 1.6 + 0.5, np.where(a > d * 0.6, a - d * 0.6 + 0.5, 0))
+    return np.trunc(damage).astype(np.int64)
+
+
+def physical_damage(attack, defense, resistance):
+    '''
+    PAL_CalcPhysicalAttackDamage
+    '''
+    damage = base_damage(attack, defense)
+    resistance = np.asarray(resistance, dtype=np.int64)
+    return np.where(resistance != 0, _cdiv(damage, np.maximum(resistance, 1)), damage)
+
+
+def _cdiv(a, b):
+    '''
+    C语言的整数除法（向0取整）
+    '''
+    return np.fix(np.true_divide(a, b)).astype(np.int64)
+
+
+def _role_records(words):
+    '''
+    把按WORD展开的PLAYERROLES（GameState.roles/effects）转换成结构化记录
+    '''
+    return np.frombuffer(np.array(words, dtype='<u2').tostring(), dtype=PLAYERROLES_DTYPE)[0]
+
+
+class Party:
+    """
+    队伍成员的战斗属性，每个属性是按队伍位置排列的数组，攻击、防御、身法和抗性与PAL_GetPlayer*一样计入所有装备效果，
+    attackAll与PAL_PlayerCanAttackAll一样只由装备效果决定
+    elementalResistance/poisonResistance是已经换算成 5 + 抗性 / 20 的值（PAL_CalcMagicDamage使用的值）
+    """
+
+    def __init__(self, state):
+        records = [_role_records(state.roles)] + [_role_records(effect) for effect in state.effects]
+        self.roles = np.array(state.party, dtype=np.intp)
+        roles = records[0]
+
+        def total(name):
+            value = sum(r[name].astype(np.int64) for r in records) & 0xFFFF
+            return value[..., self.roles]
+
+        self.hp = roles['rgwHP'][self.roles].astype(np.int64)
+        self.maxHP = roles['rgwMaxHP'][self.roles].astype(np.int64)
+        # PAL_PlayerCanAttackAll只检查各部位的装备效果，不看角色本身的rgwAttackAll
+        self.attackAll = np.any([r['rgwAttackAll'][self.roles] != 0 for r in records[1:]], axis=0)
+        self.attackStrength = total('rgwAttackStrength')
+        self.defense = total('rgwDefense')
+        self.dexterity = total('rgwDexterity')
+        self.elementalResistance = 5 + np.minimum(total('rgwElementalResistance'), 100).T // 20
+        self.poisonResistance = 5 + np.minimum(total('rgwPoisonResistance'), 100) // 20
+
+    def __len__(self):
+        return len(self.roles)
+
+
+class EnemyTeam:
+    """
+    ENEMYTEAM中的一组敌人，与PAL_LoadBattle一样0xFFFF以后的位置和为0的位置没有敌人
+    enemies为每个位置的ENEMY记录（复制，没有敌人的位置为0），magics为各敌人法术的MAGIC记录
+    objects为物件表（GameState.objects），用于把物件编号换算成ENEMY/MAGIC的编号
+    """
+
+    def __init__(self, tables, objects, team):
+        self.team = team
+        ids = [int(w) for w in tables.enemyTeams['rgwEnemy'][team]]
+        if 0xFFFF in ids:
+            ids[ids.index(0xFFFF):] = [0] * (len(ids) - ids.index(0xFFFF))
+        self.objectIDs = ids
+        self.present = np.array([w != 0 and w < len(objects) for w in ids])
+        enemyIDs = [objects[w][0] if present else -1 for w, present in zip(ids, self.present)]
+        self.enemies, valid = lookup(tables.enemies, enemyIDs)
+        self.present &= valid
+
+        e = self.enemies
+        level = e['wLevel'].astype(np.int64)
+        self.health = np.where(self.present, e['wHealth'], 0).astype(np.int64)
+        self.exp = int(e['wExp'][self.present].sum())
+        self.cash = int(e['wCash'][self.present].sum())
+        self.defense = e['wDefense'] + (level + 6) * 4
+        self.dexterity = (level + 6) * 3 + e['wDexterity'].astype(np.int16)
+        self.attackStrength = np.maximum(e['wAttackStrength'].astype(np.int16) + (level + 6) * 6, 0)
+        self.magicStrength = np.maximum(e['wMagicStrength'].astype(np.int16) + (level + 6) * 6, 0)
+        self.magic = e['wMagic'].astype(np.int64)
+        magicIDs = [objects[w][0] if 0 < w < len(objects) else -1 for w in self.magic]
+        self.magics, valid = lookup(tables.magics, magicIDs)
+        # 法术为0xFFFF时什么也不做，wBaseDamage不大于0的法术不造成伤害（只有脚本的效果，不模拟）
+        self.magicDamages = valid & (self.magics['wBaseDamage'].astype(np.int16) > 0)
+
+    def __len__(self):
+        return int(self.present.sum())
+
+
+class BattleSimulator:
+    """
+    trials次party对team的战斗，run返回每次战斗的结果：
+        rounds  结束时的回合数（超过maxRounds没有结束的为maxRounds）
+        won     是否打败了所有敌人
+        lost    是否全员阵亡
+        damage  我方受到的总伤害（HP的减少量）
+    """
+
+    def __init__(self, party, team, field=None, rng=None):
+        self.party = party
+        self.team = team
+        self.rng = rng or np.random.RandomState()
+        self.fieldEffect = np.zeros(NUM_MAGIC_ELEMENTAL, dtype=np.int64) if field is None \
+            else field['rgsMagicEffect'].astype(np.int64)
+        # 普通攻击中不随机的部分：我方[成员, 敌人]，敌人[敌人, 成员, RandomLong(0, 2)]
+        self.playerDamage = physical_damage(party.attackStrength[:, None], team.defense[None, :],
+                                            team.enemies['wPhysicalResistance'][None, :])
+        self.enemyDamage = physical_damage(team.attackStrength[:, None, None] + np.arange(3)[None, None, :],
+                                           party.defense[None, :, None], 2)
+
+    def run(self, trials, maxRounds=MAX_ROUNDS):
+        party, team, rng = self.party, self.team, self.rng
+        result = {
+            'rounds': np.full(trials, maxRounds, dtype=np.int64),
+            'won': np.zeros(trials, dtype=bool),
+            'lost': np.zeros(trials, dtype=bool),
+            'damage': np.zeros(trials, dtype=np.int64),
+        }
+        # 进行中的战斗：rows为对应的战斗编号
+        rows = np.arange(trials)
+        enemyHP = np.tile(team.health, (trials, 1))
+        playerHP = np.tile(party.hp, (trials, 1))
+        target = np.zeros(trials, dtype=np.intp)
+
+        actors = [(False, i, party.dexterity[i]) for i in xrange(len(party))] + \
+                 [(True, i, team.dexterity[i]) for i in np.flatnonzero(team.present)]
+        dualMove = team.enemies['wDualMove'].astype(np.int64) * 50
+        turn = 0
+        while True:
+            finished = self._finish(result, rows, enemyHP, playerHP, turn)
+            if finished.any():
+                keep = ~finished
+                rows, enemyHP, playerHP, target = rows[keep], enemyHP[keep], playerHP[keep], target[keep]
+            if not len(rows) or turn == maxRounds:
+                break
+            turn += 1
+            count = len(rows)
+            # wDualMove * 50 + RandomLong(0, 100) > 100 时再行动一次
+            second = rng.randint(0, 101, (count, MAX_ENEMIES_IN_TEAM)) + dualMove > 100
+            queue = actors + [(True, i, team.dexterity[i]) for i in np.flatnonzero(team.present & (dualMove > 0))]
+            keys = np.array([dex for enemy, i, dex in queue], dtype=np.float64) * rng.uniform(0.9, 1.1, len(queue))
+            for n in np.argsort(-keys, kind='mergesort'):
+                enemy, i, dex = queue[n]
+                if enemy:
+                    acting = (enemyHP[:, i] > 0) & (playerHP > 0).any(1)
+                    if n >= len(actors):
+                        acting &= second[:, i]
+                    self._enemy_act(i, acting, enemyHP, playerHP)
+                else:
+                    acting = (playerHP[:, i] > 0) & (enemyHP > 0).any(1)
+                    self._player_act(i, acting, enemyHP, target)
+        result['damage'][rows] = (party.hp - playerHP).sum(1)
+        return result
+
+    def _finish(self, result, rows, enemyHP, playerHP, turn):
+        '''
+        记录已经结束的战斗，返回结束的行
+        '''
+        won = ~(enemyHP > 0).any(1)
+        lost = ~(playerHP > 0).any(1) & ~won
+        finished = won | lost
+        ids = rows[finished]
+        result['rounds'][ids] = turn
+        result['won'][rows[won]] = True
+        result['lost'][rows[lost]] = True
+        result['damage'][ids] = (self.party.hp - playerHP[finished]).sum(1)
+        return finished
+
+    def _player_act(self, player, acting, enemyHP, target):
+        '''
+        我方普通攻击
+        '''
+        rng = self.rng
+        count = len(acting)
+        if self.party.attackAll[player]:
+            critical = rng.randint(0, 6, count) == 0
+            division = np.ones(count, dtype=np.int64)
+            for i in ATTACK_ALL_ORDER:
+                hit = acting & (enemyHP[:, i] > 0)
+                damage = self.playerDamage[player, i] + rng.randint(1, 3, count)
+                damage = _cdiv(np.where(critical, damage * 3, damage), division)
+                damage = np.maximum(np.trunc(damage * rng.uniform(1, 1.125, count)).astype(np.int64), 1)
+                enemyHP[:, i] -= np.where(hit, damage, 0)
+                division = np.minimum(division + hit, 3)
+            return
+        # PAL_BattleSelectAutoTarget：上次的目标还活着就继续攻击，否则攻击第一个活着的敌人
+        alive = enemyHP > 0
+        index = np.arange(count)
+        target[:] = np.where(alive[index, target], target, alive.argmax(1))
+        damage = self.playerDamage[player][target] + rng.randint(1, 3, count)
+        damage = np.where(rng.randint(0, 6, count) == 0, damage * 3, damage)
+        if self.party.roles[player] == 0:
+            damage = np.where(rng.randint(0, 12, count) == 0, damage * 2, damage)
+        damage = np.maximum(np.trunc(damage * rng.uniform(1, 1.125, count)).astype(np.int64), 1)
+        enemyHP[index, target] -= np.where(acting, damage, 0)
+
+    def _enemy_act(self, enemy, acting, enemyHP, playerHP):
+        '''
+        敌人的行动：按wMagicRate使用法术，否则普通攻击一个随机的活着的成员
+        '''
+        team, party, rng = self.team, self.party, self.rng
+        count = len(acting)
+        index = np.arange(count)
+        alive = playerHP > 0
+        target = (rng.random_sample(playerHP.shape) * alive).argmax(1)
+        magic = team.magic[enemy]
+        casting = np.zeros(count, dtype=bool)
+        if magic != 0:
+            casting = acting & (rng.randint(0, 10, count) < team.enemies['wMagicRate'][enemy])
+            if casting.any() and team.magicDamages[enemy]:
+                self._enemy_magic(enemy, casting, target, playerHP)
+
+        attacking = acting & ~casting
+        damage = self.enemyDamage[enemy, target, rng.randint(0, 3, count)] + rng.randint(0, 2, count)
+        hp = playerHP[index, target]
+        damage = np.maximum(np.minimum(damage, hp), 1)
+        defended = rng.randint(0, 17, count) >= 10
+        playerHP[index, target] -= np.where(attacking & ~defended, damage, 0)
+
+    def _enemy_magic(self, enemy, casting, target, playerHP):
+        '''
+        PAL_CalcMagicDamage
+        '''
+        team, party, rng = self.team, self.party, self.rng
+        count = len(casting)
+        record = team.magics[enemy]
+        strength = (np.trunc(team.magicStrength[enemy] * rng.uniform(10, 11, count)).astype(np.int64) & 0xFFFF) // 10
+        damage = base_damage(strength[:, None], party.defense[None, :]) // 4
+        damage += int(record['wBaseDamage'])
+        elem = int(record['wElemental'])
+        if elem != 0:
+            if elem > NUM_MAGIC_ELEMENTAL:
+                damage = _cdiv(damage * (10 - party.poisonResistance), 5)
+            else:
+                damage = _cdiv(damage * (10 - party.elementalResistance[:, elem - 1]), 5)
+                damage = _cdiv(damage * (10 + self.fieldEffect[elem - 1]), 10)
+        damage = _cdiv(damage, 1 + (rng.randint(0, 3, damage.shape) == 0))
+        damage = np.clip(damage, 0, playerHP)
+        hit = casting[:, None] & (playerHP > 0)
+        if record['wType'] == kMagicTypeNormal:
+            hit &= np.arange(len(party))[None, :] == target[:, None]
+        playerHP -= np.where(hit, damage, 0)
+
+
+def _stats(values):
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'mean': float(values.mean()), 'min': float(values.min()), 'max': float(values.max()),
+        'percentiles': dict((str(p), float(v)) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))),
+    }
+
+
+def summarize(team, result, roundSeconds):
+    '''
+    把BattleSimulator.run的结果汇总成可以转换成json的字典，
+    每分钟的经验和金钱按每回合roundSeconds秒计算，输掉或没有结束的战斗没有收获
+    '''
+    trials = len(result['rounds'])
+    minutes = np.maximum(result['rounds'], 1) * roundSeconds / 60.0
+    won = result['won']
+    return {
+        'team': team.team,
+        'enemies': team.objectIDs,
+        'trials': trials,
+        'won': float(won.mean()),
+        'lost': float(result['lost'].mean()),
+        'unfinished': float((~won & ~result['lost']).mean()),
+        'rounds': _stats(result['rounds']),
+        'damage': _stats(result['damage']),
+        'exp': team.exp,
+        'cash': team.cash,
+        'expPerMinute': _stats(won * team.exp / minutes),
+        'cashPerMinute': _stats(won * team.cash / minutes),
+    }
+
+
+def estimate_team(party, tables, objects, team, trials=5000, field=None, maxRounds=MAX_ROUNDS,
+                  roundSeconds=4.0, seed=0):
+    '''
+    模拟party对第team组敌人的trials次战斗，返回summarize的结果；没有敌人的组返回None
+    '''
+    enemies = EnemyTeam(tables, objects, team)
+    if not len(enemies):
+        return None
+    battleField = tables.battleFields[field] if field is not None and field < len(tables.battleFields) else None
+    simulator = BattleSimulator(party, enemies, battleField, np.random.RandomState(seed))
+    return summarize(enemies, simulator.run(trials, maxRounds), roundSeconds)
+
+
+_worker = {}
+
+
+def _init_worker(directory, save_path, hp_ratio):
+    from mkf_unpack import MKFDecoder
+    with MKFDecoder(path=os.path.join(directory, 'SSS.MKF')) as sss:
+        with MKFDecoder(path=os.path.join(directory, 'DATA.MKF')) as data:
+            runner = ScriptRunner(load_scripts(sss))
+            state = load_state(runner, sss, data, save_path)
+            tables = DataTables(data)
+    if hp_ratio is not None:
+        set_hp_mp(state, hp_ratio)
+    _worker['party'] = Party(state)
+    _worker['tables'] = tables
+    _worker['objects'] = state.objects
+
+
+def _estimate_worker(task):
+    team, trials, field, maxRounds, roundSeconds, seed = task
+    return estimate_team(_worker['party'], _worker['tables'], _worker['objects'], team,
+                         trials, field, maxRounds, roundSeconds, seed)
+
+
+def estimate_teams(directory='.', save_path=None, teams=None, trials=5000, field=None, hp_ratio=None,
+                   maxRounds=MAX_ROUNDS, roundSeconds=4.0, seed=0, jobs=1):
+    '''
+    对teams中的每组敌人（默认为整个ENEMYTEAM表）估计战斗结果，返回按队伍编号排序的结果列表，
+    跳过没有敌人的组；每组的随机数种子由seed和队伍编号决定，结果与进程数无关
+    '''
+    args = (directory, save_path, hp_ratio)
+    _init_worker(*args)
+    if teams is None:
+        teams = range(len(_worker['tables'].enemyTeams))
+    tasks = [(team, trials, field, maxRounds, roundSeconds, (seed << 16) | team) for team in teams]
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, args)
+        try:
+            results = pool.map(_estimate_worker, tasks, chunksize=max(1, len(tasks) // (jobs * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_estimate_worker, tasks)
+    return sorted((r for r in results if r is not None), key=lambda r: r['team'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='estimate battle outcomes against enemy teams by Monte Carlo simulation')
+    parser.add_argument('-d', '--dir', default='.', help='directory of SSS.MKF and DATA.MKF')
+    parser.add_argument('-s', '--save', help='take the party from this .rpg instead of a new game')
+    parser.add_argument('-t', '--team', type=lambda s: int(s, 0), action='append', help='enemy team to test (default: all)')
+    parser.add_argument('-n', '--trials', type=int, default=5000, help='battles per team')
+    parser.add_argument('--field', type=int, help='battle field for the elemental modifiers')
+    parser.add_argument('--hp', type=float, help='set the party HP/MP to this fraction of the maximum first')
+    parser.add_argument('--rounds', type=int, default=MAX_ROUNDS, help='give up a battle after this many rounds')
+    parser.add_argument('--round', type=float, default=4.0, help='seconds per round for the per-minute rates')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-o', '--output', help='write the results as json to this file')
+    args = parser.parse_args()
+
+    results = estimate_teams(args.dir, args.save, args.team, args.trials, args.field, args.hp,
+                             args.rounds, args.round, args.seed, args.jobs)
+    text = json.dumps(results, indent=1, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print text
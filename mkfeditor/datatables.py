@@ -0,0 +1,123 @@
+# coding=utf-8
+"""
+DATA.MKF中的表，与global.c中PAL_ReadGlobalGameData/PAL_LoadDefaultGame读取的子文件一致：
+    0 STORE             1 ENEMY             2 ENEMYTEAM         3 PLAYERROLES
+    4 MAGIC             5 BATTLEFIELD       6 LEVELUPMAGIC_ALL  11 rgwBattleEffectIndex
+    13 ENEMYPOS         14 rgLevelUpExp
+
+与objects.ObjectTable一样，每个表放在一个bytearray中，records是它的结构化数组视图，修改直接写回，
+DataTables.save只重新写入内容改变了的子文件
+记录数不固定的表与PAL_DOALLOCATE一样由子文件大小决定
+"""
+import numpy as np
+
+from gamedata import *
+from mkf_pack import MKFEncoder
+
+# (属性名, 子文件编号, dtype, 记录数)，记录数为None时由子文件大小决定
+TABLES = [
+    ('stores', 0, STORE_DTYPE, None),
+    ('enemies', 1, ENEMY_DTYPE, None),
+    ('enemyTeams', 2, ENEMYTEAM_DTYPE, None),
+    ('playerRoles', 3, PLAYERROLES_DTYPE, 1),
+    ('magics', 4, MAGIC_DTYPE, None),
+    ('battleFields', 5, BATTLEFIELD_DTYPE, None),
+    ('levelUpMagics', 6, LEVELUPMAGIC_ALL_DTYPE, None),
+    ('battleEffectIndex', 11, BATTLEEFFECTINDEX_DTYPE, 10),
+    ('enemyPos', 13, ENEMYPOS_DTYPE, 1),
+    ('levelUpExp', 14, LEVELUPEXP_DTYPE, MAX_LEVELS + 1),
+]
+
+
+class DataTable:
+    """
+    一个子文件对应的表，records为结构化数组（不复制）
+    固定大小的表子文件比结构短时补0，比结构长时多出的部分原样保留
+    """
+
+    def __init__(self, data, dtype, count=None):
+        size = dtype.itemsize
+        if count is None:
+            count = len(data) // size
+        self.buffer = bytearray(data)
+        if len(self.buffer) < count * size:
+            self.buffer.extend('\0' * (count * size - len(self.buffer)))
+        # 补0以后的内容，没有修改时不写回
+        self.original = str(self.buffer)
+        self.records = np.frombuffer(self.buffer, dtype=dtype, count=count)
+
+    def getRecordCount(self):
+        return len(self.records)
+
+    def changed(self):
+        return str(self.buffer) != self.original
+
+    def tostring(self):
+        return str(self.buffer)
+
+
+class DataTables:
+    """
+    DATA.MKF中所有的表，每个表的records可以通过TABLES中的属性名访问，例如tables.enemies['wHealth']
+    """
+
+    def __init__(self, data):
+        self.source = data
+        self.tables = {}
+        for name, index, dtype, count in TABLES:
+            chunk = data.read(index) if index < data.getFileCount() else ''
+            table = self.tables[name] = DataTable(chunk, dtype, count)
+            setattr(self, name, table.records)
+
+    def changed(self):
+        return [name for name, index, dtype, count in TABLES if self.tables[name].changed()]
+
+    def save(self, filename):
+        '''
+        只替换修改过的子文件，其余子文件原样复制
+        '''
+        encoder = MKFEncoder(source=self.source)
+        for name, index, dtype, count in TABLES:
+            table = self.tables[name]
+            if table.changed():
+                encoder.set_chunk(index, table.tostring())
+        encoder.write(filename)
+
+
+def lookup(records, ids):
+    '''
+    按编号数组（例如objects.enemies['wEnemyID']）取出对应的记录，返回 (记录, 编号是否有效)
+    记录是复制的，编号超出范围的位置为0，修改时请用 records[field][ids] = ...
+    '''
+    ids = np.asarray(ids, dtype=np.intp)
+    valid = (ids >= 0) & (ids < len(records))
+    result = np.zeros(len(ids), dtype=records.dtype)
+    result[valid] = records[ids[valid]]
+    return result, valid
+
+
+def record_fields(dtype):
+    '''
+    把dtype展开成标量字段的列表 [(字段名, 子数组下标或None)]，用于逐个编辑
+    '''
+    fields = []
+    for name in dtype.names:
+        sub = dtype.fields[name][0]
+        if sub.shape:
+            fields.extend((name, i) for i in np.ndindex(*sub.shape))
+        else:
+            fields.append((name, None))
+    return fields
+
+
+def get_field(records, n, field):
+    name, i = field
+    return records[name][n] if i is None else records[name][n][i]
+
+
+def set_field(records, n, field, value):
+    name, i = field
+    if i is None:
+        records[name][n] = value
+    else:
+        records[name][n][i] = value
@@ -0,0 +1,131 @@
+# coding=utf-8
+"""
+fbp.mkf战斗背景导出
+
+fbp.mkf的每个子文件是YJ_1压缩的320 * 200调色板索引图像（见battle.c中的
+PAL_MKFDecompressChunk(buf, 320 * 200, ..., fpFBP)和PAL_FBPBlitToSurface），
+这里把它们导出为8位调色板PNG
+
+用法：python fbp_export.py FBP.MKF PAT.MKF -o fbp_png [-p 调色板] [--night] [-j 进程数]
+
+导出目录下的manifest.json记录每个子文件压缩数据的sha1（以及所用调色板的编号和pat.mkf中
+该调色板的原始数据），再次导出时压缩数据和调色板都没有变化、PNG也还在的子文件会被跳过
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from mkf_unpack import MKFDecoder, YJ1TableDecoder
+from palette import Palette
+from pngwriter import write_indexed_png
+
+FBP_WIDTH = 320
+FBP_HEIGHT = 200
+
+
+def decode_fbp(mkf, index):
+    '''
+    返回第index个战斗背景，形状为 (200, 320) 的uint8数组，数据不足时补0
+    '''
+    data = mkf.decompress(index)
+    size = FBP_WIDTH * FBP_HEIGHT
+    if len(data) < size:
+        data += '\x00' * (size - len(data))
+    return np.frombuffer(data, dtype=np.uint8, count=size).reshape(FBP_HEIGHT, FBP_WIDTH)
+
+
+def png_name(index):
+    return 'fbp_%03d.png' % index
+
+
+# 每个worker进程各自打开fbp.mkf和pat.mkf，主进程只传递子文件编号
+_worker = {}
+
+def _init_worker(fbp_path, pat_path, palette_id, night, outdir):
+    _worker['fbp'] = MKFDecoder(path=fbp_path, use_mmap=True)
+    with MKFDecoder(path=pat_path, use_mmap=True) as pat:
+        _worker['palette'] = Palette(pat).get(palette_id, night)
+    _worker['outdir'] = outdir
+
+def _export_worker(index):
+    pixels = decode_fbp(_worker['fbp'], index)
+    path = os.path.join(_worker['outdir'], png_name(index))
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        # 解压结果直接作为调色板索引写入PNG
+        write_indexed_png(f, pixels, FBP_WIDTH, FBP_HEIGHT, _worker['palette'])
+    os.rename(tmp, path)
+    return index
+
+
+def palette_digest(pat_path, palette_id):
+    '''
+    pat.mkf中第palette_id个调色板原始数据的sha1，调色板被修改后已导出的PNG也要重新生成
+    '''
+    with MKFDecoder(path=pat_path, use_mmap=True) as pat:
+        return hashlib.sha1(pat.read_raw(palette_id)).hexdigest()
+
+
+def chunk_key(fbp, index, palette_id, night, pal_digest):
+    h = hashlib.sha1('%s:%d:%d:%s:' % (YJ1TableDecoder.VERSION, palette_id, night, pal_digest))
+    h.update(fbp.read_raw(index))
+    return h.hexdigest()
+
+
+def export_fbp(fbp_path, pat_path, outdir, palette_id=0, night=False, jobs=1, force=False):
+    '''
+    把fbp.mkf中的所有背景导出为outdir/fbp_NNN.png，返回实际导出的子文件编号列表
+    '''
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    manifest_path = os.path.join(outdir, 'manifest.json')
+    manifest = {}
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    pal_digest = palette_digest(pat_path, palette_id)
+    with MKFDecoder(path=fbp_path, use_mmap=True) as fbp:
+        keys = {}
+        todo = []
+        for index in xrange(fbp.getFileCount()):
+            if fbp.getChunkSize(index) == 0:
+                continue
+            keys[str(index)] = key = chunk_key(fbp, index, palette_id, night, pal_digest)
+            if manifest.get(str(index)) != key or not os.path.exists(os.path.join(outdir, png_name(index))):
+                todo.append(index)
+
+    args = (fbp_path, pat_path, palette_id, night, outdir)
+    if jobs > 1 and len(todo) > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, args)
+        try:
+            done = pool.map(_export_worker, todo, chunksize=max(1, len(todo) // (jobs * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(*args)
+        done = [_export_worker(index) for index in todo]
+        _worker['fbp'].close()
+
+    with open(manifest_path, 'w') as f:
+        json.dump(keys, f, indent=1, sort_keys=True)
+    return done
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='export fbp.mkf battle backgrounds to PNG')
+    parser.add_argument('fbp', help='path of FBP.MKF')
+    parser.add_argument('pat', help='path of PAT.MKF')
+    parser.add_argument('-o', '--outdir', default='./fbp')
+    parser.add_argument('-p', '--palette', type=int, default=0, help='palette number in PAT.MKF')
+    parser.add_argument('--night', action='store_true', help='use the night palette')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-f', '--force', action='store_true', help='export every chunk again')
+    args = parser.parse_args()
+    done = export_fbp(args.fbp, args.pat, args.outdir, args.palette, args.night, args.jobs, args.force)
+    print 'exported %d backgrounds' % len(done)
@@ -0,0 +1,217 @@
+# coding=utf-8
+"""
+global.h中游戏数据结构对应的numpy dtype（小端，字段名与C代码相同），
+存档和data.mkf中的表都用这些dtype直接映射，不逐个字段解析
+"""
+import numpy as np
+
+MAX_PLAYERS_IN_PARTY = 4
+MAX_PLAYER_ROLES = 6
+MAX_PLAYABLE_PLAYER_ROLES = 5
+MAX_INVENTORY = 256
+MAX_STORE_ITEM = 9
+NUM_MAGIC_ELEMENTAL = 5
+MAX_ENEMIES_IN_TEAM = 5
+MAX_PLAYER_EQUIPMENTS = 6
+MAX_PLAYER_MAGICS = 32
+MAX_SCENES = 300
+MAX_OBJECTS = 600
+MAX_EVENT_OBJECTS = 5500
+MAX_POISONS = 16
+MAX_LEVELS = 99
+
+WORD = '<u2'
+SHORT = '<i2'
+DWORD = '<u4'
+
+EVENTOBJECT_DTYPE = np.dtype([
+    ('sVanishTime', SHORT),
+    ('x', WORD),
+    ('y', WORD),
+    ('sLayer', SHORT),
+    ('wTriggerScript', WORD),
+    ('wAutoScript', WORD),
+    ('sState', SHORT),
+    ('wTriggerMode', WORD),
+    ('wSpriteNum', WORD),
+    ('nSpriteFrames', WORD),
+    ('wDirection', WORD),
+    ('wCurrentFrameNum', WORD),
+    ('nScriptIdleFrame', WORD),
+    ('wSpritePtrOffset', WORD),
+    ('nSpriteFramesAuto', WORD),
+    ('wScriptIdleFrameCountAuto', WORD),
+])
+
+SCENE_DTYPE = np.dtype([
+    ('wMapNum', WORD),
+    ('wScriptOnEnter', WORD),
+    ('wScriptOnTeleport', WORD),
+    ('wEventObjectIndex', WORD),
+])
+
+# OBJECT为6个WORD的union，按类别的解释见objects.py
+OBJECT_DTYPE = np.dtype((WORD, 6))
+
+INVENTORY_DTYPE = np.dtype([
+    ('wItem', WORD),
+    ('nAmount', WORD),
+    ('nAmountInUse', WORD),
+])
+
+PLAYERS = (WORD, MAX_PLAYER_ROLES)
+
+PLAYERROLES_DTYPE = np.dtype([
+    ('rgwAvatar', PLAYERS),
+    ('rgwSpriteNumInBattle', PLAYERS),
+    ('rgwSpriteNum', PLAYERS),
+    ('rgwName', PLAYERS),
+    ('rgwAttackAll', PLAYERS),
+    ('rgwUnknown1', PLAYERS),
+    ('rgwLevel', PLAYERS),
+    ('rgwMaxHP', PLAYERS),
+    ('rgwMaxMP', PLAYERS),
+    ('rgwHP', PLAYERS),
+    ('rgwMP', PLAYERS),
+    ('rgwEquipment', (WORD, (MAX_PLAYER_EQUIPMENTS, MAX_PLAYER_ROLES))),
+    ('rgwAttackStrength', PLAYERS),
+    ('rgwMagicStrength', PLAYERS),
+    ('rgwDefense', PLAYERS),
+    ('rgwDexterity', PLAYERS),
+    ('rgwFleeRate', PLAYERS),
+    ('rgwPoisonResistance', PLAYERS),
+    ('rgwElementalResistance', (WORD, (NUM_MAGIC_ELEMENTAL, MAX_PLAYER_ROLES))),
+    ('rgwUnknown2', PLAYERS),
+    ('rgwUnknown3', PLAYERS),
+    ('rgwUnknown4', PLAYERS),
+    ('rgwCoveredBy', PLAYERS),
+    ('rgwMagic', (WORD, (MAX_PLAYER_MAGICS, MAX_PLAYER_ROLES))),
+    ('rgwWalkFrames', PLAYERS),
+    ('rgwCooperativeMagic', PLAYERS),
+    ('rgwUnknown5', PLAYERS),
+    ('rgwUnknown6', PLAYERS),
+    ('rgwDeathSound', PLAYERS),
+    ('rgwAttackSound', PLAYERS),
+    ('rgwWeaponSound', PLAYERS),
+    ('rgwCriticalSound', PLAYERS),
+    ('rgwMagicSound', PLAYERS),
+    ('rgwCoverSound', PLAYERS),
+    ('rgwDyingSound', PLAYERS),
+])
+
+PARTY_DTYPE = np.dtype([
+    ('wPlayerRole', WORD),
+    ('x', SHORT),
+    ('y', SHORT),
+    ('wFrame', WORD),
+    ('wImageOffset', WORD),
+])
+
+TRAIL_DTYPE = np.dtype([
+    ('x', WORD),
+    ('y', WORD),
+    ('wDirection', WORD),
+])
+
+EXPERIENCE_DTYPE = np.dtype([
+    ('wExp', WORD),
+    ('wReserved', WORD),
+    ('wLevel', WORD),
+    ('wCount', WORD),
+])
+
+ALLEXPERIENCE_DTYPE = np.dtype([
+    (name, (EXPERIENCE_DTYPE, MAX_PLAYER_ROLES)) for name in
+    ('rgPrimaryExp', 'rgHealthExp', 'rgMagicExp', 'rgAttackExp',
+     'rgMagicPowerExp', 'rgDefenseExp', 'rgDexterityExp', 'rgFleeExp')
+])
+
+POISONSTATUS_DTYPE = np.dtype([
+    ('wPoisonID', WORD),
+    ('wPoisonScript', WORD),
+])
+
+# data.mkf中的表
+
+STORE_DTYPE = np.dtype([
+    ('rgwItems', (WORD, MAX_STORE_ITEM)),
+])
+
+ENEMY_DTYPE = np.dtype([
+    ('wIdleFrames', WORD),
+    ('wMagicFrames', WORD),
+    ('wAttackFrames', WORD),
+    ('wIdleAnimSpeed', WORD),
+    ('wActWaitFrames', WORD),
+    ('wYPosOffset', WORD),
+    ('wAttackSound', WORD),
+    ('wActionSound', WORD),
+    ('wMagicSound', WORD),
+    ('wDeathSound', WORD),
+    ('wCallSound', WORD),
+    ('wHealth', WORD),
+    ('wExp', WORD),
+    ('wCash', WORD),
+    ('wLevel', WORD),
+    ('wMagic', WORD),
+    ('wMagicRate', WORD),
+    ('wAttackEquivItem', WORD),
+    ('wAttackEquivItemRate', WORD),
+    ('wStealItem', WORD),
+    ('nStealItem', WORD),
+    ('wAttackStrength', WORD),
+    ('wMagicStrength', WORD),
+    ('wDefense', WORD),
+    ('wDexterity', WORD),
+    ('wFleeRate', WORD),
+    ('wPoisonResistance', WORD),
+    ('wElemResistance', (WORD, NUM_MAGIC_ELEMENTAL)),
+    ('wPhysicalResistance', WORD),
+    ('wDualMove', WORD),
+    ('wCollectValue', WORD),
+])
+
+ENEMYTEAM_DTYPE = np.dtype([
+    ('rgwEnemy', (WORD, MAX_ENEMIES_IN_TEAM)),
+])
+
+MAGIC_DTYPE = np.dtype([
+    ('wEffect', WORD),
+    ('wType', WORD),
+    ('wXOffset', WORD),
+    ('wYOffset', WORD),
+    ('wSummonEffect', WORD),
+    ('wSpeed', WORD),
+    ('wKeepEffect', WORD),
+    ('wSoundDelay', WORD),
+    ('wEffectTimes', WORD),
+    ('wShake', WORD),
+    ('wWave', WORD),
+    ('wSpecialEffect', WORD),
+    ('wCostMP', WORD),
+    ('wBaseDamage', WORD),
+    ('wElemental', WORD),
+    ('wSound', WORD),
+])
+
+BATTLEFIELD_DTYPE = np.dtype([
+    ('wScreenWave', WORD),
+    ('rgsMagicEffect', (SHORT, NUM_MAGIC_ELEMENTAL)),
+])
+
+LEVELUPMAGIC_DTYPE = np.dtype([
+    ('wLevel', WORD),
+    ('wMagic', WORD),
+])
+
+LEVELUPMAGIC_ALL_DTYPE = np.dtype([
+    ('m', (LEVELUPMAGIC_DTYPE, MAX_PLAYABLE_PLAYER_ROLES)),
+])
+
+ENEMYPOS_DTYPE = np.dtype([
+    ('pos', (np.dtype([('x', WORD), ('y', WORD)]), (MAX_ENEMIES_IN_TEAM, MAX_ENEMIES_IN_TEAM))),
+])
+
+LEVELUPEXP_DTYPE = np.dtype(WORD)
+
+BATTLEEFFECTINDEX_DTYPE = np.dtype((WORD, 2))
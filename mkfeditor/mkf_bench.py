@@ -0,0 +1,195 @@
+# coding=utf-8
+"""
+MKF/YJ_1解码性能测试
+
+用法：python mkf_bench.py [FBP.MKF MGO.MKF ...] [-n 次数] [-o result.json] [--compare old.json]
+
+默认先生成几种合成的MKF文件（用YJ1Encoder压缩随机数据、类似图像的数据、文本，
+以及只含未压缩block的YJ_1数据），再加上命令行中给出的真实MKF文件，对每个文件测量：
+    open        MKFDecoder打开文件的耗时（普通模式和mmap模式）
+    read        用read()读取全部子文件的耗时（冷缓存和热缓存）
+    decode      YJ1TableDecoder（以及--legacy时的YJ1Decoder）解压全部YJ_1子文件的吞吐量
+    peak_rss_kb 测试该文件的子进程的内存峰值
+结果以JSON输出，--compare可以和之前保存的结果对比
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from struct import pack
+
+from mkf_unpack import MKFDecoder, YJ1Decoder, YJ1TableDecoder
+from mkf_pack import MKFEncoder, YJ1Encoder
+from yj1_bench import best_of, peak_rss, run_in_subprocess
+
+
+def stored_yj1(data):
+    '''
+    只含未压缩block的YJ_1数据，用来单独测量解码器的固定开销
+    '''
+    blocks = [data[i:i + 0x4000] for i in xrange(0, len(data), 0x4000)]
+    body = ''.join(pack('<HH', len(b), 0) + b for b in blocks)
+    # 最小的Huffman树：根节点下两个叶子
+    tree = '\x00\x01' + pack('<H', 0)
+    return pack('<4sIIHBB', 'YJ_1', len(data), 16 + len(tree) + len(body), len(blocks), 0, 1) + tree + body
+
+
+def synthetic_chunk(kind, size, rnd):
+    if kind == 'random':
+        return ''.join(chr(rnd.randrange(256)) for _ in xrange(size))
+    if kind == 'image':
+        # 类似背景图：横向的色块加少量噪点
+        row = []
+        while len(row) < 320:
+            row.extend([rnd.randrange(0x40, 0x60)] * rnd.randrange(1, 24))
+        data = bytearray()
+        while len(data) < size:
+            line = bytearray(row[:320])
+            for _ in xrange(8):
+                line[rnd.randrange(320)] = rnd.randrange(256)
+            data += line
+        return str(data[:size])
+    if kind == 'text':
+        words = ['li', 'xiaoyao', 'zhao', 'linger', 'yueru', 'anu', 'hp', 'mp', 'item', 'magic', '\x00\x00']
+        out = []
+        total = 0
+        while total < size:
+            w = rnd.choice(words)
+            out.append(w)
+            total += len(w)
+        return ''.join(out)[:size]
+    raise ValueError(kind)
+
+
+SYNTHETIC = [
+    # 名称, 数据类型, 子文件个数, 每个子文件大小, 是否只用未压缩block
+    ('synthetic-random', 'random', 16, 0x4000, False),
+    ('synthetic-image', 'image', 16, 320 * 200, False),
+    ('synthetic-text', 'text', 32, 0x2000, False),
+    ('synthetic-stored', 'image', 16, 320 * 200, True),
+]
+
+
+def make_synthetic(workdir, seed):
+    rnd = random.Random(seed)
+    yj1 = YJ1Encoder()
+    paths = []
+    for name, kind, count, size, stored in SYNTHETIC:
+        encoder = MKFEncoder()
+        for _ in xrange(count):
+            data = synthetic_chunk(kind, size, rnd)
+            encoder.append(stored_yj1(data) if stored else yj1.encode(data), compress=False)
+        path = os.path.join(workdir, '%s.mkf' % name)
+        encoder.write(path)
+        paths.append(path)
+    return paths
+
+
+def bench_archive(path, repeat, legacy):
+    result = {'archive': os.path.basename(path), 'path': os.path.abspath(path),
+              'bytes': os.path.getsize(path)}
+
+    def read_all(mkf):
+        for i in xrange(mkf.getFileCount()):
+            mkf.read(i)
+
+    result['open_s'] = best_of(repeat, lambda: MKFDecoder(path=path))
+    result['open_mmap_s'] = best_of(repeat, lambda: MKFDecoder(path=path, use_mmap=True).close())
+    result['read_cold_s'] = best_of(repeat, lambda: read_all(MKFDecoder(path=path)))
+    warm = MKFDecoder(path=path)
+    read_all(warm)
+    result['read_warm_s'] = best_of(repeat, lambda: read_all(warm))
+
+    chunks = [str(warm.read_raw(i)) for i in xrange(warm.getFileCount())
+              if len(warm.read_raw(i)) >= 16 and warm.isYJ1(i)]
+    result['chunks'] = warm.getFileCount()
+    result['yj1_chunks'] = len(chunks)
+    decoded = sum(len(warm.read(i)) for i in xrange(warm.getFileCount())
+                  if len(warm.read_raw(i)) >= 16 and warm.isYJ1(i))
+    result['decoded_bytes'] = decoded
+
+    decoders = [YJ1TableDecoder()] + ([YJ1Decoder()] if legacy else [])
+    result['decode'] = {}
+    for decoder in decoders:
+        seconds = best_of(repeat, lambda: [decoder.decode(c) for c in chunks])
+        result['decode'][decoder.__class__.__name__] = {
+            'seconds': seconds,
+            'mb_s': decoded / 1048576.0 / seconds if seconds else None,
+        }
+    result['peak_rss_kb'] = peak_rss()
+    return result
+
+
+def bench_in_subprocess(path, repeat, legacy):
+    '''
+    每个文件在单独的进程中测试，peak_rss_kb才不会受前面的文件影响
+    '''
+    try:
+        return run_in_subprocess(bench_archive, path, repeat, legacy)
+    except RuntimeError as e:
+        return {'archive': os.path.basename(path), 'error': str(e)}
+
+
+def compare(old, new):
+    '''
+    打印两次结果中同名文件的耗时比例（> 1表示变慢）
+    '''
+    previous = dict((r['archive'], r) for r in old['results'])
+    for r in new['results']:
+        o = previous.get(r['archive'])
+        if o is None or 'error' in r or 'error' in o:
+            continue
+        print '%s:' % r['archive']
+        for key in ('open_s', 'open_mmap_s', 'read_cold_s', 'read_warm_s'):
+            if o.get(key):
+                print '  %-24s %.2fx' % (key, r[key] / o[key])
+        for name, d in r['decode'].iteritems():
+            if name in o['decode'] and o['decode'][name]['seconds']:
+                print '  %-24s %.2fx' % (name, d['seconds'] / o['decode'][name]['seconds'])
+        if o.get('peak_rss_kb'):
+            print '  %-24s %.2fx' % ('peak_rss_kb', float(r['peak_rss_kb']) / o['peak_rss_kb'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MKF/YJ_1 decoding benchmark')
+    parser.add_argument('archives', nargs='*', help='real MKF archives to include')
+    parser.add_argument('-n', '--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='write JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', help='previous JSON results to compare with')
+    parser.add_argument('--legacy', action='store_true', help='also time the bit-by-bit YJ1Decoder')
+    parser.add_argument('--no-synthetic', action='store_true', help='only benchmark the given archives')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='mkf_bench_')
+    try:
+        paths = [] if args.no_synthetic else make_synthetic(workdir, args.seed)
+        paths += args.archives
+        results = []
+        for path in paths:
+            results.append(bench_in_subprocess(path, args.repeat, args.legacy))
+            print >> sys.stderr, 'done', os.path.basename(path)
+    finally:
+        shutil.rmtree(workdir)
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print text
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
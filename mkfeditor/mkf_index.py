@@ -0,0 +1,119 @@
+# coding=utf-8
+"""
+MKF子文件内部的二级索引
+
+很多MKF子文件本身也是一个容器：
+    sprite（mgo.mkf/f.mkf/abc.mkf等）：整个子文件YJ_1压缩，解压后开头是WORD偏移表，
+        第i项 * 2为第i帧RLE图像的偏移，第0项同时也是偏移表的WORD个数（见palcommon.c中的
+        PAL_SpriteGetFrame/PAL_SpriteGetNumFrames）
+    rng.mkf：每个子文件是一个未压缩的子MKF，每一帧是单独YJ_1压缩的数据（见rngplay.c中的
+        PAL_RNGReadFrame）
+这里的索引把偏移表解析一次后缓存下来，之后取第M个子文件的第N帧都是O(1)，
+rng只解压需要的那一帧，sprite只解压一次整个子文件
+"""
+import array
+import sys
+from struct import unpack_from
+
+
+class SpriteIndex:
+    """
+    sprite容器的索引，mkf为对应的MKFDecoder（解压后的子文件放在mkf.cache中）
+    """
+
+    def __init__(self, mkf):
+        self.mkf = mkf
+        self.tables = {}
+
+    def offsets(self, chunk):
+        '''
+        返回第chunk个sprite各帧的偏移（array('H')，已经换算成字节），结果会缓存
+        '''
+        table = self.tables.get(chunk)
+        if table is None:
+            data = self.mkf.read(chunk)
+            table = array.array('H')
+            if len(data) >= 2:
+                count, = unpack_from('<H', data, 0)
+                table.fromstring(data[:min(count, len(data) >> 1) << 1])
+                if sys.byteorder == 'big':
+                    table.byteswap()
+                # 与PAL_SpriteGetFrame一样按WORD截断
+                table = array.array('H', [(w << 1) & 0xFFFF for w in table])
+            self.tables[chunk] = table
+        return table
+
+    def getFrameCount(self, chunk):
+        '''
+        与PAL_SpriteGetNumFrames相同：偏移表第0项 - 1
+        '''
+        return max(len(self.offsets(chunk)) - 1, 0)
+
+    def frame(self, chunk, n):
+        '''
+        返回第chunk个sprite的第n帧RLE数据（buffer，引用解压后的子文件，不复制），帧不存在时返回None
+        与PAL_SpriteGetFrame一样允许取偏移表中的最后一项
+        '''
+        table = self.offsets(chunk)
+        if n < 0 or n >= len(table):
+            return None
+        data = self.mkf.read(chunk)
+        start = table[n]
+        end = table[n + 1] if n + 1 < len(table) and table[n + 1] > start else len(data)
+        return buffer(data, start, end - start)
+
+
+class RNGIndex:
+    """
+    rng.mkf的索引：每个子文件为子MKF，偏移相对于子文件开头，每一帧单独YJ_1压缩
+    """
+
+    def __init__(self, mkf):
+        self.mkf = mkf
+        self.tables = {}
+
+    def offsets(self, chunk):
+        '''
+        返回第chunk个动画的帧偏移表（array('I')，包括最后指向结尾的一项），结果会缓存
+        '''
+        table = self.tables.get(chunk)
+        if table is None:
+            raw = self.mkf.read_raw(chunk)
+            table = array.array('I')
+            if len(raw) >= 4:
+                count = min(unpack_from('<I', raw, 0)[0], len(raw)) >> 2
+                table.fromstring(raw[:count << 2])
+                if sys.byteorder == 'big':
+                    table.byteswap()
+            self.tables[chunk] = table
+        return table
+
+    def getFrameCount(self, chunk):
+        '''
+        与PAL_RNGReadFrame一样：(子MKF第一个偏移 - 4) / 4
+        '''
+        return max(len(self.offsets(chunk)) - 1, 0)
+
+    def frame_raw(self, chunk, n):
+        '''
+        返回第chunk个动画第n帧未解压的数据（buffer），帧不存在或者为空时返回None
+        '''
+        table = self.offsets(chunk)
+        if n < 0 or n + 1 >= len(table) or table[n + 1] <= table[n]:
+            return None
+        raw = self.mkf.read_raw(chunk)
+        return buffer(raw, table[n], table[n + 1] - table[n])
+
+    def frame(self, chunk, n):
+        '''
+        返回第chunk个动画第n帧解压后的数据，只解压这一帧，结果放在mkf.cache中
+        '''
+        key = (self.mkf.archive, chunk, n)
+        data = self.mkf.cache.get(key)
+        if data is None:
+            raw = self.frame_raw(chunk, n)
+            if raw is None:
+                return None
+            data = self.mkf.decode_raw(raw) if raw[:4] == 'YJ_1' else str(raw)
+            self.mkf.cache.put(key, data)
+        return data
@@ -0,0 +1,340 @@
+# coding=utf-8
+import io, os
+import heapq
+import array
+from struct import pack
+
+
+
+class BitWriter:
+    """
+    按YJ_1的方式写位流：每16位组成一个little-end的word，word内从最高位开始写
+    """
+
+    def __init__(self):
+        self.words = array.array('H')
+        self.acc = 0
+        self.num = 0
+
+    def write(self, value, nbits):
+        self.acc = (self.acc << nbits) | value
+        self.num += nbits
+        while self.num >= 16:
+            self.num -= 16
+            self.words.append((self.acc >> self.num) & 0xffff)
+        self.acc &= (1 << self.num) - 1
+
+    def getvalue(self):
+        words = self.words[:]
+        if self.num:
+            words.append((self.acc << (16 - self.num)) & 0xffff)
+        return pack('<%dH' % len(words), *words)
+
+
+class YJ1Encoder:
+    """
+    YJ_1压缩，输出可以被YJ1Decoder/YJ1TableDecoder以及游戏中的Decompress解开
+    文件头（16字节）：'YJ_1' 原始长度 压缩后长度 block数(WORD) 未知(BYTE) Huffman树长度/2(BYTE)
+    之后是Huffman树（table + assist位图），然后是各个block，每个block最多0x4000字节：
+    压缩的block以24字节的块头开始（见yj1.c中的YJ_1_BLOCKHEADER），压缩后比原数据还大的
+    block则以CompressedLength = 0的4字节块头直接存放原数据
+
+    LZSS部分使用hash链查找匹配：以3个字节为key，head记录每个key最近出现的位置，
+    prev把相同key的位置串成链，每个位置最多沿链比较max_chain次
+    """
+
+    BLOCK_SIZE = 0x4000
+    MIN_MATCH = 3
+    # YJ1Decoder在读取回溯距离前只保证缓冲区里有16位，2位选择码之后最多还能读14位
+    MAX_OFFSET = (1 << 14) - 1
+    MAX_MATCH = (1 << 14) - 1
+    # 块头中的各个码表，含义见yj1.c中的get_loop/get_count
+    REPEAT_TABLE = (3, 4, 5, 6)
+    REPEAT_BITS = (3, 6, 14)
+    OFFSET_BITS = (5, 8, 11, 14)
+    COUNT_TABLE = (1, 2)
+    COUNT_BITS = (3, 7, 15)
+
+    def __init__(self, max_chain=16):
+        self.max_chain = max_chain
+
+    def encode(self, data):
+        '''
+        把data压缩成YJ_1格式
+        '''
+        data = str(data)
+        dataLen = len(data)
+        blocks = []
+        freq = [0] * 256
+        for start in xrange(0, dataLen, self.BLOCK_SIZE):
+            tokens = self.parse(data, start, min(start + self.BLOCK_SIZE, dataLen))
+            for t in tokens:
+                if t < 0x100:
+                    freq[t] += 1
+            blocks.append((start, tokens))
+        # 文件头中block数是WORD（两个解码器都按WORD读取），超过4 MB的数据需要256个以上的block
+        if len(blocks) > 0xFFFF:
+            raise ValueError('data too large for YJ_1')
+
+        table, assist, codes = self.build_tree(freq)
+        body = []
+        for start, tokens in blocks:
+            end = min(start + self.BLOCK_SIZE, dataLen)
+            bits = self.encode_block(tokens, codes)
+            if 24 + len(bits) >= 4 + end - start:
+                body.append(pack('<HH', end - start, 0))
+                body.append(data[start:end])
+            else:
+                body.append(pack('<HH4H4B3B3B2B', end - start, 24 + len(bits),
+                                 *(self.REPEAT_TABLE + self.OFFSET_BITS + self.REPEAT_BITS +
+                                   self.COUNT_BITS + self.COUNT_TABLE)))
+                body.append(bits)
+
+        flagWords = [0] * ((len(assist) + 15) >> 4)
+        for i, flag in enumerate(assist):
+            if flag:
+                flagWords[i >> 4] |= 0x8000 >> (i & 15)
+        tree = str(bytearray(table)) + pack('<%dH' % len(flagWords), *flagWords)
+        body = ''.join(body)
+        header = pack('<4sIIHBB', 'YJ_1', dataLen, 16 + len(tree) + len(body),
+                      len(blocks), 0, len(table) >> 1)
+        return header + tree + body
+
+    def parse(self, data, start, end):
+        '''
+        用hash链做贪心的LZSS匹配，返回token列表：
+        < 0x100的是字面字节，其他的是 (长度 << 16) | 距离 表示的回溯复制
+        每个block的第一个token一定是字面字节（block以非0个字面字节开始）
+        '''
+        minMatch = self.MIN_MATCH
+        maxOffset = self.MAX_OFFSET
+        maxChain = self.max_chain
+        head = {}
+        prev = [-1] * (end - start)
+        tokens = []
+        append = tokens.append
+        i = start
+        hashEnd = end - minMatch + 1
+        while i < end:
+            bestLen = 0
+            if start < i < hashEnd:
+                cand = head.get(data[i:i + 3], -1)
+                limit = min(self.MAX_MATCH, end - i)
+                chain = maxChain
+                while cand >= 0 and chain and i - cand <= maxOffset:
+                    # 先比较当前最长匹配的下一个字节，快速排除不可能更长的候选
+                    if data[cand + bestLen] == data[i + bestLen]:
+                        l = 3
+                        while l + 16 <= limit and data[cand + l:cand + l + 16] == data[i + l:i + l + 16]:
+                            l += 16
+                        while l < limit and data[cand + l] == data[i + l]:
+                            l += 1
+                        if l > bestLen:
+                            bestLen = l
+                            bestOff = i - cand
+                            if l == limit:
+                                break
+                    cand = prev[cand - start]
+                    chain -= 1
+            if bestLen >= minMatch:
+                append((bestLen << 16) | bestOff)
+                step = bestLen
+            else:
+                append(ord(data[i]))
+                step = 1
+            for j in xrange(i, min(i + step, hashEnd)):
+                key = data[j:j + 3]
+                prev[j - start] = head.get(key, -1)
+                head[key] = j
+            i += step
+        return tokens
+
+    def build_tree(self, freq):
+        '''
+        根据字面字节的频率生成Huffman树，码长不超过16位（YJ1Decoder读每个字面字节前只补充到16位）
+        返回(table, assist, codes)，table/assist的布局与YJ1Decoder.expand读出的一致：
+        第k对节点（table[2k], table[2k+1]）是第k个内部节点的左右子节点，第0对为根节点的子节点，
+        内部节点的table值为其子节点对的编号，codes[byte] = (码字, 码长)
+        '''
+        symbols = [s for s in xrange(256) if freq[s]]
+        # 至少需要两个叶子
+        for s in (0, 1):
+            if len(symbols) < 2 and s not in symbols:
+                symbols.append(s)
+        weights = [max(freq[s], 1) for s in symbols]
+        while True:
+            heap = [(w, i, s) for i, (w, s) in enumerate(zip(weights, symbols))]
+            heapq.heapify(heap)
+            uid = len(heap)
+            while len(heap) > 1:
+                a = heapq.heappop(heap)
+                b = heapq.heappop(heap)
+                heapq.heappush(heap, (a[0] + b[0], uid, (a[2], b[2])))
+                uid += 1
+            root = heap[0][2]
+            codes = {}
+            stack = [(root, 0, 0)]
+            while stack:
+                node, code, depth = stack.pop()
+                if isinstance(node, tuple):
+                    stack.append((node[0], code << 1, depth + 1))
+                    stack.append((node[1], (code << 1) | 1, depth + 1))
+                else:
+                    codes[node] = (code, depth)
+            if max(d for _, d in codes.itervalues()) <= 16:
+                break
+            # 码长超过16时压平频率重新生成
+            weights = [(w >> 1) | 1 for w in weights]
+
+        table, assist = [], []
+        queue = [root]
+        for node in queue:
+            for child in node:
+                if isinstance(child, tuple):
+                    queue.append(child)
+                    table.append(len(queue) - 1)
+                    assist.append(1)
+                else:
+                    table.append(child)
+                    assist.append(0)
+        return table, assist, codes
+
+    def encode_block(self, tokens, codes):
+        '''
+        按 字面字节个数, 字面字节..., 回溯个数, 回溯... 交替写出，个数为0表示block结束
+        '''
+        writer = BitWriter()
+        write = writer.write
+        n = len(tokens)
+        i = 0
+        while True:
+            j = i
+            while j < n and tokens[j] < 0x100:
+                j += 1
+            if j == i:
+                self.write_loop(writer, 0)
+                break
+            self.write_loop(writer, j - i)
+            for t in tokens[i:j]:
+                code, length = codes[t]
+                write(code, length)
+            i = j
+            while j < n and tokens[j] >= 0x100:
+                j += 1
+            if j == i:
+                self.write_loop(writer, 0)
+                break
+            self.write_loop(writer, j - i)
+            for t in tokens[i:j]:
+                self.write_count(writer, t >> 16)
+                self.write_offset(writer, t & 0xffff)
+            i = j
+        return writer.getvalue()
+
+    def write_loop(self, writer, n):
+        if n == self.COUNT_TABLE[0]:
+            writer.write(1, 1)
+        elif n == self.COUNT_TABLE[1]:
+            writer.write(0, 3)
+        else:
+            # 0只能用显式的位数写出，YJ1Decoder只在这种情况下把0当作结束
+            for t, nbits in enumerate(self.COUNT_BITS):
+                if n < (1 << nbits):
+                    writer.write(t + 1, 3)
+                    writer.write(n, nbits)
+                    return
+            raise ValueError('loop count %d too large' % n)
+
+    def write_count(self, writer, n):
+        if n == self.REPEAT_TABLE[0]:
+            writer.write(0, 2)
+            return
+        for t in (1, 2, 3):
+            if n == self.REPEAT_TABLE[t]:
+                writer.write(t << 1, 3)
+                return
+        for t, nbits in enumerate(self.REPEAT_BITS):
+            if n < (1 << nbits):
+                writer.write(((t + 1) << 1) | 1, 3)
+                writer.write(n, nbits)
+                return
+        raise ValueError('match length %d too large' % n)
+
+    def write_offset(self, writer, offset):
+        for t, nbits in enumerate(self.OFFSET_BITS):
+            if offset < (1 << nbits):
+                writer.write(t, 2)
+                writer.write(offset, nbits)
+                return
+        raise ValueError('match offset %d too large' % offset)
+
+
+class MKFEncoder:
+    """
+    生成MKF文件，格式见MKFDecoder
+
+    source为MKFDecoder时是增量模式：只有通过set_chunk修改过的子文件会重新压缩，
+    其他子文件原样复制压缩后的数据，最后重建偏移表。source为None时从空文件开始，用append添加子文件
+    """
+
+    def __init__(self, source=None, encoder=None):
+        self.source = source
+        self.yj1 = encoder or YJ1Encoder()
+        # 每一项为 (index, 数据)，index不为None表示直接复制source中的子文件
+        self.chunks = []
+        if source is not None:
+            self.chunks = [(i, None) for i in xrange(source.getFileCount())]
+
+    def getFileCount(self):
+        return len(self.chunks)
+
+    def append(self, data, compress=True):
+        self.chunks.append((None, self.yj1.encode(data) if compress else str(data)))
+        return len(self.chunks) - 1
+
+    def set_chunk(self, index, data, compress=None):
+        '''
+        替换第index个子文件，compress为None时沿用原子文件的格式（原来是YJ_1压缩的就继续压缩）
+        '''
+        if compress is None:
+            compress = (self.source is not None and index < self.source.getFileCount() and
+                        len(self.source.read_raw(index)) >= 4 and self.source.isYJ1(index))
+        self.chunks[index] = (None, self.yj1.encode(data) if compress else str(data))
+
+    def raw_chunks(self):
+        for index, data in self.chunks:
+            if index is not None:
+                yield self.source.read_raw(index)
+            else:
+                yield data
+
+    def encode(self):
+        '''
+        返回整个MKF文件的内容
+        '''
+        f = io.BytesIO()
+        self.write_to(f)
+        return f.getvalue()
+
+    def write_to(self, f):
+        offset = (len(self.chunks) + 1) << 2
+        indexes = []
+        for chunk in self.raw_chunks():
+            indexes.append(offset)
+            offset += len(chunk)
+        indexes.append(offset)
+        f.write(pack('<%dI' % len(indexes), *indexes))
+        for chunk in self.raw_chunks():
+            f.write(chunk)
+
+    def write(self, path):
+        '''
+        写入path，先写临时文件再改名，path可以就是source正在读取的文件
+        '''
+        tmp = '%s.tmp' % path
+        with open(tmp, 'wb') as f:
+            self.write_to(f)
+        if os.name == 'nt' and os.path.exists(path):
+            # Windows下rename不能覆盖已有文件
+            os.remove(path)
+        os.rename(tmp, path)
@@ -1,9 +1,131 @@
 # coding=utf-8
-import io, os
-from struct import unpack
-from itertools import chain
+import io, os, sys
+import argparse
+import hashlib
+import mmap
+import multiprocessing
+from struct import unpack, unpack_from
+from collections import OrderedDict
 import array
 
+class ChunkCache:
+    """
+    解压后子文件的缓存，key为(archive, index)，不限制大小（MKFDecoder的默认行为）
+    可以在多个MKFDecoder之间共享，hits/misses/evictions记录命中、未命中和淘汰次数
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        data = self.items.get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        old = self.items.get(key)
+        if old is not None:
+            self.size -= len(old)
+        self.items[key] = data
+        self.size += len(data)
+
+    def clear(self):
+        self.items.clear()
+        self.size = 0
+
+    def stats(self):
+        return {'items': len(self.items), 'bytes': self.size, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class LRUChunkCache(ChunkCache):
+    """
+    按解压后总字节数限制大小的LRU缓存，超过max_bytes时淘汰最久未使用的子文件
+    单个子文件比max_bytes还大时不缓存
+    """
+
+    def __init__(self, max_bytes):
+        ChunkCache.__init__(self)
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+
+    def get(self, key):
+        data = self.items.pop(key, None)
+        if data is None:
+            self.misses += 1
+        else:
+            # 重新插入到末尾，末尾是最近使用的
+            self.items[key] = data
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        old = self.items.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        if len(data) > self.max_bytes:
+            return
+        self.items[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+
+class DiskChunkCache:
+    """
+    解压结果的磁盘缓存，缓存文件以sha1(解码器版本 + 压缩数据)命名，保存在directory下
+    MKF文件改变后压缩数据的hash随之改变，旧的缓存文件自然不会再被命中，不需要手动失效
+    解码器输出变化时修改YJ1TableDecoder.VERSION即可让所有旧缓存失效
+    """
+
+    DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'sdlpal-mkf')
+
+    def __init__(self, directory=None):
+        self.directory = directory or DiskChunkCache.DEFAULT_DIR
+        self.hits = self.misses = 0
+
+    def key(self, raw):
+        h = hashlib.sha1(YJ1TableDecoder.VERSION)
+        h.update(raw)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except IOError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # 先写临时文件再改名，避免并行解压时其他进程读到写了一半的文件
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            print 'error occurs when try to write cache file', path
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
 class MKFDecoder:
     """
     MKF文件解码《仙剑》MKF文件的结构组成，以ABC.MKF为例：
@@ -24,15 +146,26 @@ class MKFDecoder:
     000F9A60     0B 12 80 38     文件的末尾
     """
 
-    def __init__(self, path=None, data=None):
+    def __init__(self, path=None, data=None, use_mmap=False, cache=None, disk_cache=None):
         # path和data不能同时是None
         assert path or data
-        self.yj1 = YJ1Decoder()
+        self.yj1 = YJ1TableDecoder()
+        self.indexes = None
+        # cache可以传入一个共享的ChunkCache/LRUChunkCache，缓存key中的archive用来区分不同的文件
+        self.cache = cache if cache is not None else ChunkCache()
+        self.path = path
+        self.archive = os.path.abspath(path) if path else 'data@%x' % id(self)
+        # disk_cache为DiskChunkCache时，YJ_1子文件的解压结果会保存到磁盘上供下次使用
+        self.disk_cache = disk_cache
         try:
             # 优先使用path（优先从文件读取）
             if path:
                 f = open(path, 'rb')
-                self.content = f.read()
+                if use_mmap:
+                    # 只做内存映射，不把整个文件读进内存，偏移表也等用到时再读
+                    self.content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self.content = f.read()
             else:
                 self.content = data
             # ===================================================================
@@ -46,12 +179,13 @@ class MKFDecoder:
             # ！！！补充：第一个int（前四位）不仅是偏移表长度，也是第一个文件的开头
             # ABC.MFK中前面两个4位分别相等只是巧合（第一个文件为0）
             # ===================================================================
-            self.count = unpack('I', self.content[:4])[0] / 4  # - 1
-            self.indexes = []
-            self.cache = {}
-            for i in xrange(self.count):
-                index = unpack('I', self.content[i << 2: (i + 1) << 2])[0]
-                self.indexes.append(index)
+            self.count = unpack_from('<I', self.content, 0)[0] / 4  # - 1
+            if not isinstance(self.content, mmap.mmap):
+                # 整个偏移表一次性读入array('I')，mmap模式下不读，由offset()直接从映射区域取
+                self.indexes = array.array('I')
+                self.indexes.fromstring(self.content[:self.count << 2])
+                if sys.byteorder == 'big':
+                    self.indexes.byteswap()
             # 减去最后一个偏移量，对外而言，count就表示mkf文件中的子文件个数
             self.count -= 1
         except IOError:
@@ -60,9 +194,43 @@ class MKFDecoder:
             if 'f' in dir():
                 f.close()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, trace):
+        self.close()
+
+    def close(self):
+        if isinstance(self.content, mmap.mmap):
+            self.content.close()
+
     def check(self, index):
         assert index <= self.count and index >= 0
 
+    def offset(self, index):
+        '''
+        返回第index个偏移量，mmap模式下不预先解析偏移表，直接从映射区域读取
+        '''
+        if self.indexes is None:
+            return unpack_from('<I', self.content, index << 2)[0]
+        return self.indexes[index]
+
+    def getChunkSize(self, index):
+        '''
+        返回指定文件未解压时的长度，与PAL_MKFGetChunkSize相同
+        '''
+        self.check(index + 1)
+        return self.offset(index + 1) - self.offset(index)
+
+    def getDecodedSize(self, index):
+        '''
+        返回指定文件解压后的长度，YJ_1文件直接读文件头中的原始长度，不需要解压
+        '''
+        size = self.getChunkSize(index)
+        if size >= 16 and self.isYJ1(index):
+            return unpack_from('<I', self.content, self.offset(index) + 4)[0]
+        return size
+
     def getFileCount(self):
         return self.count
 
@@ -71,27 +239,84 @@ class MKFDecoder:
         判断文件是否为YJ_1压缩
         '''
         self.check(index)
-        return self.content[self.indexes[index]:self.indexes[index] + 4] == '\x59\x4A\x5F\x31'
+        start = self.offset(index)
+        return self.content[start:start + 4] == '\x59\x4A\x5F\x31'
+
+    def read_raw(self, index):
+        '''
+        返回指定文件未解压的原始数据，以buffer的形式引用content，不复制数据
+        '''
+        self.check(index + 1)
+        start = self.offset(index)
+        return buffer(self.content, start, self.offset(index + 1) - start)
 
     def read(self, index):
         '''
         读取并返回指定文件，如果文件是经过YJ_1压缩的话，返回解压以后的内容
         '''
         self.check(index + 1)
-        if not self.cache.has_key(index):
-            data = self.content[self.indexes[index]:self.indexes[index + 1]]
-            if self.isYJ1(index):
-                data = self.yj1.decode(data)
-            self.cache[index] = data
-        return self.cache[index]
+        key = (self.archive, index)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.decompress(index)
+            self.cache.put(key, data)
+        return data
+
+    def decompress(self, index):
+        '''
+        读取并解压指定文件，不经过缓存
+        '''
+        data = self.read_raw(index)
+        if not self.isYJ1(index):
+            return str(data)
+        return self.decode_raw(data)
+
+    def decode_raw(self, data):
+        '''
+        解压一个YJ_1格式的子文件，有disk_cache时优先从磁盘缓存读取
+        '''
+        if self.disk_cache is None:
+            return self.yj1.decode(data)
+        key = self.disk_cache.key(data)
+        result = self.disk_cache.get(key)
+        if result is None:
+            result = self.yj1.decode(data)
+            self.disk_cache.put(key, result)
+        return result
+
+    def iter_chunks(self, start=0, stop=None, decompress=True, readahead=1 << 20):
+        '''
+        按文件顺序依次返回 (index, 原始长度, 数据)，decompress为False时数据为未解压的原始数据
+        有path时另外打开文件顺序读取，读缓冲最多readahead字节，结果不会放进cache，
+        因此扫描整个文件时内存中同时只有一个子文件
+        '''
+        if stop is None or stop > self.count:
+            stop = self.count
+        if start >= stop:
+            return
+        f = io.open(self.path, 'rb', buffering=readahead) if self.path else None
+        try:
+            if f:
+                f.seek(self.offset(start))
+            for index in xrange(start, stop):
+                size = self.offset(index + 1) - self.offset(index)
+                raw = f.read(size) if f else self.read_raw(index)
+                if decompress:
+                    data = self.decode_raw(raw) if size >= 4 and raw[:4] == 'YJ_1' else str(raw)
+                else:
+                    data = str(raw)
+                yield index, size, data
+        finally:
+            if f:
+                f.close()
 
 # @singleton
 class YJ1Decoder:
     """
     YJ_1文件解析
     YJ_1文件结构：
-    0000000: 594a5f31 fe520000 321b0000                02（即data[0xC]) 00 00 57（即data[0xF]）
-              Y J _ 1 新文件长 源文件长（包含'YJ_1'头）block数                loop数
+    0000000: 594a5f31 fe520000 321b0000                0200（即data[0xC:0xE]) 00 57（即data[0xF]）
+              Y J _ 1 新文件长 源文件长（包含'YJ_1'头）block数(WORD)             loop数
     """
 
     def __init__(self):
@@ -119,13 +344,13 @@ class YJ1Decoder:
             return data
         self.orgLen = self.readInt()
         self.fileLen = self.readInt()
-        self.finalData = ['\x00' for _ in xrange(self.orgLen)]
+        self.finalData = bytearray(self.orgLen)
         self.keywords = [0 for _ in xrange(0x14)]
 
         prev_src_pos = self.si
         prev_dst_pos = self.di
 
-        blocks = self.readByte(0xC)
+        blocks = self.readShort(0xC)
 
         self.expand()
 
@@ -144,10 +369,11 @@ class YJ1Decoder:
 
             if not pack_length:
                 pack_length = ext_length + 4
-                for _ in xrange(ext_length):
-                    self.finalData[self.di] = self.data[self.si]
-                    self.di += 1
-                    self.si += 1
+                if self.si + ext_length > self.dataLen or self.di + ext_length > self.orgLen:
+                    raise IndexError('YJ_1 stored block out of range')
+                self.finalData[self.di:self.di + ext_length] = self.data[self.si:self.si + ext_length]
+                self.di += ext_length
+                self.si += ext_length
                 ext_length = pack_length - 4
             else:
                 d = 0
@@ -160,7 +386,7 @@ class YJ1Decoder:
                 self.flags = ((self.readShort() << 16) | self.readShort()) & 0xffffffff
                 self.analysis()
 
-        return ''.join([x for x in self.finalData if x != 0])
+        return str(self.finalData)
 
     def analysis(self):
         loop = 0
@@ -179,7 +405,7 @@ class YJ1Decoder:
                     if self.assist[m] == 0:
                         break
                     m = self.table[m]
-                self.finalData[self.di] = chr(self.table[m] & 0xff)
+                self.finalData[self.di] = self.table[m] & 0xff
                 self.di += 1
             loop = self.decodeloop()
             if loop == 0xffff:
@@ -194,9 +420,14 @@ class YJ1Decoder:
                 n = self.trans_topflag_to(0, self.flags, self.flagnum, t)
                 self.flags = (self.flags << t) & 0xffffffff
                 self.flagnum -= t
-                for _ in xrange(numbytes):
-                    self.finalData[self.di] = self.finalData[self.di - n]
-                    self.di += 1
+                if numbytes <= n <= self.di and self.di + numbytes <= self.orgLen:
+                    # 不重叠的回溯直接复制切片
+                    self.finalData[self.di:self.di + numbytes] = self.finalData[self.di - n:self.di - n + numbytes]
+                    self.di += numbytes
+                else:
+                    for _ in xrange(numbytes):
+                        self.finalData[self.di] = self.finalData[self.di - n]
+                        self.di += 1
 
     def readShort(self, si=None):
         if si:
@@ -321,126 +552,263 @@ class YJ1Decoder:
             offset += 2
 
 
-class PAL_Inventory:
-    # inventory[0] => image in ball.mkf [0..232]
-    # inventory[1] => price
-    # inventory[2] => script when use
-    # inventory[3] => script when equip
-    # inventory[4] => script when throw
-    # inventory[5] => property
-
-    inventory_property_name = [
-        '可使用', '可装备', '可投掷', '消耗品', '全体效果', '可典当',
-        '李逍遥', '赵灵儿', '林月如', '巫后', '阿奴', '盖罗娇'
-    ]
-    beginAddressInSSS2 = 0x3D
-    def __init__(self, data, objId):
-        self.data = data
-        self.objId = objId
-        self.property = [0]*12
-
-    def set_image_id(self, nid):
-        self.data[0] = nid & 0xFFFF
-
-    def get_image_id(self):
-        return self.data[0]
-
-    def set_price(self, price):
-        self.data[1] = price & 0xFFFF
-
-    def get_price(self):
-        return self.data[1]
-
-    def set_script_use(self, sid):
-        self.data[2] = sid & 0xFFFF
-
-    def get_script_use(self):
-        return self.data[2]
-
-    def set_script_equip(self, sid):
-        self.data[3] = sid & 0xFFFF
-
-    def get_script_equip(self):
-        return self.data[3]
-
-    def set_script_throw(self, sid):
-        self.data[4] = sid & 0xFFFF
-
-    def get_script_throw(self):
-        return self.data[4]
-
-    def init_property(self):
-        for j in xrange(0, 12):
-            self.property[j] = self.data[5] & (1 << j)
+class YJ1TableDecoder:
+    """
+    查表版的YJ_1解码器，输出与YJ1Decoder.decode逐字节一致
 
-    def set_property(self, prop, value):
-        self.property[prop] = value & 1
-        for j in xrange(0, 12):
-            self.data[5] |= self.property[j] << j
+    YJ1Decoder每读一位都要调用trans_topflag_to/get_topflag，这里改为：
+    1. 每个block的位流一次性解成16位word的tuple，用一个整数做位缓冲，按需补充
+    2. 对Huffman树（table/assist）预先生成LUT_BITS位的查找表，一次查表可以
+       走完一个码字（或者走LUT_BITS层到达一个中间节点）
+    3. 输出写入预先分配好的bytearray，字面串和不重叠的回溯复制都用切片完成
+    """
 
-def get_chunks(l, n):
-    llen = len(l)
-    return [l[i:i+n] for i in xrange(0, llen, n)]
+    LUT_BITS = 8
+    # 输出格式或者行为有变化时需要修改，DiskChunkCache用它区分不同版本的解压结果
+    VERSION = 'yj1table-1'
 
-class WordData:
     def __init__(self):
-        with open('WORD.DAT', mode='rb') as file: # b is important -> binary
-            fileContent = file.read()
-            theBuffer = get_chunks(fileContent, 10)
-            self.words = [ss.strip().decode('big5').encode('utf8') for ss in theBuffer]
-
-    def get_object_name(self, objId):
-        return self.words[objId]
-
-    def set_object_name(self, objId, name):
-        self.words[objId] = name.encode('utf8')
-
-    # def words_to_str(self):
-    #     for ss in self.words:
-    #         if len(ss) != 5 :
-
-
-    def write_to_file(self, filename):
         pass
-        # with open(filename, mode='wb') as file:
-            # file.write(unicode(self.buf,'utf-8').encode('big5', 'strict'))
-
 
-            # self.buf = fileContent.decode("big5", "strict").encode('ascii', 'strict')
-            #self.buf = self.buf + "玉帝模式  "
-        # load word in to array
-        # self.words = get_chunks(list(self.buf), 10)
-
-    # def write_to_word(self):
-        # with open('WORDEX.DAT', mode='wb') as file:
-            #file.write(unicode(self.buf,'utf-8').encode('big5', 'strict'))
+    def build_lut(self, table, assist, state):
+        '''
+        生成从节点state出发、读取LUT_BITS位的查找表，表项含义：
+        >= 0x100：到达叶子，高位为消耗的位数，低8位为解出的字节
+        < 0：LUT_BITS位读完仍在树中间，~entry为下一次查表的起点
+        0：非法码字（指向了table之外）
+        '''
+        k = self.LUT_BITS
+        lut = [0] * (1 << k)
+        size = len(table)
+        stack = [(state, 0, 0)]
+        while stack:
+            v, code, depth = stack.pop()
+            depth += 1
+            for bit in (0, 1):
+                m = (v << 1) | bit
+                c = (code << 1) | bit
+                if m >= size:
+                    continue
+                if not assist[m]:
+                    shift = k - depth
+                    lo = c << shift
+                    lut[lo:lo + (1 << shift)] = [(depth << 8) | table[m]] * (1 << shift)
+                elif depth == k:
+                    lut[c] = ~table[m]
+                else:
+                    stack.append((table[m], c, depth))
+        return lut
 
-class App:
-    def __init__(self):
-        self.sss = MKFDecoder(path='./SSS.MKF', data=None)
-        self.arrayH = array.array('H', self.sss.read(2))
-        # self.arrayH.fromstring(self.sss.read(2))
-        self.allObjDef = get_chunks(self.arrayH, 6)
-        self.inventories = [PAL_Inventory(obj) for obj in self.allObjDef[0x3D:0x127]]
-        # self.magics = [PAL_Magic(obj) for obj in self.allObjDef[0x127:0x18E]]
-        # self.monsters = [PAL_Monster(obj) for obj in self.allObjDef[0x18E:0x227]]
-        # self.poisons = [PAL_Poison(obj) for obj in self.allObjDef[0x227:0x235]
-
-    def save_inventory(self, filename):
-        # TODO - finish the correct saving procedure
-        newFileByteArray = bytearray(list(chain.from_iterable(self.allObjDef)))
-        newFile = open ("./sss2.bin", "wb")
-        newFile.write(newFileByteArray)
-        newFile.close()
-
-def unpack_mkf(mkfname):
-    mkf = MKFDecoder(path= ('%s.mkf' % mkfname))
-    if not os.path.exists('./%s'%mkfname):
-        os.makedirs('./%s'%mkfname)
-    for i in xrange(mkf.getFileCount()):
-        arrayH = array.array('H', mkf.read(i))
-        newFileByteArray = arrayH
-        with open('./%s/%s_%d.bin'%(mkfname, mkfname, i), 'wb') as file:
-            file.write(newFileByteArray)
-
-unpack_mkf('sss')
+    def decode(self, data):
+        '''
+        解析YJ_1格式的压缩文件，如果文件不是YJ_1格式或者文件为空，则直接返回原始数据
+        '''
+        if not data:
+            print 'no data to decode'
+            return ''
+        dataLen = len(data)
+        if data[:4] != 'YJ_1':
+            print 'not YJ_1 data'
+            return data
+        orgLen, = unpack_from('I', data, 4)
+        blocks, = unpack_from('<H', data, 0xC)
+        treeLen = ord(data[0xF]) * 2
+        table = bytearray(data[0x10:0x10 + treeLen])
+        flagCount = (treeLen + 15) >> 4
+        flagWords = unpack_from('<%dH' % flagCount, data, 0x10 + treeLen)
+        assist = [(flagWords[i >> 4] >> (15 - (i & 15))) & 1 for i in xrange(treeLen)]
+
+        luts = {0: self.build_lut(table, assist, 0)}
+        out = bytearray(orgLen)
+        src = 0x10 + treeLen + flagCount * 2
+        dst = 0
+        for _ in xrange(blocks):
+            ext_length, pack_length = unpack_from('<HH', data, src)
+            if not pack_length:
+                if src + 4 + ext_length > dataLen or dst + ext_length > orgLen:
+                    raise IndexError('YJ_1 stored block out of range')
+                out[dst:dst + ext_length] = buffer(data, src + 4, ext_length)
+                src += ext_length + 4
+            else:
+                self.decode_block(data, src, pack_length, out, dst, table, assist, luts)
+                src += pack_length
+            dst += ext_length
+        return str(out)
+
+    def decode_block(self, data, src, pack_length, out, di, table, assist, luts):
+        keywords = bytearray(data[src + 4:src + 24])
+        repeats = unpack_from('<4H', data, src + 4)
+        key_0x12 = keywords[0x12]
+        key_0x13 = keywords[0x13]
+        # 位流按16位little-end word读取，越界部分与YJ1Decoder.readShort一样视为0
+        nwords = max((min(pack_length, len(data) - src) - 24) >> 1, 0)
+        words = unpack_from('<%dH' % nwords, data, src + 24) + (0,) * 4
+
+        k = self.LUT_BITS
+        kmask = (1 << k) - 1
+        root = luts[0]
+        outLen = len(out)
+        buf = 0
+        cnt = 0
+        wp = 0
+        while True:
+            # ---- decodeloop：字面字节个数 ----
+            if cnt < 32:
+                buf = ((buf & ((1 << cnt) - 1)) << 32) | (words[wp] << 16) | words[wp + 1]
+                wp += 2
+                cnt += 32
+            if (buf >> (cnt - 1)) & 1:
+                cnt -= 1
+                loop = key_0x12
+            else:
+                t = (buf >> (cnt - 3)) & 3
+                cnt -= 3
+                loop = key_0x13
+                if t:
+                    t = keywords[t + 0xE]
+                    loop = (buf >> (cnt - t)) & ((1 << t) - 1)
+                    cnt -= t
+                    if loop == 0:
+                        return
+            for _ in xrange(loop):
+                if cnt < 32:
+                    buf = ((buf & ((1 << cnt) - 1)) << 32) | (words[wp] << 16) | words[wp + 1]
+                    wp += 2
+                    cnt += 32
+                e = root[(buf >> (cnt - k)) & kmask]
+                while e < 0:
+                    cnt -= k
+                    if cnt < 32:
+                        buf = ((buf & ((1 << cnt) - 1)) << 32) | (words[wp] << 16) | words[wp + 1]
+                        wp += 2
+                        cnt += 32
+                    state = ~e
+                    lut = luts.get(state)
+                    if lut is None:
+                        lut = luts[state] = self.build_lut(table, assist, state)
+                    e = lut[(buf >> (cnt - k)) & kmask]
+                if e < 0x100:
+                    raise IndexError('invalid YJ_1 huffman code')
+                cnt -= e >> 8
+                out[di] = e & 0xff
+                di += 1
+
+            # ---- decodeloop：回溯复制的次数 ----
+            if cnt < 32:
+                buf = ((buf & ((1 << cnt) - 1)) << 32) | (words[wp] << 16) | words[wp + 1]
+                wp += 2
+                cnt += 32
+            if (buf >> (cnt - 1)) & 1:
+                cnt -= 1
+                loop = key_0x12
+            else:
+                t = (buf >> (cnt - 3)) & 3
+                cnt -= 3
+                loop = key_0x13
+                if t:
+                    t = keywords[t + 0xE]
+                    loop = (buf >> (cnt - t)) & ((1 << t) - 1)
+                    cnt -= t
+                    if loop == 0:
+                        return
+            for _ in xrange(loop):
+                if cnt < 32:
+                    buf = ((buf & ((1 << cnt) - 1)) << 32) | (words[wp] << 16) | words[wp + 1]
+                    wp += 2
+                    cnt += 32
+                # decodenumbytes
+                t = (buf >> (cnt - 3)) & 7
+                if t < 2:
+                    cnt -= 2
+                    numbytes = repeats[0]
+                elif not t & 1:
+                    cnt -= 3
+                    numbytes = repeats[t >> 1]
+                else:
+                    cnt -= 3
+                    t = keywords[(t >> 1) + 0xB]
+                    numbytes = (buf >> (cnt - t)) & ((1 << t) - 1)
+                    cnt -= t
+                if cnt < 32:
+                    buf = ((buf & ((1 << cnt) - 1)) << 32) | (words[wp] << 16) | words[wp + 1]
+                    wp += 2
+                    cnt += 32
+                # 回溯距离
+                t = keywords[((buf >> (cnt - 2)) & 3) + 8]
+                cnt -= 2
+                n = (buf >> (cnt - t)) & ((1 << t) - 1)
+                cnt -= t
+
+                end = di + numbytes
+                if end > outLen:
+                    raise IndexError('YJ_1 data overruns the output buffer')
+                if 0 < n <= di:
+                    if n >= numbytes:
+                        out[di:end] = out[di - n:end - n]
+                    else:
+                        # 重叠复制，等价于按字节复制一个周期为n的串
+                        out[di:end] = (out[di - n:di] * (numbytes // n + 1))[:numbytes]
+                    di = end
+                else:
+                    # 非法距离，保持与YJ1Decoder完全一致的逐字节行为
+                    while di < end:
+                        out[di] = out[di - n]
+                        di += 1
+
+
+# 每个worker进程各自用mmap打开MKF文件，主进程只传递子文件编号，不传递数据
+_worker_mkf = None
+
+def _init_unpack_worker(path, cache_dir):
+    global _worker_mkf
+    disk_cache = DiskChunkCache(cache_dir) if cache_dir else None
+    _worker_mkf = MKFDecoder(path=path, use_mmap=True, disk_cache=disk_cache)
+
+def _unpack_worker(index):
+    return index, _worker_mkf.decompress(index)
+
+def unpack_mkf(mkfname, jobs=1, outdir=None, cache_dir=None):
+    '''
+    把MKF文件中的所有子文件解压到outdir/<name>_<i>.bin
+    mkfname可以是'sss'这样的名字（对应sss.mkf），也可以是文件路径
+    jobs > 1时用进程池并行解压，结果仍然按编号顺序写出
+    cache_dir不为None时使用该目录下的DiskChunkCache
+    '''
+    path = mkfname if os.path.splitext(mkfname)[1] else '%s.mkf' % mkfname
+    name = os.path.splitext(os.path.basename(path))[0]
+    if outdir is None:
+        outdir = './%s' % name
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    disk_cache = DiskChunkCache(cache_dir) if cache_dir else None
+    mkf = MKFDecoder(path=path, use_mmap=True, disk_cache=disk_cache)
+    count = mkf.getFileCount()
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, _init_unpack_worker, (path, cache_dir))
+        chunks = pool.imap(_unpack_worker, xrange(count), chunksize=max(1, count // (jobs * 8)))
+    else:
+        pool = None
+        chunks = ((i, data) for i, _, data in mkf.iter_chunks())
+    try:
+        for i, data in chunks:
+            with open(os.path.join(outdir, '%s_%d.bin' % (name, i)), 'wb') as file:
+                file.write(data)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        mkf.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='unpack every chunk of MKF archives')
+    parser.add_argument('archives', nargs='+', help='archive names (sss) or paths (SSS.MKF)')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('-o', '--outdir', help='output directory (default: ./<name>)')
+    parser.add_argument('--cache-dir', default=DiskChunkCache.DEFAULT_DIR,
+                        help='decompression cache directory (default: %(default)s)')
+    parser.add_argument('--no-cache', dest='cache_dir', action='store_const', const=None,
+                        help='do not use the decompression cache')
+    args = parser.parse_args()
+    for archive in args.archives:
+        unpack_mkf(archive, args.jobs, args.outdir, args.cache_dir)
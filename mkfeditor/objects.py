@@ -0,0 +1,148 @@
+# coding=utf-8
+"""
+SSS.MKF第2个子文件（物件定义表），格式与global.h中的OBJECT一致：每个物件6个WORD，
+按物件编号的范围分别是道具、法术、敌人、毒（与OBJECT_ITEM/OBJECT_MAGIC/OBJECT_ENEMY/OBJECT_POISON对应）
+
+ObjectTable把整个表放在一个bytearray中，raw和各类物件的结构化数组都是它的视图（numpy.frombuffer），
+通过任何一个视图修改都直接写回同一块内存，tostring得到的就是修改后的子文件
+"""
+import numpy as np
+
+OBJECT_SIZE = 12
+
+# 各类物件在表中的编号范围 [start, stop)
+ITEM_RANGE = (0x3D, 0x127)
+MAGIC_RANGE = (0x127, 0x18E)
+ENEMY_RANGE = (0x18E, 0x227)
+POISON_RANGE = (0x227, 0x235)
+
+# ITEMFLAG
+kItemFlagUsable = 1 << 0
+kItemFlagEquipable = 1 << 1
+kItemFlagThrowable = 1 << 2
+kItemFlagConsuming = 1 << 3
+kItemFlagApplyToAll = 1 << 4
+kItemFlagSellable = 1 << 5
+kItemFlagEquipableByPlayerRole_First = 1 << 6
+
+# MAGICFLAG
+kMagicFlagUsableOutsideBattle = 1 << 0
+kMagicFlagUsableInBattle = 1 << 1
+kMagicFlagUsableToEnemy = 1 << 3
+kMagicFlagApplyToAll = 1 << 4
+
+
+def _object_dtype(fields):
+    return np.dtype({'names': [name for name, offset in fields],
+                     'formats': ['<u2'] * len(fields),
+                     'offsets': [offset * 2 for name, offset in fields],
+                     'itemsize': OBJECT_SIZE})
+
+OBJECT_ITEM_DTYPE = _object_dtype([
+    ('wBitmap', 0), ('wPrice', 1), ('wScriptOnUse', 2), ('wScriptOnEquip', 3),
+    ('wScriptOnThrow', 4), ('wFlags', 5)])
+
+OBJECT_MAGIC_DTYPE = _object_dtype([
+    ('wMagicNumber', 0), ('wScriptOnSuccess', 2), ('wScriptOnUse', 3), ('wFlags', 5)])
+
+OBJECT_ENEMY_DTYPE = _object_dtype([
+    ('wEnemyID', 0), ('wResistanceToSorcery', 1), ('wScriptOnTurnStart', 2),
+    ('wScriptOnBattleEnd', 3), ('wScriptOnReady', 4)])
+
+OBJECT_POISON_DTYPE = _object_dtype([
+    ('wPoisonLevel', 0), ('wColor', 1), ('wPlayerScript', 2), ('wEnemyScript', 4)])
+
+
+class ObjectTable:
+    """
+    raw为 (物件数, 6) 的uint16数组，items/magics/enemies/poisons为对应范围的结构化数组，
+    数组下标0对应范围中的第一个物件
+    """
+
+    def __init__(self, data):
+        self.buffer = bytearray(data)
+        self.count = len(self.buffer) // OBJECT_SIZE
+        self.raw = np.frombuffer(self.buffer, dtype='<u2', count=self.count * 6).reshape(self.count, 6)
+        self.items = self.view(ITEM_RANGE, OBJECT_ITEM_DTYPE)
+        self.magics = self.view(MAGIC_RANGE, OBJECT_MAGIC_DTYPE)
+        self.enemies = self.view(ENEMY_RANGE, OBJECT_ENEMY_DTYPE)
+        self.poisons = self.view(POISON_RANGE, OBJECT_POISON_DTYPE)
+
+    def view(self, objRange, dtype):
+        '''
+        返回物件编号范围objRange内的物件按dtype解释的数组（不复制）
+        表比范围短时只包含实际存在的部分
+        '''
+        start, stop = objRange
+        start = min(start, self.count)
+        stop = min(stop, self.count)
+        return np.frombuffer(self.buffer, dtype=dtype, count=stop - start, offset=start * OBJECT_SIZE)
+
+    def getObjectCount(self):
+        return self.count
+
+    def tostring(self):
+        return str(self.buffer)
+
+
+def object_ids(objRange, mask):
+    '''
+    把某类物件数组上的布尔条件换成物件编号
+    例如 object_ids(ITEM_RANGE, table.items['wPrice'] > 1000)
+    '''
+    return np.flatnonzero(mask) + objRange[0]
+
+
+def equipable_by(items, role):
+    '''
+    道具数组中可以被第role个角色（0为李逍遥）装备的道具的布尔条件
+    '''
+    return (items['wFlags'] & (kItemFlagEquipableByPlayerRole_First << role)) != 0
+
+
+class FlagColumn:
+    """
+    某类物件的wFlags列（结构化数组字段的视图）上的批量位操作，只处理低bits位，其余位保持不变
+    rows可以是布尔数组、下标数组或切片
+    """
+
+    def __init__(self, column, bits):
+        self.column = column
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.weights = (1 << np.arange(bits)).astype(np.uint16)
+
+    def matrix(self):
+        '''
+        返回 (物件数, bits) 的布尔矩阵，第j列为第j位
+        '''
+        return (self.column[:, np.newaxis] & self.weights) != 0
+
+    def assign(self, matrix, rows=slice(None)):
+        '''
+        把布尔矩阵写回rows对应的物件，矩阵中为False的位会被清除
+        '''
+        packed = np.dot(np.asarray(matrix, dtype=np.uint16), self.weights).astype(np.uint16)
+        self.column[rows] = (self.column[rows] & ~np.uint16(self.mask)) | packed
+
+    def set(self, rows, flags):
+        self.column[rows] |= np.uint16(flags & self.mask)
+
+    def clear(self, rows, flags):
+        self.column[rows] &= ~np.uint16(flags & self.mask)
+
+    def has(self, flags):
+        '''
+        返回所有物件是否同时具有flags中所有位的布尔数组
+        '''
+        return (self.column & flags) == flags
+
+
+def item_flags(table):
+    '''
+    道具的12个标志位（ITEMFLAG，后6位为各角色能否装备）
+    例如把所有消耗品设为可典当：
+        flags = item_flags(table)
+        flags.set(flags.has(kItemFlagConsuming), kItemFlagSellable)
+    '''
+    return FlagColumn(table.items['wFlags'], 12)
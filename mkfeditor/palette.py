@@ -0,0 +1,52 @@
+# coding=utf-8
+"""
+pat.mkf调色板，格式与palette.c中的PAL_GetPalette一致：
+每个子文件为256 * 3字节的6位VGA调色板（r, g, b各0~63），长度超过256 * 3时，
+后面256 * 3字节为夜晚调色板
+"""
+import numpy as np
+
+
+class Palette:
+    """
+    一次读入pat.mkf中的所有调色板：colors的形状为 (调色板个数, 2, 256, 3)，
+    第二维0为白天、1为夜晚（没有夜晚调色板的与白天相同），值已经换算成8位
+    """
+
+    def __init__(self, mkf):
+        count = mkf.getFileCount()
+        raw = np.zeros((count, 2 * 256 * 3), dtype=np.uint8)
+        self.hasNight = np.zeros(count, dtype=np.bool_)
+        for index, size, data in mkf.iter_chunks(decompress=False):
+            data = data[:2 * 256 * 3]
+            raw[index, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+            self.hasNight[index] = size > 256 * 3
+        raw = raw.reshape(count, 2, 256, 3)
+        raw[~self.hasNight, 1] = raw[~self.hasNight, 0]
+        self.colors = (raw << 2).astype(np.uint8)
+        # (palette_id, night) -> 颜色查找表
+        self.luts = {}
+
+    def getPaletteCount(self):
+        return len(self.colors)
+
+    def get(self, palette_id, night=False):
+        '''
+        返回 (256, 3) 的uint8颜色表，与PAL_GetPalette相同
+        '''
+        key = (palette_id, bool(night))
+        lut = self.luts.get(key)
+        if lut is None:
+            lut = self.luts[key] = np.ascontiguousarray(self.colors[palette_id, 1 if night else 0])
+        return lut
+
+    def apply(self, indexed_frames, palette_id, night=False, opaque=None):
+        '''
+        把任意形状的调色板索引数组（如sprite.decode_frames得到的 (帧数, 高, 宽)）转换成RGB，
+        结果形状为 indexed_frames.shape + (3,)；给出opaque时转换成RGBA，透明像素的alpha为0
+        '''
+        rgb = np.take(self.get(palette_id, night), indexed_frames, axis=0)
+        if opaque is None:
+            return rgb
+        alpha = np.where(opaque, np.uint8(255), np.uint8(0))
+        return np.concatenate((rgb, alpha[..., np.newaxis]), axis=-1)
@@ -0,0 +1,229 @@
+# coding=utf-8
+"""
+地图（map.mkf + gop.mkf），格式与map.c中的PAL_LoadMap一致：
+    map.mkf的第n个子文件YJ_1压缩，解压后为 DWORD Tiles[128][64][2]
+    gop.mkf的第n个子文件为未压缩的sprite，每一帧是一个32 * 15的菱形图块（RLE位图）
+
+每个DWORD的含义（见PAL_MapGetTileBitmap/PAL_MapTileIsBlocked/PAL_MapGetTileHeight）：
+    bit 0~7, 12     底层图块编号
+    bit 8~11        底层高度
+    bit 13          不可通行
+    bit 16~23, 28   上层图块编号 + 1，0表示没有上层图块
+    bit 24~27       上层高度
+
+画面坐标与PAL_MapBlitToSurface相同：第y行第h半行第x列的图块左上角在
+(x * 32 + h * 16 - 16, y * 16 + h * 8 - 8)，这里整体平移(16, 8)使全图从(0, 0)开始
+"""
+import numpy as np
+
+from mkf_index import SpriteIndex
+from sprite import decode_frames
+
+MAP_WIDTH = 64
+MAP_HEIGHT = 128
+TILE_WIDTH = 32
+TILE_HEIGHT = 16
+
+# 全图的像素大小
+OVERVIEW_WIDTH = MAP_WIDTH * TILE_WIDTH + TILE_WIDTH // 2
+OVERVIEW_HEIGHT = MAP_HEIGHT * TILE_HEIGHT + TILE_HEIGHT // 2
+
+TILE_DTYPE = np.dtype([
+    ('bottom', np.int16),
+    ('bottomHeight', np.uint8),
+    ('top', np.int16),              # 上层图块编号，-1表示没有
+    ('topHeight', np.uint8),
+    ('blocked', np.bool_),
+])
+
+
+def decode_tiles(data):
+    '''
+    把解压后的Tiles转换成形状为 (128, 64, 2) 的TILE_DTYPE数组，数据不足时补0
+    '''
+    size = MAP_HEIGHT * MAP_WIDTH * 2 * 4
+    if len(data) < size:
+        data = str(data) + '\x00' * (size - len(data))
+    d = np.frombuffer(data, dtype='<u4', count=size // 4).reshape(MAP_HEIGHT, MAP_WIDTH, 2)
+    tiles = np.empty(d.shape, dtype=TILE_DTYPE)
+    tiles['bottom'] = (d & 0xFF) | ((d >> 4) & 0x100)
+    tiles['bottomHeight'] = (d >> 8) & 0xF
+    hi = d >> 16
+    tiles['top'] = ((hi & 0xFF) | ((hi >> 4) & 0x100)).astype(np.int16) - 1
+    tiles['topHeight'] = (hi >> 8) & 0xF
+    tiles['blocked'] = (d & 0x2000) != 0
+    return tiles
+
+
+class TileAtlas:
+    """
+    gop.mkf一个子文件的所有图块，解码到同一个数组里：
+    pixels/opaque的形状为 (图块数 + 1, 16, 32)，最后一个是全透明的空图块，
+    不存在的图块编号都映射到它上面
+    """
+
+    def __init__(self, index, chunk):
+        count = len(index.offsets(chunk))
+        pixels, opaque, sizes = decode_frames([index.frame(chunk, n) for n in xrange(count)])
+        self.pixels = np.zeros((count + 1, TILE_HEIGHT, TILE_WIDTH), dtype=np.uint8)
+        self.opaque = np.zeros((count + 1, TILE_HEIGHT, TILE_WIDTH), dtype=np.bool_)
+        h = min(pixels.shape[1], TILE_HEIGHT)
+        w = min(pixels.shape[2], TILE_WIDTH)
+        self.pixels[:count, :h, :w] = pixels[:, :h, :w]
+        self.opaque[:count, :h, :w] = opaque[:, :h, :w]
+        self.sizes = sizes
+        self.count = count
+
+    def lookup(self, frames):
+        '''
+        把图块编号数组换成atlas中的下标，越界的编号换成空图块
+        '''
+        frames = np.asarray(frames, dtype=np.int64)
+        return np.where((frames >= 0) & (frames < self.count), frames, self.count)
+
+
+class MapLoader:
+    """
+    map.mkf/gop.mkf，mapMkf和gopMkf为对应的MKFDecoder
+    图块、atlas和渲染出的全图按地图编号缓存，切换地图时不需要重新解码
+    """
+
+    def __init__(self, mapMkf, gopMkf):
+        self.mapMkf = mapMkf
+        self.gopMkf = gopMkf
+        self.gopIndex = SpriteIndex(gopMkf)
+        self.tiles = {}
+        self.atlases = {}
+        # (map_num, layer) -> (pixels, opaque)
+        self.layers = {}
+        self.grid = None
+
+    def getMapCount(self):
+        return min(self.mapMkf.getFileCount(), self.gopMkf.getFileCount())
+
+    def check(self, map_num):
+        # 与PAL_LoadMap相同，地图0不存在
+        if map_num <= 0 or map_num >= self.getMapCount():
+            raise IndexError('map %d does not exist' % map_num)
+
+    def get_tiles(self, map_num):
+        '''
+        返回第map_num个地图的图块数组（TILE_DTYPE，形状为 (128, 64, 2)）
+        '''
+        tiles = self.tiles.get(map_num)
+        if tiles is None:
+            self.check(map_num)
+            tiles = self.tiles[map_num] = decode_tiles(self.mapMkf.decompress(map_num))
+        return tiles
+
+    def get_atlas(self, map_num):
+        atlas = self.atlases.get(map_num)
+        if atlas is None:
+            self.check(map_num)
+            atlas = self.atlases[map_num] = TileAtlas(self.gopIndex, map_num)
+        return atlas
+
+    def _pixel_grid(self):
+        '''
+        全图每个像素在两个半行中分别落在哪个图块的哪个位置，所有地图共用
+        行只和y有关、列只和x有关，所以图块坐标只需要按行、按列各算一次
+        '''
+        if self.grid is None:
+            py = np.arange(OVERVIEW_HEIGHT)
+            px = np.arange(OVERVIEW_WIDTH)
+            grid = []
+            for h in (0, 1):
+                ty, ly = np.divmod(py - h * TILE_HEIGHT // 2, TILE_HEIGHT)
+                tx, lx = np.divmod(px - h * TILE_WIDTH // 2, TILE_WIDTH)
+                insideY = (ty >= 0) & (ty < MAP_HEIGHT)
+                insideX = (tx >= 0) & (tx < MAP_WIDTH)
+                # 图块内的像素下标
+                local = (ly[:, np.newaxis] * TILE_WIDTH + lx).astype(np.int32)
+                grid.append((np.clip(ty, 0, MAP_HEIGHT - 1), np.clip(tx, 0, MAP_WIDTH - 1),
+                             insideY[:, np.newaxis] & insideX, local,
+                             # PAL_MapBlitToSurface中的绘制顺序
+                             (ty * 2 + h)[:, np.newaxis]))
+            self.grid = grid
+        return self.grid
+
+    def render_layer(self, map_num, layer):
+        '''
+        渲染整个地图的一层（0为底层，1为上层），返回 (pixels, opaque)，形状为 (OVERVIEW_HEIGHT, OVERVIEW_WIDTH)
+        每个像素最多被两个半行的图块覆盖，直接按下标从atlas中取出两个候选像素，
+        再按PAL_MapBlitToSurface的绘制顺序（先y后h）取后画的不透明像素，不逐个图块绘制
+        '''
+        key = (map_num, layer)
+        result = self.layers.get(key)
+        if result is not None:
+            return result
+        tiles = self.get_tiles(map_num)
+        atlas = self.get_atlas(map_num)
+        frames = atlas.lookup(tiles['top'] if layer else tiles['bottom']).astype(np.int32)
+        fill = atlas.count
+        if not layer:
+            # 底层图块不存在（包括地图范围以外）时用(0, 0, 0)处的图块代替
+            fill = frames[0, 0, 0]
+            frames[frames == atlas.count] = fill
+
+        atlasPixels = atlas.pixels.reshape(-1)
+        atlasOpaque = atlas.opaque.reshape(-1)
+        candidates = []
+        for h, (ty, tx, inside, local, order) in enumerate(self._pixel_grid()):
+            frame = frames[:, :, h][np.ix_(ty, tx)]
+            frame[~inside] = fill
+            pos = frame * (TILE_HEIGHT * TILE_WIDTH) + local
+            candidates.append((atlasPixels[pos], atlasOpaque[pos], order))
+        (p0, o0, k0), (p1, o1, k1) = candidates
+        # 两个候选都不透明时，绘制顺序靠后的覆盖靠前的
+        first = o0 & (~o1 | (k0 > k1))
+        pixels = np.where(first, p0, p1)
+        opaque = o0 | o1
+        pixels[~opaque] = 0
+        result = self.layers[key] = (pixels, opaque)
+        return result
+
+    def render(self, map_num):
+        '''
+        返回底层和上层叠加后的全图 (pixels, opaque)
+        '''
+        bottom, bottomOpaque = self.render_layer(map_num, 0)
+        top, topOpaque = self.render_layer(map_num, 1)
+        return np.where(topOpaque, top, bottom), bottomOpaque | topOpaque
+
+    def clear(self, map_num=None):
+        '''
+        清除缓存，map_num为None时清除所有地图
+        '''
+        if map_num is None:
+            self.tiles.clear()
+            self.atlases.clear()
+            self.layers.clear()
+            return
+        self.tiles.pop(map_num, None)
+        self.atlases.pop(map_num, None)
+        for layer in (0, 1):
+            self.layers.pop((map_num, layer), None)
+
+
+if __name__ == '__main__':
+    import argparse
+    from mkf_unpack import MKFDecoder
+    from palette import Palette
+    from pngwriter import write_indexed_png
+
+    parser = argparse.ArgumentParser(description='render map overview images to PNG')
+    parser.add_argument('map', help='path of MAP.MKF')
+    parser.add_argument('gop', help='path of GOP.MKF')
+    parser.add_argument('pat', help='path of PAT.MKF')
+    parser.add_argument('maps', type=int, nargs='*', help='map numbers, all maps if omitted')
+    parser.add_argument('-o', '--outdir', default='.')
+    parser.add_argument('-p', '--palette', type=int, default=0, help='palette number in PAT.MKF')
+    args = parser.parse_args()
+    with MKFDecoder(path=args.pat) as pat:
+        colors = Palette(pat).get(args.palette)
+    loader = MapLoader(MKFDecoder(path=args.map, use_mmap=True), MKFDecoder(path=args.gop, use_mmap=True))
+    for map_num in args.maps or xrange(1, loader.getMapCount()):
+        pixels, opaque = loader.render(map_num)
+        with open('%s/map_%03d.png' % (args.outdir, map_num), 'wb') as f:
+            write_indexed_png(f, pixels, OVERVIEW_WIDTH, OVERVIEW_HEIGHT, colors)
+        loader.clear(map_num)
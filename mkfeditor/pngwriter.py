@@ -0,0 +1,52 @@
+# coding=utf-8
+"""
+不依赖第三方库的PNG写入，只支持游戏里用到的两种格式：
+    8位调色板图像（color type 3），像素直接用解压出来的调色板索引，不需要先转换成RGB
+    8位RGB/RGBA图像（color type 2/6）
+每一行数据以buffer的形式直接送进zlib，除压缩结果外不复制整幅图像
+"""
+import zlib
+from struct import pack
+
+
+def _chunk(f, tag, data):
+    f.write(pack('>I', len(data)))
+    f.write(tag)
+    f.write(data)
+    f.write(pack('>I', zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+
+
+def _write_rows(f, pixels, height, stride, level):
+    z = zlib.compressobj(level)
+    out = []
+    for y in xrange(height):
+        # 每行前面是过滤类型0（不过滤）
+        out.append(z.compress('\x00'))
+        out.append(z.compress(buffer(pixels, y * stride, stride)))
+    out.append(z.flush())
+    _chunk(f, 'IDAT', ''.join(out))
+
+
+def write_indexed_png(f, pixels, width, height, palette, transparent=None, level=6):
+    '''
+    写8位调色板PNG
+    pixels为 width * height 字节的调色板索引（str/buffer/numpy数组都可以），palette为256 * 3字节的RGB
+    transparent不为None时该索引的颜色写成透明
+    '''
+    f.write('\x89PNG\r\n\x1a\n')
+    _chunk(f, 'IHDR', pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+    _chunk(f, 'PLTE', str(buffer(palette)))
+    if transparent is not None:
+        _chunk(f, 'tRNS', '\xff' * transparent + '\x00')
+    _write_rows(f, pixels, height, width, level)
+    _chunk(f, 'IEND', '')
+
+
+def write_rgb_png(f, pixels, width, height, alpha=False, level=6):
+    '''
+    写8位RGB（alpha为True时为RGBA）PNG，pixels为按行排列的像素数据
+    '''
+    f.write('\x89PNG\r\n\x1a\n')
+    _chunk(f, 'IHDR', pack('>IIBBBBB', width, height, 8, 6 if alpha else 2, 0, 0, 0))
+    _write_rows(f, pixels, height, width * (4 if alpha else 3), level)
+    _chunk(f, 'IEND', '')
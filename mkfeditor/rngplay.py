@@ -0,0 +1,162 @@
+# coding=utf-8
+"""
+rng.mkf动画播放，与rngplay.c中的PAL_RNGBlitToSurface一致
+
+rng动画的每一帧（YJ_1解压后）是对上一帧画面（320 * 200，第0帧之前为全0）的修改，
+由若干指令组成，每条指令以两个像素为单位操作：
+    00, 13          结束
+    02              跳过1对像素
+    03 n            跳过n + 1对像素
+    04 nn           跳过nn + 1对像素（WORD）
+    06 ~ 0a         后面紧跟1 ~ 5对像素
+    0b n            后面紧跟n + 1对像素
+    0c nn           后面紧跟nn + 1对像素
+    0d ~ 10 p       把像素对p重复2 ~ 5次
+    11 n p          把像素对p重复n + 1次
+    12 nn p         把像素对p重复nn + 1次
+其他指令忽略
+
+iter_frames按顺序生成每一帧，整个过程只用一个工作缓冲区；
+每隔checkpoint_interval帧保存一份完整画面，跳到第N帧时从之前最近的检查点开始重放
+"""
+from struct import unpack_from
+
+from mkf_index import RNGIndex
+
+RNG_WIDTH = 320
+RNG_HEIGHT = 200
+RNG_SIZE = RNG_WIDTH * RNG_HEIGHT
+
+
+def blit_frame(surface, data):
+    '''
+    把解压后的一帧data应用到surface（RNG_SIZE字节的bytearray）上
+    超出画面的部分截掉（原版直接写越界）
+    '''
+    data = bytearray(data)
+    end = len(data)
+    ptr = 0
+    dst = 0
+
+    def copy(dst, src, count):
+        # 复制count对像素
+        n = min(count * 2, RNG_SIZE - dst, end - src)
+        if n > 0:
+            surface[dst:dst + n] = data[src:src + n]
+
+    def fill(dst, src, count):
+        # 把src处的像素对重复count次
+        n = min(count * 2, RNG_SIZE - dst)
+        if n > 0:
+            surface[dst:dst + n] = (data[src:src + 2] * count)[:n]
+
+    while ptr < end and dst < RNG_SIZE:
+        op = data[ptr]
+        ptr += 1
+        if op == 0x00 or op == 0x13:
+            break
+        elif op == 0x02:
+            dst += 2
+        elif op == 0x03:
+            dst += (data[ptr] + 1) * 2
+            ptr += 1
+        elif op == 0x04:
+            dst += (unpack_from('<H', data, ptr)[0] + 1) * 2
+            ptr += 2
+        elif 0x06 <= op <= 0x0c:
+            if op == 0x0b:
+                count = data[ptr] + 1
+                ptr += 1
+            elif op == 0x0c:
+                count = unpack_from('<H', data, ptr)[0] + 1
+                ptr += 2
+            else:
+                count = op - 0x05
+            copy(dst, ptr, count)
+            ptr += count * 2
+            dst += count * 2
+        elif 0x0d <= op <= 0x12:
+            if op == 0x11:
+                count = data[ptr] + 1
+                ptr += 1
+            elif op == 0x12:
+                count = unpack_from('<H', data, ptr)[0] + 1
+                ptr += 2
+            else:
+                count = op - 0x0b
+            fill(dst, ptr, count)
+            ptr += 2
+            dst += count * 2
+
+
+class RNGPlayer:
+    """
+    rng.mkf的播放器，mkf为对应的MKFDecoder
+    checkpoints[rng_num]为 {帧号: 该帧播放完后的完整画面(str)}
+    """
+
+    def __init__(self, mkf, checkpoint_interval=32):
+        self.mkf = mkf
+        self.index = RNGIndex(mkf)
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = {}
+
+    def getFrameCount(self, rng_num):
+        return self.index.getFrameCount(rng_num)
+
+    def read_frame(self, rng_num, n):
+        '''
+        返回第rng_num个动画第n帧解压后的指令数据，帧不存在时返回None（与PAL_RNGReadFrame失败相同）
+        逐帧播放时每帧只用一次，所以不经过mkf.cache
+        '''
+        raw = self.index.frame_raw(rng_num, n)
+        if raw is None:
+            return None
+        return self.mkf.decode_raw(raw) if raw[:4] == 'YJ_1' else str(raw)
+
+    def nearest_checkpoint(self, rng_num, n):
+        '''
+        返回第n帧之前（含第n帧）最近的检查点 (帧号, 画面)，没有时返回 (-1, None)
+        '''
+        saved = self.checkpoints.get(rng_num, {})
+        k = n - n % self.checkpoint_interval + self.checkpoint_interval - 1
+        while k >= 0:
+            if k <= n and k in saved:
+                return k, saved[k]
+            k -= self.checkpoint_interval
+        return -1, None
+
+    def iter_frames(self, rng_num, start=0, stop=None):
+        '''
+        依次生成 (帧号, 画面)，从第start帧到第stop - 1帧（stop为None时到最后一帧），
+        画面是同一个bytearray，下一次迭代时会被修改，需要保留时自行复制
+        与PAL_RNGPlay一样，遇到读取失败的帧就停止
+        '''
+        count = self.getFrameCount(rng_num)
+        stop = count if stop is None else min(stop, count)
+        k, saved = self.nearest_checkpoint(rng_num, start - 1)
+        surface = bytearray(saved) if saved is not None else bytearray(RNG_SIZE)
+        checkpoints = self.checkpoints.setdefault(rng_num, {})
+        for n in xrange(k + 1, stop):
+            data = self.read_frame(rng_num, n)
+            if data is None:
+                return
+            blit_frame(surface, data)
+            if n % self.checkpoint_interval == self.checkpoint_interval - 1 and n not in checkpoints:
+                checkpoints[n] = str(surface)
+            if n >= start:
+                yield n, surface
+
+    def frame(self, rng_num, n):
+        '''
+        返回第rng_num个动画播放到第n帧时的画面（str），帧不存在时返回None
+        '''
+        for k, surface in self.iter_frames(rng_num, n, n + 1):
+            return str(surface)
+        return None
+
+    def clear(self, rng_num=None):
+        if rng_num is None:
+            self.checkpoints.clear()
+        else:
+            self.checkpoints.pop(rng_num, None)
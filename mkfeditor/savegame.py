@@ -0,0 +1,220 @@
+# coding=utf-8
+"""
+存档（1.rpg ~ 5.rpg），格式与global.c中的PAL_SaveGame/PAL_LoadGame一致：
+文件开头是SAVEDGAME中rgEventObject以前的部分（固定长度），后面是实际的事件对象，
+个数为 SSS.MKF第0个子文件的大小 / sizeof(EVENTOBJECT)，所以文件长度不固定
+
+SavedGame用np.memmap把文件直接映射成结构化数组，读取时只访问用到的页，writable为True时修改直接写回文件
+aggregate用进程池统计整个目录的存档：道具持有情况、金钱分布、存档时所在场景的分布
+
+用法：python savegame.py 存档目录或文件... [-j 进程数] [-o 结果.json]
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from gamedata import *
+
+SAVEDGAME_DTYPE = np.dtype([
+    ('wSavedTimes', WORD),
+    ('wViewportX', WORD),
+    ('wViewportY', WORD),
+    ('nPartyMember', WORD),
+    ('wNumScene', WORD),
+    ('wPaletteOffset', WORD),
+    ('wPartyDirection', WORD),
+    ('wNumMusic', WORD),
+    ('wNumBattleMusic', WORD),
+    ('wNumBattleField', WORD),
+    ('wScreenWave', WORD),
+    ('wBattleSpeed', WORD),
+    ('wCollectValue', WORD),
+    ('wLayer', WORD),
+    ('wChaseRange', WORD),
+    ('wChasespeedChangeCycles', WORD),
+    ('nFollower', WORD),
+    ('rgwReserved2', (WORD, 3)),
+    ('dwCash', DWORD),
+    ('rgParty', (PARTY_DTYPE, MAX_PLAYABLE_PLAYER_ROLES)),
+    ('rgTrail', (TRAIL_DTYPE, MAX_PLAYABLE_PLAYER_ROLES)),
+    ('Exp', ALLEXPERIENCE_DTYPE),
+    ('PlayerRoles', PLAYERROLES_DTYPE),
+    ('rgPoisonStatus', (POISONSTATUS_DTYPE, (MAX_POISONS, MAX_PLAYABLE_PLAYER_ROLES))),
+    ('rgInventory', (INVENTORY_DTYPE, MAX_INVENTORY)),
+    ('rgScene', (SCENE_DTYPE, MAX_SCENES)),
+    ('rgObject', (OBJECT_DTYPE, MAX_OBJECTS)),
+])
+
+
+class SavedGame:
+    """
+    game为SAVEDGAME（不含事件对象）的记录，eventObjects为事件对象数组，都是文件的映射
+    """
+
+    def __init__(self, path, writable=False):
+        mode = 'r+' if writable else 'r'
+        size = os.path.getsize(path)
+        if size < SAVEDGAME_DTYPE.itemsize:
+            raise ValueError('%s is too short for a saved game' % path)
+        self.path = path
+        self.games = np.memmap(path, dtype=SAVEDGAME_DTYPE, mode=mode, shape=(1,))
+        self.game = self.games[0]
+        count = (size - SAVEDGAME_DTYPE.itemsize) // EVENTOBJECT_DTYPE.itemsize
+        if count:
+            self.eventObjects = np.memmap(path, dtype=EVENTOBJECT_DTYPE, mode=mode,
+                                          offset=SAVEDGAME_DTYPE.itemsize, shape=(count,))
+        else:
+            self.eventObjects = np.zeros(0, dtype=EVENTOBJECT_DTYPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, trace):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self.games = self.game = self.eventObjects = None
+
+    def flush(self):
+        if isinstance(self.games, np.memmap) and self.games.mode == 'r+':
+            self.games.flush()
+            if isinstance(self.eventObjects, np.memmap):
+                self.eventObjects.flush()
+
+    def getCash(self):
+        return int(self.game['dwCash'])
+
+    def getPartyRoles(self):
+        '''
+        返回队伍中各成员的角色编号，与PAL_LoadGame相同，nPartyMember为最大下标
+        '''
+        return self.game['rgParty']['wPlayerRole'][:self.game['nPartyMember'] + 1]
+
+    def getInventory(self):
+        '''
+        返回有效的道具记录（与PAL_CountItem等一样，遇到wItem为0的记录就结束）
+        '''
+        inventory = self.game['rgInventory']
+        empty = np.flatnonzero(inventory['wItem'] == 0)
+        return inventory[:empty[0] if len(empty) else len(inventory)]
+
+
+def find_saves(paths):
+    '''
+    把目录展开成其中的*.rpg文件
+    '''
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result.extend(sorted(glob.glob(os.path.join(path, '*.rpg')) + glob.glob(os.path.join(path, '*.RPG'))))
+        else:
+            result.append(path)
+    return result
+
+
+def _new_summary():
+    return {
+        'saves': 0,
+        'errors': 0,
+        'cash': [],
+        'currentScenes': np.zeros(MAX_SCENES + 1, dtype=np.int64),
+        'itemAmount': np.zeros(MAX_OBJECTS, dtype=np.int64),
+        'itemHolders': np.zeros(MAX_OBJECTS, dtype=np.int64),
+    }
+
+
+def summarize(paths):
+    '''
+    统计一批存档，返回可以用merge合并的部分结果（在worker进程中运行）
+    '''
+    summary = _new_summary()
+    for path in paths:
+        try:
+            save = SavedGame(path)
+        except (ValueError, IOError, OSError):
+            summary['errors'] += 1
+            continue
+        game = save.game
+        summary['saves'] += 1
+        summary['cash'].append(int(game['dwCash']))
+        summary['currentScenes'][min(int(game['wNumScene']), MAX_SCENES)] += 1
+        inventory = save.getInventory()
+        items = inventory['wItem'].astype(np.int64)
+        valid = items < MAX_OBJECTS
+        items = items[valid]
+        summary['itemAmount'] += np.bincount(items, weights=inventory['nAmount'][valid],
+                                             minlength=MAX_OBJECTS).astype(np.int64)
+        summary['itemHolders'] += np.bincount(np.unique(items), minlength=MAX_OBJECTS)
+        save.close()
+    return summary
+
+
+def merge(total, part):
+    total['saves'] += part['saves']
+    total['errors'] += part['errors']
+    total['cash'].extend(part['cash'])
+    for key in ('currentScenes', 'itemAmount', 'itemHolders'):
+        total[key] += part[key]
+    return total
+
+
+def aggregate(paths, jobs=1, batch=64):
+    '''
+    统计所有存档，返回可以直接转换成json的结果：
+        cash            金钱的最小值、最大值、平均值、分位数和直方图
+        currentScenes   {场景编号: 存档时正位于该场景（wNumScene）的存档比例}
+                        这是当前场景的分布，不是到达过各场景的比例：存档中没有记录去过哪些场景
+        items           {道具编号: {'holders': 持有该道具的存档比例, 'amount': 所有存档的总数量}}
+    '''
+    paths = find_saves(paths)
+    batches = [paths[i:i + batch] for i in xrange(0, len(paths), batch)]
+    total = _new_summary()
+    if jobs > 1 and len(batches) > 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for part in pool.imap_unordered(summarize, batches):
+                merge(total, part)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for part in map(summarize, batches):
+            merge(total, part)
+
+    count = total['saves']
+    result = {'saves': count, 'errors': total['errors']}
+    if not count:
+        return result
+    cash = np.array(total['cash'], dtype=np.int64)
+    hist, edges = np.histogram(cash, bins=20)
+    result['cash'] = {
+        'min': int(cash.min()), 'max': int(cash.max()), 'mean': float(cash.mean()),
+        'percentiles': dict((str(p), float(v)) for p, v in zip((10, 25, 50, 75, 90), np.percentile(cash, [10, 25, 50, 75, 90]))),
+        'histogram': {'counts': hist.tolist(), 'edges': edges.tolist()},
+    }
+    result['currentScenes'] = dict((str(s), float(total['currentScenes'][s]) / count)
+                                   for s in np.flatnonzero(total['currentScenes']))
+    result['items'] = dict((str(i), {'holders': float(total['itemHolders'][i]) / count,
+                                     'amount': int(total['itemAmount'][i])})
+                           for i in np.flatnonzero(total['itemHolders']))
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='aggregate statistics over saved games')
+    parser.add_argument('paths', nargs='+', help='.rpg files or directories containing them')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-o', '--output', help='write the result as json to this file')
+    args = parser.parse_args()
+    result = aggregate(args.paths, args.jobs)
+    text = json.dumps(result, indent=1, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print text
@@ -0,0 +1,519 @@
+# coding=utf-8
+"""
+脚本（SSS.MKF第4个子文件）反汇编和交叉引用
+
+脚本表是SCRIPTENTRY的数组（见global.h），每条4个WORD：操作码和3个操作数，
+地址就是数组下标，执行过程见script.c中的PAL_RunTriggerScript/PAL_InterpretInstruction
+
+OPCODES记录每个操作码的名称和各操作数的含义，用于反汇编和建立交叉引用：
+    JUMP        同一段脚本内的跳转目标（条件不满足时继续执行下一条）
+    GOTO        无条件跳转目标
+    CALL        调用另一段脚本
+    SCRIPT      把脚本地址写到事件对象/场景/物件上（以后执行）
+    OBJECT      物件编号（道具、法术、敌人、毒）
+    MESSAGE     对话编号（m.msg）
+    SCENE       场景编号
+
+ScriptIndex在一次线性扫描中建立基本块组成的控制流图，以及
+{地址: 引用它的指令/物件/场景/事件对象} 等反向索引，保存在SSS.MKF所在目录的SCRIPT.IDX中
+"""
+import array
+import cPickle
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+from gamedata import EVENTOBJECT_DTYPE, SCENE_DTYPE
+from objects import ITEM_RANGE, MAGIC_RANGE, ENEMY_RANGE, POISON_RANGE
+
+JUMP = 'jump'
+GOTO = 'goto'
+CALL = 'call'
+SCRIPT = 'script'
+OBJECT = 'object'
+MESSAGE = 'message'
+SCENE = 'scene'
+
+INDEX_NAME = 'SCRIPT.IDX'
+
+# 操作码: (名称, 3个操作数的含义)，只标出会被交叉引用的操作数
+OPCODES = {
+    0x0000: ('end', ()),
+    0x0001: ('end_replace_next', ()),
+    0x0002: ('end_replace', (GOTO,)),
+    0x0003: ('goto', (GOTO,)),
+    0x0004: ('call', (CALL,)),
+    0x0005: ('redraw_screen', ()),
+    0x0006: ('jump_by_rate', (None, JUMP)),
+    0x0007: ('start_battle', (None, JUMP, JUMP)),
+    0x0008: ('replace_next', ()),
+    0x0009: ('wait_frames', ()),
+    0x000A: ('jump_if_no', (JUMP,)),
+    0x000B: ('walk_south', ()),
+    0x000C: ('walk_west', ()),
+    0x000D: ('walk_north', ()),
+    0x000E: ('walk_east', ()),
+    0x000F: ('set_event_direction', ()),
+    0x0010: ('walk_event_to', ()),
+    0x0011: ('walk_event_to_slow', ()),
+    0x0012: ('set_event_pos_relative', ()),
+    0x0013: ('set_event_pos', ()),
+    0x0014: ('set_event_gesture', ()),
+    0x0015: ('set_party_direction', ()),
+    0x0016: ('set_event_direction_gesture', ()),
+    0x0017: ('set_extra_attribute', ()),
+    0x0018: ('equip_item', (None, OBJECT)),
+    0x0019: ('add_attribute', ()),
+    0x001A: ('set_stat', ()),
+    0x001B: ('add_hp', ()),
+    0x001C: ('add_mp', ()),
+    0x001D: ('add_hp_mp', ()),
+    0x001E: ('add_cash', (None, JUMP)),
+    0x001F: ('add_item', (OBJECT,)),
+    0x0020: ('remove_item', (OBJECT, None, JUMP)),
+    0x0021: ('damage_enemy', ()),
+    0x0022: ('revive_player', ()),
+    0x0023: ('remove_equipment', ()),
+    0x0024: ('set_auto_script', (None, SCRIPT)),
+    0x0025: ('set_trigger_script', (None, SCRIPT)),
+    0x0026: ('buy_menu', ()),
+    0x0027: ('sell_menu', ()),
+    0x0028: ('poison_enemy', (None, OBJECT)),
+    0x0029: ('poison_player', (None, OBJECT)),
+    0x002A: ('cure_enemy_poison', (None, OBJECT)),
+    0x002B: ('cure_player_poison', (None, OBJECT)),
+    0x002C: ('cure_poison_by_level', ()),
+    0x002D: ('set_player_status', ()),
+    0x002E: ('set_enemy_status', (None, None, JUMP)),
+    0x002F: ('remove_player_status', ()),
+    0x0030: ('boost_stat', ()),
+    0x0031: ('set_battle_sprite', ()),
+    0x0033: ('collect_enemy', (JUMP,)),
+    0x0034: ('transform_collected', (JUMP,)),
+    0x0035: ('shake_screen', ()),
+    0x0036: ('set_rng', ()),
+    0x0037: ('play_rng', ()),
+    0x0038: ('teleport_out', (JUMP,)),
+    0x0039: ('drain_hp', ()),
+    0x003A: ('flee', (JUMP,)),
+    0x003B: ('dialog_center', ()),
+    0x003C: ('dialog_upper', ()),
+    0x003D: ('dialog_lower', ()),
+    0x003E: ('dialog_window', ()),
+    0x003F: ('ride_event_slow', ()),
+    0x0040: ('set_trigger_mode', ()),
+    0x0041: ('fail', ()),
+    0x0042: ('simulate_magic', (OBJECT,)),
+    0x0043: ('set_music', ()),
+    0x0044: ('ride_event', ()),
+    0x0045: ('set_battle_music', ()),
+    0x0046: ('set_party_pos', ()),
+    0x0047: ('play_sound', ()),
+    0x0049: ('set_event_state', ()),
+    0x004A: ('set_battlefield', ()),
+    0x004B: ('vanish_event', ()),
+    0x004C: ('chase_player', ()),
+    0x004D: ('wait_key', ()),
+    0x004E: ('load_last_save', ()),
+    0x004F: ('fade_to_red', ()),
+    0x0050: ('fade_out', ()),
+    0x0051: ('fade_in', ()),
+    0x0052: ('hide_event', ()),
+    0x0053: ('day_palette', ()),
+    0x0054: ('night_palette', ()),
+    0x0055: ('add_magic', (OBJECT,)),
+    0x0056: ('remove_magic', (OBJECT,)),
+    0x0057: ('magic_damage_by_mp', (OBJECT,)),
+    0x0058: ('jump_if_items_less', (OBJECT, None, JUMP)),
+    0x0059: ('change_scene', (SCENE,)),
+    0x005A: ('halve_player_hp', ()),
+    0x005B: ('halve_enemy_hp', ()),
+    0x005C: ('hide', ()),
+    0x005D: ('jump_if_player_no_poison', (None, JUMP)),
+    0x005E: ('jump_if_enemy_no_poison', (None, JUMP)),
+    0x005F: ('kill_player', ()),
+    0x0060: ('kill_enemy', ()),
+    0x0061: ('jump_if_not_poisoned', (JUMP,)),
+    0x0062: ('pause_chasing', ()),
+    0x0063: ('speed_up_chasing', ()),
+    0x0064: ('jump_if_enemy_hp_above', (None, JUMP)),
+    0x0065: ('set_player_sprite', ()),
+    0x0066: ('throw_weapon', ()),
+    0x0067: ('enemy_use_magic', (OBJECT,)),
+    0x0068: ('jump_if_enemy_turn', (JUMP,)),
+    0x0069: ('enemy_escape', ()),
+    0x006A: ('steal', ()),
+    0x006B: ('blow_away_enemies', ()),
+    0x006C: ('walk_npc_step', ()),
+    0x006D: ('set_scene_scripts', (SCENE, SCRIPT, SCRIPT)),
+    0x006E: ('move_party_step', ()),
+    0x006F: ('sync_event_state', ()),
+    0x0070: ('walk_party_to', ()),
+    0x0071: ('wave_screen', ()),
+    0x0073: ('fade_to_scene', ()),
+    0x0074: ('jump_if_not_all_full_hp', (JUMP,)),
+    0x0075: ('set_party', ()),
+    0x0076: ('show_fbp', ()),
+    0x0077: ('stop_music', ()),
+    0x0078: ('nop_0078', ()),
+    0x0079: ('jump_if_player_in_party', (None, JUMP)),
+    0x007A: ('walk_party_to_fast', ()),
+    0x007B: ('walk_party_to_fastest', ()),
+    0x007C: ('walk_event_to_fast', ()),
+    0x007D: ('move_event', ()),
+    0x007E: ('set_event_layer', ()),
+    0x007F: ('move_viewport', ()),
+    0x0080: ('toggle_palette', ()),
+    0x0081: ('jump_if_not_facing', (None, None, JUMP)),
+    0x0082: ('walk_event_to_faster', ()),
+    0x0083: ('jump_if_not_in_zone', (None, None, JUMP)),
+    0x0084: ('place_item_event', (None, None, JUMP)),
+    0x0085: ('delay', ()),
+    0x0086: ('jump_if_not_equipped', (OBJECT, None, JUMP)),
+    0x0087: ('animate_event', ()),
+    0x0088: ('magic_damage_by_cash', (OBJECT,)),
+    0x0089: ('set_battle_result', ()),
+    0x008A: ('enable_auto_battle', ()),
+    0x008B: ('set_palette', ()),
+    0x008C: ('fade_color', ()),
+    0x008D: ('level_up', ()),
+    0x008E: ('restore_screen', ()),
+    0x008F: ('halve_cash', ()),
+    0x0090: ('set_object_script', (OBJECT, SCRIPT)),
+    0x0091: ('jump_if_enemy_not_alone', (JUMP,)),
+    0x0092: ('show_casting', ()),
+    0x0093: ('fade_scene', ()),
+    0x0094: ('jump_if_event_state', (None, None, JUMP)),
+    0x0095: ('jump_if_scene', (SCENE, JUMP)),
+    0x0096: ('show_ending', ()),
+    0x0097: ('ride_event_fast', ()),
+    0x0098: ('set_follower', ()),
+    0x0099: ('set_scene_map', (SCENE,)),
+    0x009A: ('set_events_state', ()),
+    0x009B: ('fade_to_current_scene', ()),
+    0x009C: ('enemy_duplicate', (None, JUMP)),
+    0x009E: ('enemy_summon', (None, None, JUMP)),
+    0x009F: ('enemy_transform', (OBJECT,)),
+    0x00A0: ('quit', ()),
+    0x00A1: ('gather_party', ()),
+    0x00A2: ('jump_random', ()),
+    0x00A3: ('play_cd', ()),
+    0x00A4: ('scroll_fbp', ()),
+    0x00A5: ('show_fbp_effect', ()),
+    0x00A6: ('backup_screen', ()),
+    0xFFFF: ('message', (MESSAGE,)),
+}
+
+# 执行后不会继续执行下一条的操作码
+TERMINATORS = frozenset([0x0000, 0x0001, 0x0002, 0x0003])
+
+# 结束基本块的指令：结束、随机跳转以及带跳转地址的指令
+BRANCHES = TERMINATORS | frozenset([0x00A2]) | frozenset(
+    op for op, (name, kinds) in OPCODES.iteritems() if JUMP in kinds or GOTO in kinds)
+
+# 物件定义表中保存脚本地址的WORD（OBJECT_ITEM等的wScriptOn*），按物件编号范围列出
+OBJECT_SCRIPT_WORDS = [
+    (ITEM_RANGE, (2, 3, 4)),
+    (MAGIC_RANGE, (2, 3)),
+    (ENEMY_RANGE, (2, 3, 4)),
+    (POISON_RANGE, (2, 4)),
+]
+
+
+def load_scripts(sss):
+    '''
+    返回脚本表，为array('H')，第i条指令为 [i * 4, i * 4 + 4)
+    '''
+    data = sss.read(4)
+    scripts = array.array('H')
+    scripts.fromstring(data[:len(data) & ~7])
+    if sys.byteorder == 'big':
+        scripts.byteswap()
+    return scripts
+
+
+def operand_targets(op, operands):
+    '''
+    返回一条指令引用的 [(含义, 值)]，值为0的跳转和脚本地址不算
+    '''
+    result = []
+    for kind, value in zip(OPCODES.get(op, ('', ()))[1], operands):
+        if kind is None:
+            continue
+        if kind in (JUMP, GOTO, CALL, SCRIPT) and value == 0:
+            continue
+        if kind == SCENE and value == 0:
+            continue
+        result.append((kind, value))
+    return result
+
+
+def successors(address, op, operands):
+    '''
+    返回一条指令执行后可能到达的同一段脚本内的地址（调用的脚本不算）
+    '''
+    result = [value for kind, value in operand_targets(op, operands) if kind in (JUMP, GOTO)]
+    if op == 0x00A2:
+        # 随机跳到后面operands[0]条中的一条
+        result.extend(xrange(address + 1, address + max(operands[0], 1) + 1))
+    if op not in TERMINATORS or (op in (0x0002, 0x0003) and operands[1] != 0):
+        result.append(address + 1)
+    return result
+
+
+def disassemble_one(address, op, operands, messages=None):
+    name, kinds = OPCODES.get(op, ('op_%04x' % op, ()))
+    text = '%04X: %04X %04X %04X %04X  %s' % ((address, op) + tuple(operands) + (name,))
+    notes = ['%s %#x' % (kind, value) for kind, value in operand_targets(op, operands)]
+    if op == 0xFFFF and messages is not None:
+        msg = messages.get(operands[0])
+        if msg is not None:
+            notes.append(msg.replace('\n', '\\n'))
+    if notes:
+        text += '  ; ' + ', '.join(notes)
+    return text
+
+
+def disassemble(scripts, start=0, stop=None, messages=None):
+    '''
+    按地址顺序生成反汇编文本，messages为text.MessageStore时显示对话内容
+    '''
+    count = len(scripts) // 4
+    stop = count if stop is None else min(stop, count)
+    for address in xrange(start, stop):
+        p = address * 4
+        yield disassemble_one(address, scripts[p], scripts[p + 1:p + 4], messages)
+
+
+class ScriptIndex:
+    """
+    blocks      {基本块起始地址: (结束地址（不含）, 后继块起始地址列表)}
+    xrefs       {含义: {值: [引用它的指令地址]}}，含义为JUMP/GOTO/CALL/SCRIPT/OBJECT/MESSAGE/SCENE
+    entries     {脚本地址: [(来源, 编号, 字段)]}，来源为'object'/'scene'/'event'，
+                即物件定义、场景、事件对象中指向该地址的脚本入口
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self.signature = None
+        self.count = 0
+        self.blocks = {}
+        self.xrefs = {}
+        self.entries = {}
+        self.reach = {}
+
+    def build(self, scripts, objects=None, scenes=None, events=None):
+        '''
+        scripts为load_scripts的结果，objects/scenes/events为SSS.MKF第2、1、0个子文件的数据（可以为None）
+        '''
+        code = np.frombuffer(scripts, dtype=np.uint16).reshape(-1, 4)
+        self.count = count = len(code)
+
+        # 一次线性扫描：按OPCODES[op]中各操作数的含义记录引用，同时记下跳转和结束指令
+        # 地址是递增的，所以每个引用列表自然有序
+        xrefs = {}
+        branch = []
+        for address, (op, o0, o1, o2) in enumerate(code.tolist()):
+            for kind, value in operand_targets(op, (o0, o1, o2)):
+                xrefs.setdefault(kind, {}).setdefault(value, []).append(address)
+            if op in BRANCHES:
+                branch.append(address)
+        self.xrefs = xrefs
+
+        # 基本块：脚本入口、跳转目标以及跳转/结束指令的下一条都是块的开始
+        leaders = set([0])
+        for kind in (JUMP, GOTO, CALL, SCRIPT):
+            leaders.update(xrefs.get(kind, {}).iterkeys())
+        leaders.update(a + 1 for a in branch)
+
+        self.entries = {}
+        self._add_entries(objects, scenes, events)
+        leaders.update(self.entries.iterkeys())
+        leaders = sorted(a for a in leaders if 0 <= a < count)
+
+        self.blocks = {}
+        for i, start in enumerate(leaders):
+            end = leaders[i + 1] if i + 1 < len(leaders) else count
+            last = end - 1
+            op = int(code[last, 0])
+            succ = [a for a in successors(last, op, code[last, 1:].tolist()) if 0 <= a < count]
+            self.blocks[start] = (end, sorted(set(succ)))
+        self.reach = {}
+        return self
+
+    def _add_entries(self, objects, scenes, events):
+        def add(address, source, n, field):
+            if address:
+                self.entries.setdefault(address, []).append((source, n, field))
+
+        if objects is not None:
+            table = np.frombuffer(objects[:len(objects) // 12 * 12], dtype='<u2').reshape(-1, 6)
+            for (start, stop), words in OBJECT_SCRIPT_WORDS:
+                for n in xrange(start, min(stop, len(table))):
+                    for w in words:
+                        add(int(table[n, w]), 'object', n, w)
+        if scenes is not None:
+            table = np.frombuffer(scenes[:len(scenes) // SCENE_DTYPE.itemsize * SCENE_DTYPE.itemsize], dtype=SCENE_DTYPE)
+            for n, scene in enumerate(table):
+                # 场景编号从1开始
+                add(int(scene['wScriptOnEnter']), 'scene', n + 1, 'wScriptOnEnter')
+                add(int(scene['wScriptOnTeleport']), 'scene', n + 1, 'wScriptOnTeleport')
+        if events is not None:
+            size = EVENTOBJECT_DTYPE.itemsize
+            table = np.frombuffer(events[:len(events) // size * size], dtype=EVENTOBJECT_DTYPE)
+            for n, event in enumerate(table):
+                # 事件对象编号从1开始
+                add(int(event['wTriggerScript']), 'event', n + 1, 'wTriggerScript')
+                add(int(event['wAutoScript']), 'event', n + 1, 'wAutoScript')
+
+    def block_of(self, address):
+        '''
+        返回包含address的基本块的起始地址
+        '''
+        starts = getattr(self, '_starts', None)
+        if starts is None or len(starts) != len(self.blocks):
+            starts = self._starts = np.array(sorted(self.blocks), dtype=np.int64)
+        i = np.searchsorted(starts, address, side='right') - 1
+        return int(starts[i]) if i >= 0 else None
+
+    def callers(self, address):
+        '''
+        “谁会执行address处的脚本”：返回 {'jump'/'goto'/'call'/'script': [指令地址], 'entries': [(来源, 编号, 字段)]}
+        '''
+        result = {}
+        for kind in (JUMP, GOTO, CALL, SCRIPT):
+            refs = self.xrefs.get(kind, {}).get(address)
+            if refs:
+                result[kind] = refs
+        if address in self.entries:
+            result['entries'] = self.entries[address]
+        return result
+
+    def reachable(self, address):
+        '''
+        从address开始（不进入调用的脚本）能执行到的所有基本块的起始地址
+        '''
+        start = self.block_of(address)
+        if start is None:
+            return []
+        blocks = self.reach.get(start)
+        if blocks is None:
+            seen = set([start])
+            stack = [start]
+            while stack:
+                for succ in self.blocks[stack.pop()][1]:
+                    succ = self.block_of(succ)
+                    if succ is not None and succ not in seen:
+                        seen.add(succ)
+                        stack.append(succ)
+            blocks = self.reach[start] = sorted(seen)
+        return blocks
+
+    def references(self, address, scripts):
+        '''
+        从address开始的一段脚本引用的物件、对话、场景以及调用/跳转的地址：{含义: 排序后的值列表}
+        '''
+        result = {}
+        for start in self.reachable(address):
+            end = self.blocks[start][0]
+            for a in xrange(max(start, address), end):
+                p = a * 4
+                for kind, value in operand_targets(scripts[p], scripts[p + 1:p + 4]):
+                    result.setdefault(kind, set()).add(value)
+        return dict((kind, sorted(values)) for kind, values in result.iteritems())
+
+    def save(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            cPickle.dump((self.VERSION, self.signature, self.count, self.blocks, self.xrefs, self.entries),
+                         f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            data = cPickle.load(f)
+        if data[0] != self.VERSION:
+            return False
+        self.signature, self.count, self.blocks, self.xrefs, self.entries = data[1:]
+        self.reach = {}
+        return True
+
+
+def sss_signature(sss):
+    h = hashlib.sha1()
+    for i in (0, 1, 2, 4):
+        h.update('%d:%d:' % (i, sss.getChunkSize(i)))
+        h.update(sss.read_raw(i))
+    return h.hexdigest()
+
+
+def open_index(sss, scripts=None, rebuild=False):
+    '''
+    打开SSS.MKF所在目录中的SCRIPT.IDX，不存在或者脚本、物件、场景、事件对象有变化时重新建立并保存
+    '''
+    if scripts is None:
+        scripts = load_scripts(sss)
+    directory = os.path.dirname(os.path.abspath(sss.path)) if sss.path else '.'
+    path = os.path.join(directory, INDEX_NAME)
+    signature = sss_signature(sss)
+    index = ScriptIndex()
+    if not rebuild and os.path.exists(path):
+        try:
+            if index.load(path) and index.signature == signature:
+                return index
+        except (EOFError, ValueError, cPickle.UnpicklingError):
+            pass
+    index = ScriptIndex().build(scripts, sss.read(2), sss.read(1), sss.read(0))
+    index.signature = signature
+    index.save(path)
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+    from mkf_unpack import MKFDecoder
+
+    def address(s):
+        return int(s, 0)
+
+    parser = argparse.ArgumentParser(description='disassemble SSS.MKF scripts and query cross references')
+    parser.add_argument('--sss', default='SSS.MKF', help='path of SSS.MKF')
+    parser.add_argument('--msg', help='path of M.MSG, to show dialog text')
+    parser.add_argument('-d', '--disassemble', type=address, nargs='*', metavar='ADDR',
+                        help='disassemble the code reachable from these addresses, everything if none given')
+    parser.add_argument('-x', '--callers', type=address, metavar='ADDR', help='who runs the script at ADDR')
+    parser.add_argument('-r', '--refs', type=address, metavar='ADDR',
+                        help='objects, messages, scenes and scripts used by the script at ADDR')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild SCRIPT.IDX')
+    args = parser.parse_args()
+
+    with MKFDecoder(path=args.sss) as sss:
+        scripts = load_scripts(sss)
+        index = open_index(sss, scripts, args.rebuild)
+        messages = None
+        if args.msg:
+            from text import MessageStore
+            messages = MessageStore(sss, args.msg)
+    if args.callers is not None:
+        callers = index.callers(args.callers)
+        for kind in (JUMP, GOTO, CALL, SCRIPT):
+            if kind in callers:
+                print '%s: %s' % (kind, ', '.join('%04X' % a for a in callers[kind]))
+        for source, n, field in callers.get('entries', ()):
+            print '%s %#x: %s' % (source, n, field)
+    if args.refs is not None:
+        for kind, values in sorted(index.references(args.refs, scripts).iteritems()):
+            print '%s: %s' % (kind, ', '.join('%#x' % v for v in values))
+    if args.disassemble is not None:
+        if not args.disassemble:
+            for line in disassemble(scripts, messages=messages):
+                print line
+        else:
+            starts = sorted(set(b for a in args.disassemble for b in index.reachable(a)))
+            for start in starts:
+                print '%04X:' % start
+                for line in disassemble(scripts, start, index.blocks[start][0], messages):
+                    print '    ' + line
@@ -0,0 +1,886 @@
+# coding=utf-8
+"""
+不启动游戏的脚本解释器，用于批量检查道具脚本的效果（例如用PAL_Inventory修改数据以后在CI中回归测试）
+
+只模拟会改变游戏数据的指令：道具、HP/MP、金钱、属性、装备、法术、毒、事件对象/场景/物件的脚本地址和状态，
+以及脚本内的跳转和调用，行为与script.c中的PAL_RunTriggerScript/PAL_InterpretInstruction
+和global.c中对应的函数一致；对话、移动、画面、声音等指令直接跳过，
+只在战斗中有意义的指令不跳转，0x0007（战斗）的结果由ScriptRunner.battle决定，默认为胜利
+
+GameState保存一份游戏数据（Python列表，复制很快），可以从存档或者SSS.MKF/DATA.MKF（新游戏）读入；
+ScriptRunner按操作码查表执行指令，simulate_items用进程池对每个道具重复使用多次并汇总结果
+
+用法：python simulate.py [-d 数据目录] [-s 存档] [--hp 0.5] [-n 次数] [-j 进程数] [-o 结果.json] [--expect 上次结果.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+
+import numpy as np
+
+from gamedata import *
+from objects import ITEM_RANGE, kItemFlagUsable, kItemFlagConsuming, kItemFlagApplyToAll
+from script import load_scripts
+
+MAX_STEPS = 100000
+
+# BODYPART
+kBodyPartHand = 3
+kBodyPartWear = 5
+kBodyPartExtra = 6
+
+# PAL_StartBattle的返回值
+kBattleResultWon = 3
+kBattleResultLost = 1
+kBattleResultFleed = 0xFFFF
+
+# PLAYERROLES中每个字段是一个PLAYERS（每个角色一个WORD），按WORD展开后第i个字段第r个角色为 i * MAX_PLAYER_ROLES + r
+ROLE_WORDS = PLAYERROLES_DTYPE.itemsize // 2
+
+
+def _role_field(name):
+    return PLAYERROLES_DTYPE.fields[name][1] // (2 * MAX_PLAYER_ROLES)
+
+NAME = _role_field('rgwName')
+MAX_HP = _role_field('rgwMaxHP')
+MAX_MP = _role_field('rgwMaxMP')
+HP = _role_field('rgwHP')
+MP = _role_field('rgwMP')
+EQUIPMENT = _role_field('rgwEquipment')
+POISON_RESISTANCE = _role_field('rgwPoisonResistance')
+MAGIC = _role_field('rgwMagic')
+
+
+def _event_field(name):
+    return EVENTOBJECT_DTYPE.fields[name][1] // 2
+
+EVENT_WORDS = EVENTOBJECT_DTYPE.itemsize // 2
+TRIGGER_SCRIPT = _event_field('wTriggerScript')
+AUTO_SCRIPT = _event_field('wAutoScript')
+STATE = _event_field('sState')
+IDLE_FRAME = _event_field('nScriptIdleFrame')
+
+
+def _words(data, width):
+    '''
+    把小端WORD数据转换成每行width个WORD的列表
+    '''
+    data = data[:len(data) // (width * 2) * width * 2]
+    return np.frombuffer(data, dtype='<u2').reshape(-1, width).tolist()
+
+
+def signed(w):
+    return w - 0x10000 if w & 0x8000 else w
+
+
+class GameState:
+    """
+    roles       PLAYERROLES按WORD展开的列表
+    effects     rgEquipmentEffect，每个身体部位一个与roles相同格式的列表
+    inventory   [[wItem, nAmount, nAmountInUse]]，不含wItem为0的记录
+    party       队伍中各成员的角色编号
+    poisons     rgPoisonStatus，poisons[i][队伍位置] = [wPoisonID, wPoisonScript]
+    objects/scenes/events   物件、场景、事件对象，每个为一个WORD列表
+    """
+
+    def __init__(self):
+        self.cash = 0
+        self.scene = 1
+        self.party = [0]
+        self.roles = [0] * ROLE_WORDS
+        self.effects = [[0] * ROLE_WORDS for i in xrange(MAX_PLAYER_EQUIPMENTS + 1)]
+        self.inventory = []
+        self.poisons = [[[0, 0] for j in xrange(MAX_PLAYABLE_PLAYER_ROLES)] for i in xrange(MAX_POISONS)]
+        self.objects = []
+        self.scenes = []
+        self.events = []
+        self.success = True
+        self.curEquipPart = -1
+        self.lastEventObject = 0
+        self.lastUnequippedItem = 0
+        self.rng = random.Random()
+
+    @classmethod
+    def from_data(cls, sss, data):
+        '''
+        与PAL_LoadDefaultGame相同：新游戏的数据，sss/data为SSS.MKF/DATA.MKF的MKFDecoder
+        '''
+        state = cls()
+        state.events = _words(sss.read(0), EVENT_WORDS)
+        state.scenes = _words(sss.read(1), 4)
+        state.objects = _words(sss.read(2), 6)
+        state.roles = _words(data.read(3)[:PLAYERROLES_DTYPE.itemsize], ROLE_WORDS)[0]
+        return state
+
+    @classmethod
+    def from_save(cls, save):
+        '''
+        与PAL_LoadGame相同，save为savegame.SavedGame
+        '''
+        state = cls()
+        game = save.games[:1]
+        state.cash = int(game['dwCash'][0])
+        state.scene = int(game['wNumScene'][0])
+        state.party = [int(role) for role in save.getPartyRoles()]
+        state.roles = _words(game['PlayerRoles'].tostring(), ROLE_WORDS)[0]
+        state.inventory = [[int(item['wItem']), int(item['nAmount']), int(item['nAmountInUse'])]
+                           for item in save.getInventory()]
+        status = game['rgPoisonStatus'][0]
+        state.poisons = [[[int(status[i, j]['wPoisonID']), int(status[i, j]['wPoisonScript'])]
+                          for j in xrange(MAX_PLAYABLE_PLAYER_ROLES)] for i in xrange(MAX_POISONS)]
+        state.scenes = _words(game['rgScene'].tostring(), 4)
+        state.objects = _words(game['rgObject'].tostring(), 6)
+        state.events = _words(save.eventObjects.tostring(), EVENT_WORDS)
+        return state
+
+    def copy(self):
+        state = GameState()
+        state.cash = self.cash
+        state.scene = self.scene
+        state.party = list(self.party)
+        state.roles = list(self.roles)
+        state.effects = [list(e) for e in self.effects]
+        state.inventory = [list(item) for item in self.inventory]
+        state.poisons = [[list(p) for p in row] for row in self.poisons]
+        state.objects = [list(o) for o in self.objects]
+        state.scenes = [list(s) for s in self.scenes]
+        # 事件对象很多，而且很少被道具脚本修改，只复制外层列表，修改时再复制对应的事件对象
+        state.events = list(self.events)
+        state.lastEventObject = self.lastEventObject
+        return state
+
+    def event(self, eventObjectID):
+        '''
+        返回可以修改的事件对象（编号从1开始）
+        '''
+        event = self.events[eventObjectID - 1] = list(self.events[eventObjectID - 1])
+        return event
+
+    def party_index(self, role):
+        for index, r in enumerate(self.party):
+            if r == role:
+                return index
+        return None
+
+    def role(self, field, role):
+        return self.roles[field * MAX_PLAYER_ROLES + role]
+
+    def item_amount(self, item):
+        '''
+        PAL_GetItemAmount
+        '''
+        for entry in self.inventory:
+            if entry[0] == item:
+                return entry[1]
+        return 0
+
+    def add_item(self, item, num):
+        '''
+        PAL_AddItemToInventory，num为负时减少，返回是否成功
+        '''
+        if item == 0:
+            return False
+        if num == 0:
+            num = 1
+        for entry in self.inventory:
+            if entry[0] == item:
+                break
+        else:
+            entry = None
+        if num > 0:
+            if entry is not None:
+                entry[1] = min(entry[1] + num, 99)
+            elif len(self.inventory) < MAX_INVENTORY:
+                self.inventory.append([item, min(num, 99), 0])
+            else:
+                return False
+            return True
+        if entry is None:
+            return False
+        if entry[1] < -num:
+            entry[1] = 0
+            return False
+        entry[1] += num
+        return True
+
+    def increase_hp_mp(self, role, hp, mp):
+        '''
+        PAL_IncreaseHPMP，只对活着的角色有效
+        '''
+        roles = self.roles
+        if roles[HP * MAX_PLAYER_ROLES + role] == 0:
+            return False
+        for field, maxField, delta in ((HP, MAX_HP, hp), (MP, MAX_MP, mp)):
+            p = field * MAX_PLAYER_ROLES + role
+            w = (roles[p] + delta) & 0xFFFF
+            if w & 0x8000:
+                w = 0
+            elif w > roles[maxField * MAX_PLAYER_ROLES + role]:
+                w = roles[maxField * MAX_PLAYER_ROLES + role]
+            roles[p] = w
+        return True
+
+    def poison_resistance(self, role):
+        w = self.roles[POISON_RESISTANCE * MAX_PLAYER_ROLES + role]
+        for effect in self.effects:
+            w += effect[POISON_RESISTANCE * MAX_PLAYER_ROLES + role]
+        return min(w & 0xFFFF, 100)
+
+    def poison_level(self, poison):
+        return self.objects[poison][0] if poison < len(self.objects) else 0
+
+    def add_poison(self, role, poison):
+        index = self.party_index(role)
+        if index is None:
+            return
+        for row in self.poisons:
+            if row[index][0] == 0:
+                row[index][:] = [poison, self.objects[poison][2]]
+                return
+            if row[index][0] == poison:
+                return
+
+    def cure_poison_by_kind(self, role, poison):
+        index = self.party_index(role)
+        if index is not None:
+            for row in self.poisons:
+                if row[index][0] == poison:
+                    row[index][:] = [0, 0]
+
+    def cure_poison_by_level(self, role, level):
+        index = self.party_index(role)
+        if index is not None:
+            for row in self.poisons:
+                if self.poison_level(row[index][0]) <= level:
+                    row[index][:] = [0, 0]
+
+    def is_poisoned_by_kind(self, role, poison):
+        index = self.party_index(role)
+        return index is not None and any(row[index][0] == poison for row in self.poisons)
+
+    def is_poisoned_by_level(self, role, level):
+        index = self.party_index(role)
+        if index is None:
+            return False
+        for row in self.poisons:
+            w = self.poison_level(row[index][0])
+            if level <= w < 99:
+                return True
+        return False
+
+    def remove_equipment_effect(self, role, part):
+        '''
+        PAL_RemoveEquipmentEffect（不处理战斗状态）
+        '''
+        effect = self.effects[part]
+        for i in xrange(role, ROLE_WORDS, MAX_PLAYER_ROLES):
+            effect[i] = 0
+        if part == kBodyPartWear:
+            index = self.party_index(role)
+            if index is None:
+                return
+            kept = []
+            for row in self.poisons:
+                if row[index][0] == 0:
+                    break
+                if self.poison_level(row[index][0]) < 99:
+                    kept.append(list(row[index]))
+            for i, row in enumerate(self.poisons):
+                row[index][:] = kept[i] if i < len(kept) else [0, 0]
+
+    def add_magic(self, role, magic):
+        slots = [(MAGIC + i) * MAX_PLAYER_ROLES + role for i in xrange(MAX_PLAYER_MAGICS)]
+        if any(self.roles[p] == magic for p in slots):
+            return False
+        for p in slots:
+            if self.roles[p] == 0:
+                self.roles[p] = magic
+                return True
+        return False
+
+    def remove_magic(self, role, magic):
+        for i in xrange(MAX_PLAYER_MAGICS):
+            p = (MAGIC + i) * MAX_PLAYER_ROLES + role
+            if self.roles[p] == magic:
+                self.roles[p] = 0
+                break
+
+
+class ScriptRunner:
+    """
+    triggerOps为PAL_RunTriggerScript中直接处理的操作码，instructions为PAL_InterpretInstruction中处理的操作码，
+    都是 {操作码: 函数}，不在表中的指令不改变数据，直接执行下一条
+    battle(state, team)返回战斗结果（kBattleResult*），confirm(state)返回0x000A中玩家是否选择“是”
+    """
+
+    def __init__(self, scripts, battle=None, confirm=None):
+        self.scripts = scripts
+        self.count = len(scripts) // 4
+        self.battle = battle or (lambda state, team: kBattleResultWon)
+        self.confirm = confirm or (lambda state: True)
+        self.triggerOps = {
+            0x0000: self.op_end,
+            0x0001: self.op_end_replace_next,
+            0x0002: self.op_end_replace,
+            0x0003: self.op_goto,
+            0x0004: self.op_call,
+            0x0006: self.op_jump_by_rate,
+            0x0007: self.op_start_battle,
+            0x0008: self.op_replace_next,
+            0x000A: self.op_jump_if_no,
+        }
+        self.instructions = {
+            0x0017: self.op_set_extra_attribute,
+            0x0018: self.op_equip_item,
+            0x0019: self.op_add_attribute,
+            0x001A: self.op_set_stat,
+            0x001B: self.op_add_hp,
+            0x001C: self.op_add_mp,
+            0x001D: self.op_add_hp_mp,
+            0x001E: self.op_add_cash,
+            0x001F: self.op_add_item,
+            0x0020: self.op_remove_item,
+            0x0022: self.op_revive_player,
+            0x0023: self.op_remove_equipment,
+            0x0024: self.op_set_auto_script,
+            0x0025: self.op_set_trigger_script,
+            0x0029: self.op_poison_player,
+            0x002B: self.op_cure_player_poison,
+            0x002C: self.op_cure_poison_by_level,
+            0x0049: self.op_set_event_state,
+            0x0055: self.op_add_magic,
+            0x0056: self.op_remove_magic,
+            0x0058: self.op_jump_if_items_less,
+            0x0059: self.op_change_scene,
+            0x005A: self.op_halve_player_hp,
+            0x005D: self.op_jump_if_player_no_poison,
+            0x0061: self.op_jump_if_not_poisoned,
+            0x006D: self.op_set_scene_scripts,
+            0x0074: self.op_jump_if_not_all_full_hp,
+            0x0075: self.op_set_party,
+            0x0079: self.op_jump_if_player_in_party,
+            0x0086: self.op_jump_if_not_equipped,
+            0x008F: self.op_halve_cash,
+            0x0090: self.op_set_object_script,
+            0x0094: self.op_jump_if_event_state,
+            0x0095: self.op_jump_if_scene,
+            0x00A2: self.op_jump_random,
+        }
+
+    def run_trigger(self, state, entry, eventObjectID):
+        '''
+        PAL_RunTriggerScript：从entry开始执行到结束，返回下次执行的地址，state.success为g_fScriptSuccess
+        '''
+        if eventObjectID == 0xFFFF:
+            eventObjectID = state.lastEventObject
+        state.lastEventObject = eventObjectID
+        state.success = True
+        frame = [entry, eventObjectID]
+        scripts = self.scripts
+        triggerOps = self.triggerOps
+        instructions = self.instructions
+        steps = 0
+        while entry != 0:
+            if entry >= self.count:
+                raise IndexError('script entry %04X out of range' % entry)
+            steps += 1
+            if steps > MAX_STEPS:
+                raise RuntimeError('script %04X did not end after %d instructions' % (frame[0], MAX_STEPS))
+            p = entry * 4
+            op = scripts[p]
+            handler = triggerOps.get(op)
+            if handler is not None:
+                entry = handler(state, frame, entry, scripts[p + 1], scripts[p + 2], scripts[p + 3])
+                if entry is None:
+                    break
+                continue
+            handler = instructions.get(op)
+            if handler is not None:
+                entry = handler(state, entry, scripts[p + 1], scripts[p + 2], scripts[p + 3], eventObjectID)
+            entry = (entry + 1) & 0xFFFF
+        state.curEquipPart = -1
+        return frame[0]
+
+    def update_equipments(self, state):
+        '''
+        PAL_UpdateEquipments：重新执行所有已装备道具的装备脚本，得到各部位的附加属性
+        '''
+        state.effects = [[0] * ROLE_WORDS for i in xrange(MAX_PLAYER_EQUIPMENTS + 1)]
+        for role in xrange(MAX_PLAYER_ROLES):
+            for part in xrange(MAX_PLAYER_EQUIPMENTS):
+                item = state.role(EQUIPMENT + part, role)
+                if item != 0:
+                    obj = state.objects[item]
+                    obj[3] = self.run_trigger(state, obj[3], role)
+
+    def use_item(self, state, item, player=0):
+        '''
+        与play.c中PAL_GameUseItem的一次使用相同，player为角色编号，返回脚本是否成功
+        '''
+        obj = state.objects[item]
+        if obj[5] & kItemFlagApplyToAll:
+            player = 0xFFFF
+        obj[2] = self.run_trigger(state, obj[2], player)
+        if obj[5] & kItemFlagConsuming and state.success:
+            state.add_item(item, -1)
+        return state.success
+
+    # PAL_RunTriggerScript中的指令：返回下一条指令的地址，None表示结束；frame[0]为返回值
+
+    def op_end(self, state, frame, entry, o0, o1, o2):
+        return None
+
+    def op_end_replace_next(self, state, frame, entry, o0, o1, o2):
+        frame[0] = entry + 1
+        return None
+
+    def _idle(self, state, frame, limit):
+        if limit == 0 or frame[1] == 0:
+            return True
+        event = state.event(frame[1])
+        event[IDLE_FRAME] = (event[IDLE_FRAME] + 1) & 0xFFFF
+        if event[IDLE_FRAME] < limit:
+            return True
+        event[IDLE_FRAME] = 0
+        return False
+
+    def op_end_replace(self, state, frame, entry, o0, o1, o2):
+        if self._idle(state, frame, o1):
+            frame[0] = o0
+            return None
+        return entry + 1
+
+    def op_goto(self, state, frame, entry, o0, o1, o2):
+        return o0 if self._idle(state, frame, o1) else entry + 1
+
+    def op_call(self, state, frame, entry, o0, o1, o2):
+        self.run_trigger(state, o0, o1 or frame[1])
+        return entry + 1
+
+    def op_jump_by_rate(self, state, frame, entry, o0, o1, o2):
+        if state.rng.randint(1, 100) >= o0:
+            return o1
+        return entry + 1
+
+    def op_start_battle(self, state, frame, entry, o0, o1, o2):
+        result = self.battle(state, o0)
+        if result == kBattleResultLost and o1 != 0:
+            return o1
+        if result == kBattleResultFleed and o2 != 0:
+            return o2
+        return entry + 1
+
+    def op_replace_next(self, state, frame, entry, o0, o1, o2):
+        frame[0] = entry + 1
+        return entry + 1
+
+    def op_jump_if_no(self, state, frame, entry, o0, o1, o2):
+        return entry + 1 if self.confirm(state) else o0
+
+    # PAL_InterpretInstruction中的指令：返回值加1为下一条指令的地址，跳转到x时返回x - 1
+
+    def _role_of(self, state, o, eventObjectID):
+        return eventObjectID if o == 0 else o - 1
+
+    def _party_role(self, state, o):
+        '''
+        PAL_InterpretInstruction开头的iPlayerRole：o < MAX_PLAYABLE_PLAYER_ROLES时为rgParty[o]，否则为rgParty[0]
+        有意与原版不同：o超出当前队伍人数时原版读到的是rgParty中残留的旧成员，
+        GameState只保存当前队伍，所以这里改为队伍的第一个成员
+        '''
+        if o < MAX_PLAYABLE_PLAYER_ROLES and o < len(state.party):
+            return state.party[o]
+        return state.party[0]
+
+    def _current_event(self, o0, eventObjectID):
+        return eventObjectID if o0 in (0, 0xFFFF) else o0
+
+    def op_set_extra_attribute(self, state, entry, o0, o1, o2, eventObjectID):
+        state.effects[o0 - 0xB][o1 * MAX_PLAYER_ROLES + eventObjectID] = o2
+        return entry
+
+    def op_equip_item(self, state, entry, o0, o1, o2, eventObjectID):
+        part = state.curEquipPart = o0 - 0xB
+        state.remove_equipment_effect(eventObjectID, part)
+        p = (EQUIPMENT + part) * MAX_PLAYER_ROLES + eventObjectID
+        if state.roles[p] != o1:
+            w = state.roles[p]
+            state.roles[p] = o1
+            state.add_item(o1, -1)
+            if w != 0:
+                state.add_item(w, 1)
+            state.lastUnequippedItem = w
+        return entry
+
+    def op_add_attribute(self, state, entry, o0, o1, o2, eventObjectID):
+        p = o0 * MAX_PLAYER_ROLES + self._role_of(state, o2, eventObjectID)
+        state.roles[p] = (state.roles[p] + signed(o1)) & 0xFFFF
+        return entry
+
+    def op_set_stat(self, state, entry, o0, o1, o2, eventObjectID):
+        words = state.roles if state.curEquipPart == -1 else state.effects[state.curEquipPart]
+        words[o0 * MAX_PLAYER_ROLES + self._role_of(state, o2, eventObjectID)] = o1
+        return entry
+
+    def _add_hp_mp(self, state, everyone, hp, mp, eventObjectID):
+        if everyone:
+            for role in state.party:
+                state.increase_hp_mp(role, hp, mp)
+        elif not state.increase_hp_mp(eventObjectID, hp, mp):
+            state.success = False
+
+    def op_add_hp(self, state, entry, o0, o1, o2, eventObjectID):
+        self._add_hp_mp(state, o0, signed(o1), 0, eventObjectID)
+        return entry
+
+    def op_add_mp(self, state, entry, o0, o1, o2, eventObjectID):
+        self._add_hp_mp(state, o0, 0, signed(o1), eventObjectID)
+        return entry
+
+    def op_add_hp_mp(self, state, entry, o0, o1, o2, eventObjectID):
+        self._add_hp_mp(state, o0, signed(o1), signed(o1), eventObjectID)
+        return entry
+
+    def op_add_cash(self, state, entry, o0, o1, o2, eventObjectID):
+        delta = signed(o0)
+        if delta < 0 and state.cash < -delta:
+            return o1 - 1
+        state.cash = (state.cash + delta) & 0xFFFFFFFF
+        return entry
+
+    def op_add_item(self, state, entry, o0, o1, o2, eventObjectID):
+        state.add_item(o0, signed(o1))
+        return entry
+
+    def op_remove_item(self, state, entry, o0, o1, o2, eventObjectID):
+        x = o1 or 1
+        if state.add_item(o0, -x):
+            return entry
+        # 道具不够时卸下装备中的
+        for role in state.party:
+            for part in xrange(MAX_PLAYER_EQUIPMENTS):
+                p = (EQUIPMENT + part) * MAX_PLAYER_ROLES + role
+                if state.roles[p] == o0:
+                    state.remove_equipment_effect(role, part)
+                    state.roles[p] = 0
+                    x -= 1
+                    if x == 0:
+                        return entry
+        if o2 != 0:
+            return o2 - 1
+        return entry
+
+    def op_revive_player(self, state, entry, o0, o1, o2, eventObjectID):
+        roles = state.roles
+        targets = state.party if o0 else [eventObjectID]
+        if o0:
+            state.success = False
+        for role in targets:
+            if roles[HP * MAX_PLAYER_ROLES + role] == 0:
+                roles[HP * MAX_PLAYER_ROLES + role] = (roles[MAX_HP * MAX_PLAYER_ROLES + role] * o1 // 10) & 0xFFFF
+                state.cure_poison_by_level(role, 3)
+                if o0:
+                    state.success = True
+            elif not o0:
+                state.success = False
+        return entry
+
+    def op_remove_equipment(self, state, entry, o0, o1, o2, eventObjectID):
+        role = self._party_role(state, o0)
+        if o1 == 0:
+            # 卸下所有装备时每个部位（包括空的部位）都清除装备效果
+            for part in xrange(MAX_PLAYER_EQUIPMENTS):
+                p = (EQUIPMENT + part) * MAX_PLAYER_ROLES + role
+                w = state.roles[p]
+                if w != 0:
+                    state.add_item(w, 1)
+                    state.roles[p] = 0
+                state.remove_equipment_effect(role, part)
+        else:
+            p = (EQUIPMENT + o1 - 1) * MAX_PLAYER_ROLES + role
+            w = state.roles[p]
+            if w != 0:
+                state.remove_equipment_effect(role, o1 - 1)
+                state.add_item(w, 1)
+                state.roles[p] = 0
+        return entry
+
+    def op_set_auto_script(self, state, entry, o0, o1, o2, eventObjectID):
+        if o0 != 0:
+            state.event(self._current_event(o0, eventObjectID))[AUTO_SCRIPT] = o1
+        return entry
+
+    def op_set_trigger_script(self, state, entry, o0, o1, o2, eventObjectID):
+        if o0 != 0:
+            state.event(self._current_event(o0, eventObjectID))[TRIGGER_SCRIPT] = o1
+        return entry
+
+    def op_poison_player(self, state, entry, o0, o1, o2, eventObjectID):
+        for role in (state.party if o0 else [eventObjectID]):
+            if state.rng.randint(1, 100) > state.poison_resistance(role):
+                state.add_poison(role, o1)
+        return entry
+
+    def op_cure_player_poison(self, state, entry, o0, o1, o2, eventObjectID):
+        for role in (state.party if o0 else [eventObjectID]):
+            state.cure_poison_by_kind(role, o1)
+        return entry
+
+    def op_cure_poison_by_level(self, state, entry, o0, o1, o2, eventObjectID):
+        for role in (state.party if o0 else [eventObjectID]):
+            state.cure_poison_by_level(role, o1)
+        return entry
+
+    def op_set_event_state(self, state, entry, o0, o1, o2, eventObjectID):
+        current = self._current_event(o0, eventObjectID)
+        if current != 0:
+            state.event(current)[STATE] = o1
+        return entry
+
+    def op_add_magic(self, state, entry, o0, o1, o2, eventObjectID):
+        state.add_magic(self._role_of(state, o1, eventObjectID), o0)
+        return entry
+
+    def op_remove_magic(self, state, entry, o0, o1, o2, eventObjectID):
+        state.remove_magic(self._role_of(state, o1, eventObjectID), o0)
+        return entry
+
+    def op_jump_if_items_less(self, state, entry, o0, o1, o2, eventObjectID):
+        if state.item_amount(o0) < signed(o1):
+            return o2 - 1
+        return entry
+
+    def op_change_scene(self, state, entry, o0, o1, o2, eventObjectID):
+        if 0 < o0 <= MAX_SCENES:
+            state.scene = o0
+        return entry
+
+    def op_halve_player_hp(self, state, entry, o0, o1, o2, eventObjectID):
+        state.roles[HP * MAX_PLAYER_ROLES + eventObjectID] //= 2
+        return entry
+
+    def op_jump_if_player_no_poison(self, state, entry, o0, o1, o2, eventObjectID):
+        if not state.is_poisoned_by_kind(eventObjectID, o0):
+            return o1 - 1
+        return entry
+
+    def op_jump_if_not_poisoned(self, state, entry, o0, o1, o2, eventObjectID):
+        if not state.is_poisoned_by_level(eventObjectID, 1):
+            return o0 - 1
+        return entry
+
+    def op_set_scene_scripts(self, state, entry, o0, o1, o2, eventObjectID):
+        if o0:
+            scene = state.scenes[o0 - 1]
+            if o1:
+                scene[1] = o1
+            if o2:
+                scene[2] = o2
+            if o1 == 0 and o2 == 0:
+                scene[1] = scene[2] = 0
+        return entry
+
+    def op_jump_if_not_all_full_hp(self, state, entry, o0, o1, o2, eventObjectID):
+        for role in state.party:
+            if state.role(HP, role) < state.role(MAX_HP, role):
+                return o0 - 1
+        return entry
+
+    def op_set_party(self, state, entry, o0, o1, o2, eventObjectID):
+        state.party = [o - 1 for o in (o0, o1, o2) if o != 0] or [0]
+        state.poisons = [[[0, 0] for j in xrange(MAX_PLAYABLE_PLAYER_ROLES)] for i in xrange(MAX_POISONS)]
+        self.update_equipments(state)
+        return entry
+
+    def op_jump_if_player_in_party(self, state, entry, o0, o1, o2, eventObjectID):
+        for role in state.party:
+            if state.role(NAME, role) == o0:
+                return o1 - 1
+        return entry
+
+    def op_jump_if_not_equipped(self, state, entry, o0, o1, o2, eventObjectID):
+        for role in state.party:
+            for part in xrange(MAX_PLAYER_EQUIPMENTS):
+                if state.role(EQUIPMENT + part, role) == o0:
+                    return entry
+        return o2 - 1
+
+    def op_halve_cash(self, state, entry, o0, o1, o2, eventObjectID):
+        state.cash //= 2
+        return entry
+
+    def op_set_object_script(self, state, entry, o0, o1, o2, eventObjectID):
+        state.objects[o0][2 + o2] = o1
+        return entry
+
+    def op_jump_if_event_state(self, state, entry, o0, o1, o2, eventObjectID):
+        current = self._current_event(o0, eventObjectID)
+        if current != 0 and state.events[current - 1][STATE] == o1:
+            return o2 - 1
+        return entry
+
+    def op_jump_if_scene(self, state, entry, o0, o1, o2, eventObjectID):
+        if state.scene == o0:
+            return o1 - 1
+        return entry
+
+    def op_jump_random(self, state, entry, o0, o1, o2, eventObjectID):
+        return entry + state.rng.randint(0, max(o0 - 1, 0))
+
+
+def load_state(runner, sss, data=None, save_path=None):
+    '''
+    读入存档（save_path）或者新游戏的数据，并与PAL_InitGameData一样计算装备效果
+    '''
+    if save_path:
+        from savegame import SavedGame
+        with SavedGame(save_path) as save:
+            state = GameState.from_save(save)
+    else:
+        state = GameState.from_data(sss, data)
+    runner.update_equipments(state)
+    return state
+
+
+def set_hp_mp(state, ratio):
+    '''
+    把队伍成员的HP/MP设为上限的ratio倍（测试回复道具用）
+    '''
+    for role in state.party:
+        for field, maxField in ((HP, MAX_HP), (MP, MAX_MP)):
+            state.roles[field * MAX_PLAYER_ROLES + role] = int(state.role(maxField, role) * ratio)
+
+
+def usable_items(state):
+    return [item for item in xrange(ITEM_RANGE[0], min(ITEM_RANGE[1], len(state.objects)))
+            if state.objects[item][5] & kItemFlagUsable and state.objects[item][2] != 0]
+
+
+def simulate_item(runner, base, item, player, uses, seed=0):
+    '''
+    在base的一份复制上对player使用item最多uses次（道具用完为止），返回统计结果
+    '''
+    state = base.copy()
+    state.rng.seed(seed)
+    for entry in state.inventory:
+        if entry[0] == item:
+            entry[1] = uses
+            break
+    else:
+        state.inventory.append([item, uses, 0])
+    result = {'item': item, 'player': player, 'uses': 0, 'successes': 0}
+    try:
+        for i in xrange(uses):
+            if state.item_amount(item) <= 0:
+                break
+            result['uses'] += 1
+            if runner.use_item(state, item, player):
+                result['successes'] += 1
+    except (RuntimeError, IndexError) as e:
+        result['error'] = str(e)
+    result['cash'] = state.cash - base.cash
+    result['scene'] = state.scene
+    result['hp'] = [state.role(HP, role) - base.role(HP, role) for role in base.party]
+    result['mp'] = [state.role(MP, role) - base.role(MP, role) for role in base.party]
+    before = dict((entry[0], entry[1]) for entry in base.inventory)
+    before[item] = uses
+    after = dict((entry[0], entry[1]) for entry in state.inventory)
+    result['items'] = dict((str(n), after.get(n, 0) - before.get(n, 0))
+                           for n in set(before) | set(after) if after.get(n, 0) != before.get(n, 0))
+    result['roles'] = dict((str(p), state.roles[p] - base.roles[p])
+                           for p in xrange(ROLE_WORDS) if state.roles[p] != base.roles[p])
+    return result
+
+
+_worker = {}
+
+
+def _init_worker(directory, save_path, hp_ratio):
+    from mkf_unpack import MKFDecoder
+    with MKFDecoder(path=os.path.join(directory, 'SSS.MKF')) as sss:
+        runner = ScriptRunner(load_scripts(sss))
+        if save_path:
+            state = load_state(runner, sss, save_path=save_path)
+        else:
+            with MKFDecoder(path=os.path.join(directory, 'DATA.MKF')) as data:
+                state = load_state(runner, sss, data)
+    if hp_ratio is not None:
+        set_hp_mp(state, hp_ratio)
+    _worker['runner'] = runner
+    _worker['state'] = state
+
+
+def _simulate_worker(task):
+    item, player, uses, seed = task
+    return simulate_item(_worker['runner'], _worker['state'], item, player, uses, seed)
+
+
+def simulate_items(directory='.', save_path=None, items=None, uses=100, hp_ratio=None, seed=0, jobs=1):
+    '''
+    对items中的每个道具（默认为所有可使用的道具），对队伍中每个成员各使用uses次，
+    返回按 (道具, 角色) 排序的结果列表；每个任务的随机数种子由seed、道具和角色决定，结果与进程数无关
+    '''
+    args = (directory, save_path, hp_ratio)
+    _init_worker(*args)
+    state = _worker['state']
+    if items is None:
+        items = usable_items(state)
+    tasks = []
+    for item in items:
+        players = [0xFFFF] if state.objects[item][5] & kItemFlagApplyToAll else state.party
+        for player in players:
+            tasks.append((item, player, uses, (seed << 32) | (item << 16) | player))
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, args)
+        try:
+            results = pool.map(_simulate_worker, tasks, chunksize=max(1, len(tasks) // (jobs * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_simulate_worker, tasks)
+    return sorted(results, key=lambda r: (r['item'], r['player']))
+
+
+def compare(results, expected):
+    '''
+    返回与上次结果不同的 (道具, 角色, 上次结果, 这次结果) 列表
+    '''
+    old = dict(((r['item'], r['player']), r) for r in expected)
+    new = dict(((r['item'], r['player']), r) for r in results)
+    return [(key[0], key[1], old.get(key), new.get(key)) for key in sorted(set(old) | set(new))
+            if old.get(key) != new.get(key)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='run item scripts without the game and summarize their effects')
+    parser.add_argument('-d', '--dir', default='.', help='directory of SSS.MKF and DATA.MKF')
+    parser.add_argument('-s', '--save', help='start from this .rpg instead of a new game')
+    parser.add_argument('-i', '--item', type=lambda s: int(s, 0), action='append', help='item to test (default: all usable items)')
+    parser.add_argument('-n', '--uses', type=int, default=100, help='uses per item and player')
+    parser.add_argument('--hp', type=float, help='set the party HP/MP to this fraction of the maximum first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-o', '--output', help='write the results as json to this file')
+    parser.add_argument('--expect', help='compare with the results in this json file, exit with 1 if they differ')
+    args = parser.parse_args()
+
+    results = simulate_items(args.dir, args.save, args.item, args.uses, args.hp, args.seed, args.jobs)
+    text = json.dumps(results, indent=1, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    elif not args.expect:
+        print text
+    if args.expect:
+        with open(args.expect) as f:
+            expected = json.load(f)
+        # json读回来的结果与这次的格式一致
+        differences = compare(json.loads(text), expected)
+        for item, player, old, new in differences:
+            print 'item %#x player %#x:\n  expected %s\n  got      %s' % (
+                item, player, json.dumps(old, sort_keys=True), json.dumps(new, sort_keys=True))
+        sys.exit(1 if differences else 0)
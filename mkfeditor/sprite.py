@@ -0,0 +1,127 @@
+# coding=utf-8
+"""
+RLE位图解码，格式与palcommon.c中的PAL_RLEBlitToSurface一致：
+    [02 00 00 00]   可选的文件头
+    WORD 宽度, WORD 高度
+    之后是若干段：首字节T满足 (T & 0x80) && T <= 0x80 + 宽度 时表示跳过T - 0x80个透明像素，
+    否则后面紧跟T个像素（调色板索引）
+
+解码时只在Python中逐段扫描（段数远少于像素数），记录每段的目标位置、来源位置和长度，
+然后用numpy一次性展开成像素下标并写入预先分配好的数组
+"""
+from struct import unpack_from
+
+import numpy as np
+
+
+def rle_size(frame):
+    '''
+    返回RLE位图的(宽, 高)，与PAL_RLEGetWidth/PAL_RLEGetHeight相同
+    '''
+    start = 4 if frame[:4] == '\x02\x00\x00\x00' else 0
+    if len(frame) < start + 4:
+        return 0, 0
+    return unpack_from('<HH', frame, start)
+
+
+def _scan_runs(data, start, end, runs):
+    '''
+    扫描data[start:end]中的一帧，把 (目标像素下标, 来源下标, 长度) 追加到runs中，返回(宽, 高)
+    '''
+    if data[start:start + 4] == '\x02\x00\x00\x00':
+        start += 4
+    if end < start + 4:
+        return 0, 0
+    width = data[start] | (data[start + 1] << 8)
+    height = data[start + 2] | (data[start + 3] << 8)
+    total = width * height
+    skip = 0x80 + width
+    p = start + 4
+    i = 0
+    append = runs.append
+    while i < total and p < end:
+        t = data[p]
+        p += 1
+        if t & 0x80 and t <= skip:
+            i += t - 0x80
+        else:
+            append((i, p, t))
+            p += t
+            i += t
+    return width, height
+
+
+def decode_frames(frames):
+    '''
+    批量解码多帧RLE位图，frames为str/buffer的列表（可以含None，视为空图像）
+    返回 (pixels, opaque, sizes)：
+        pixels  uint8数组，形状为 (帧数, 最大高度, 最大宽度)，每帧放在左上角，透明像素为0
+        opaque  bool数组，形状与pixels相同，True表示该像素不透明
+        sizes   int数组，形状为 (帧数, 2)，每帧的 (宽, 高)
+    '''
+    frames = ['' if f is None else str(f) for f in frames]
+    data = bytearray(''.join(frames))
+    count = len(frames)
+    sizes = np.zeros((count, 2), dtype=np.int32)
+    runs = []
+    runFrame = []
+    base = 0
+    for n, frame in enumerate(frames):
+        before = len(runs)
+        sizes[n] = _scan_runs(data, base, base + len(frame), runs)
+        runFrame.extend([n] * (len(runs) - before))
+        base += len(frame)
+
+    maxW = int(sizes[:, 0].max()) if count else 0
+    maxH = int(sizes[:, 1].max()) if count else 0
+    pixels = np.zeros((count, maxH, maxW), dtype=np.uint8)
+    opaque = np.zeros((count, maxH, maxW), dtype=np.bool_)
+    if not runs:
+        return pixels, opaque, sizes
+
+    runs = np.array(runs, dtype=np.int64)
+    runFrame = np.array(runFrame, dtype=np.int64)
+    dst, src, length = runs[:, 0], runs[:, 1], runs[:, 2]
+    width = sizes[runFrame, 0].astype(np.int64)
+    # 超出图像范围或者数据末尾的部分截掉
+    length = np.minimum(length, width * sizes[runFrame, 1] - dst)
+    length = np.maximum(np.minimum(length, len(data) - src), 0)
+
+    # 展开成逐像素的下标：第k段贡献 length[k] 个像素
+    runId = np.repeat(np.arange(len(length)), length)
+    within = np.arange(runId.size) - np.repeat(np.cumsum(length) - length, length)
+    pos = dst[runId] + within
+    w = width[runId]
+    target = runFrame[runId] * (maxH * maxW) + (pos // w) * maxW + pos % w
+    source = np.frombuffer(data, dtype=np.uint8)
+    pixels.reshape(-1)[target] = source[src[runId] + within]
+    opaque.reshape(-1)[target] = True
+    return pixels, opaque, sizes
+
+
+def decode_rle(frame):
+    '''
+    解码一帧RLE位图，返回 (pixels, opaque)，形状均为 (高, 宽)
+    '''
+    pixels, opaque, sizes = decode_frames([frame])
+    w, h = sizes[0]
+    return pixels[0, :h, :w], opaque[0, :h, :w]
+
+
+def decode_sprite(index, chunk):
+    '''
+    解码一个sprite（mgo.mkf/f.mkf/abc.mkf的子文件）的所有帧，index为mkf_index.SpriteIndex
+    '''
+    return decode_frames([index.frame(chunk, n) for n in xrange(index.getFrameCount(chunk))])
+
+
+def decode_bitmaps(mkf, chunks=None):
+    '''
+    解码每个子文件都是一张RLE位图的MKF（如ball.mkf），chunks为None时解码所有子文件
+    结果的第n帧对应chunks中的第n个子文件
+    '''
+    if chunks is None:
+        frames = [data for _, _, data in mkf.iter_chunks()]
+    else:
+        frames = [mkf.decompress(i) for i in chunks]
+    return decode_frames(frames)
@@ -0,0 +1,35 @@
+# coding=utf-8
+"""
+YJ_1压缩的往返测试：python -m unittest test_mkf_pack
+"""
+import random
+import unittest
+
+from mkf_pack import YJ1Encoder
+from mkf_unpack import YJ1Decoder, YJ1TableDecoder
+
+
+class YJ1RoundTripTest(unittest.TestCase):
+
+    def roundtrip(self, data):
+        encoded = YJ1Encoder().encode(data)
+        self.assertEqual(YJ1TableDecoder().decode(encoded), data)
+        self.assertEqual(str(YJ1Decoder().decode(encoded)), data)
+        return encoded
+
+    def test_small(self):
+        rng = random.Random(1)
+        self.roundtrip(''.join(chr(rng.randint(0, 7)) for i in xrange(5000)))
+
+    def test_more_than_255_blocks(self):
+        # block数是WORD，超过255个block（4 MB以上）时不能只读低字节
+        rng = random.Random(2)
+        size = 260 * YJ1Encoder.BLOCK_SIZE
+        pattern = ''.join(chr(rng.randint(0, 255)) for i in xrange(0x1000))
+        data = ''.join(pattern[rng.randint(0, 0x800):] for i in xrange(size // 0x800))[:size]
+        encoded = self.roundtrip(data)
+        self.assertEqual(encoded[0xC:0xE], '\x04\x01')
+
+
+if __name__ == '__main__':
+    unittest.main()
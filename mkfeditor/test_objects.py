@@ -0,0 +1,76 @@
+# coding=utf-8
+"""
+物件表标志位的往返测试：python -m unittest test_objects
+"""
+import unittest
+
+import numpy as np
+
+from objects import *
+
+
+def _random_table(seed):
+    rng = np.random.RandomState(seed)
+    return ObjectTable(rng.randint(0, 0x10000, POISON_RANGE[1] * 6).astype('<u2').tostring())
+
+
+class ItemFlagsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = _random_table(0)
+        self.original = self.table.tostring()
+
+    def test_full_range(self):
+        self.assertEqual(len(self.table.items), ITEM_RANGE[1] - ITEM_RANGE[0])
+
+    def test_roundtrip(self):
+        flags = item_flags(self.table)
+        matrix = flags.matrix()
+        self.assertEqual(matrix.shape, (ITEM_RANGE[1] - ITEM_RANGE[0], 12))
+        column = self.table.items['wFlags']
+        for j in xrange(12):
+            np.testing.assert_array_equal(matrix[:, j], (column >> j) & 1 == 1)
+        flags.assign(matrix)
+        self.assertEqual(self.table.tostring(), self.original)
+
+    def test_assign_clears_bits(self):
+        flags = item_flags(self.table)
+        matrix = flags.matrix()
+        matrix[:, 5] = False
+        flags.assign(matrix)
+        after = self.table.items['wFlags']
+        self.assertFalse((after & kItemFlagSellable).any())
+        before = np.frombuffer(self.original, dtype='<u2').reshape(-1, 6)[ITEM_RANGE[0]:ITEM_RANGE[1], 5]
+        np.testing.assert_array_equal(after & ~np.uint16(kItemFlagSellable), before & ~np.uint16(kItemFlagSellable))
+
+    def test_mass_edit(self):
+        flags = item_flags(self.table)
+        column = self.table.items['wFlags']
+        before = np.array(column)
+        consuming = flags.has(kItemFlagConsuming)
+        flags.set(consuming, kItemFlagSellable)
+        flags.clear(~consuming, kItemFlagThrowable | kItemFlagEquipableByPlayerRole_First)
+
+        changed = before ^ column
+        self.assertTrue(changed.any())
+        # 只有目标行的目标位发生变化
+        self.assertFalse((changed[consuming] & ~np.uint16(kItemFlagSellable)).any())
+        cleared = np.uint16(kItemFlagThrowable | kItemFlagEquipableByPlayerRole_First)
+        self.assertFalse((changed[~consuming] & ~cleared).any())
+        self.assertTrue((column[consuming] & kItemFlagSellable).all())
+        self.assertFalse((column[~consuming] & cleared).any())
+
+        # 物件表中道具wFlags以外的WORD都不变
+        raw = np.frombuffer(self.original, dtype='<u2').reshape(-1, 6).copy()
+        raw[ITEM_RANGE[0]:ITEM_RANGE[1], 5] = column
+        self.assertEqual(self.table.tostring(), raw.tostring())
+
+    def test_high_bits_preserved(self):
+        flags = item_flags(self.table)
+        high = self.table.items['wFlags'] & ~np.uint16(flags.mask)
+        flags.assign(np.zeros((len(self.table.items), 12), dtype=bool))
+        np.testing.assert_array_equal(self.table.items['wFlags'], high)
+
+
+if __name__ == '__main__':
+    unittest.main()
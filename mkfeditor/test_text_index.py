@@ -0,0 +1,55 @@
+# coding=utf-8
+"""
+物件名称修改与全文索引的测试：python -m unittest test_text_index
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from InventoryEditor import WordData
+from text_index import build_index
+
+NAMES = [u'', u'長劍', u'銅錢鏢', u'金創藥']
+
+
+class WordDataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'WORD.DAT')
+        with open(self.path, 'wb') as f:
+            for name in NAMES:
+                f.write('{:10}'.format(name.encode('big5')))
+        self.word = WordData(self.path)
+        self.word.index = build_index(self.word.store)
+
+    def tearDown(self):
+        self.word.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_search(self):
+        self.assertEqual(self.word.search('劍'), [1])
+
+    def test_rename_cjk(self):
+        # Tk的StringVar返回unicode
+        self.word.set_object_name(1, u'靈兒劍')
+        self.assertEqual(self.word.get_object_name(1), '靈兒劍')
+        self.assertEqual(self.word.search('靈兒'), [1])
+        self.assertEqual(self.word.search('長劍'), [])
+
+    def test_add_cjk(self):
+        self.word.add_object_name(u'酒神')
+        self.assertEqual(self.word.search('酒神'), [len(NAMES)])
+
+    def test_write(self):
+        with self.word:
+            self.word.set_object_name(2, u'靈兒劍')
+        with open(os.path.join(self.dir, 'WORDEX.DAT'), 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[20:30], u'靈兒劍'.encode('big5') + '    ')
+        self.assertEqual(data[10:20], u'長劍'.encode('big5') + '      ')
+
+
+if __name__ == '__main__':
+    unittest.main()
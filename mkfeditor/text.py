@@ -0,0 +1,151 @@
+# coding=utf-8
+"""
+游戏文字，格式与text.c中的PAL_InitText/PAL_GetWord/PAL_GetMsg一致：
+    word.dat    每个词条10字节big5，不足的用空格补齐
+    m.msg       所有对话连在一起的big5文本，第n条对话的范围由SSS.MKF第3个子文件
+                （DWORD偏移表，共 对话数 + 1 项）中的第n、n + 1项给出
+
+两个文件都用mmap打开，启动时只读入对话偏移表，词条和对话在用到时才解码（结果为utf8），
+解码结果放在LRUChunkCache中；export按顺序一次性导出所有对话，不经过缓存
+"""
+import array
+import mmap
+import os
+import sys
+
+from mkf_unpack import LRUChunkCache
+
+WORD_LENGTH = 10
+
+
+def _map_file(path):
+    # 空文件不能mmap
+    if os.path.getsize(path) == 0:
+        return ''
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class WordStore:
+    """
+    word.dat，词条编号即物件编号
+    """
+
+    def __init__(self, path='WORD.DAT', cache=None):
+        self.path = path
+        self.content = _map_file(path)
+        self.cache = cache if cache is not None else LRUChunkCache(64 << 10)
+
+    def close(self):
+        if isinstance(self.content, mmap.mmap):
+            self.content.close()
+
+    def getWordCount(self):
+        return (len(self.content) + WORD_LENGTH - 1) // WORD_LENGTH
+
+    def raw(self, n):
+        '''
+        返回第n个词条的原始big5数据（含补齐的空格）
+        '''
+        return self.content[n * WORD_LENGTH:(n + 1) * WORD_LENGTH]
+
+    def get(self, n):
+        '''
+        返回第n个词条（utf8，去掉前后空白），不存在时返回None
+        '''
+        if n < 0 or n >= self.getWordCount():
+            return None
+        key = ('word', n)
+        word = self.cache.get(key)
+        if word is None:
+            word = self.raw(n).strip().decode('big5').encode('utf8')
+            self.cache.put(key, word)
+        return word
+
+
+class MessageStore:
+    """
+    m.msg，sss为SSS.MKF的MKFDecoder，只用来读取第3个子文件中的对话偏移表
+    """
+
+    def __init__(self, sss, path='M.MSG', cache=None, errors='replace'):
+        self.path = path
+        self.errors = errors
+        self.offsets = array.array('I')
+        table = sss.read_raw(3)
+        self.offsets.fromstring(table[:len(table) & ~3])
+        if sys.byteorder == 'big':
+            self.offsets.byteswap()
+        self.content = _map_file(path)
+        self.cache = cache if cache is not None else LRUChunkCache(1 << 20)
+
+    def close(self):
+        if isinstance(self.content, mmap.mmap):
+            self.content.close()
+
+    def getMessageCount(self):
+        # 与PAL_InitText相同：偏移表项数 - 1
+        return max(len(self.offsets) - 1, 0)
+
+    def raw(self, n):
+        '''
+        返回第n条对话的原始big5数据
+        '''
+        start = self.offsets[n]
+        return self.content[start:max(self.offsets[n + 1], start)]
+
+    def get(self, n):
+        '''
+        返回第n条对话（utf8），不存在时返回None
+        '''
+        if n < 0 or n >= self.getMessageCount():
+            return None
+        key = ('msg', n)
+        msg = self.cache.get(key)
+        if msg is None:
+            msg = self.raw(n).decode('big5', self.errors).encode('utf8')
+            self.cache.put(key, msg)
+        return msg
+
+    def iter_messages(self, start=0, stop=None):
+        '''
+        按顺序生成 (编号, 对话)，不经过缓存
+        '''
+        stop = self.getMessageCount() if stop is None else min(stop, self.getMessageCount())
+        errors = self.errors
+        for n in xrange(start, stop):
+            yield n, self.raw(n).decode('big5', errors).encode('utf8')
+
+    def export(self, f):
+        '''
+        把所有对话以“编号<TAB>对话”每行一条的格式写入文件对象f，返回导出的条数
+        '''
+        count = 0
+        for n, msg in self.iter_messages():
+            f.write('%d\t%s\n' % (n, msg.replace('\n', '\\n')))
+            count += 1
+        return count
+
+
+if __name__ == '__main__':
+    import argparse
+    from mkf_unpack import MKFDecoder
+
+    parser = argparse.ArgumentParser(description='dump m.msg dialog text or word.dat words as utf8')
+    parser.add_argument('--sss', default='SSS.MKF', help='path of SSS.MKF')
+    parser.add_argument('--msg', default='M.MSG', help='path of M.MSG')
+    parser.add_argument('--word', help='dump this WORD.DAT instead of the messages')
+    parser.add_argument('-o', '--output', help='output file, stdout if omitted')
+    args = parser.parse_args()
+    out = open(args.output, 'wb') if args.output else sys.stdout
+    try:
+        if args.word:
+            words = WordStore(args.word)
+            for n in xrange(words.getWordCount()):
+                out.write('%d\t%s\n' % (n, words.get(n)))
+        else:
+            with MKFDecoder(path=args.sss) as sss:
+                MessageStore(sss, args.msg).export(out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
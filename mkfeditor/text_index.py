@@ -0,0 +1,213 @@
+# coding=utf-8
+"""
+游戏文字（word.dat词条和m.msg对话）的全文索引
+
+中文没有分词，所以按字切分：每个字和每两个相邻的字（bigram）都作为索引项，
+查询时取查询串中所有bigram的倒排表求交集，再对候选逐个确认包含整个查询串
+单字查询直接用单字的倒排表
+
+文档编号：词条为词条编号本身，对话为 MESSAGE_BASE + 对话编号
+索引保存在数据文件所在目录的TEXT.IDX中，同时记录建立索引时各数据文件的大小和修改时间，
+数据文件变化后重新建立；编辑器中修改物件名称时通过update增量更新内存中的索引，
+这些修改不会保存到TEXT.IDX（编辑器把修改写入WORDEX.DAT，下次启动仍然读入word.dat）
+"""
+import array
+import cPickle
+import os
+
+MESSAGE_BASE = 0x10000
+INDEX_NAME = 'TEXT.IDX'
+
+
+def word_key(n):
+    return n
+
+
+def message_key(n):
+    return MESSAGE_BASE + n
+
+
+def split_key(key):
+    '''
+    把文档编号拆成 ('word' 或 'msg', 编号)
+    '''
+    if key >= MESSAGE_BASE:
+        return 'msg', key - MESSAGE_BASE
+    return 'word', key
+
+
+def grams(text):
+    '''
+    返回text中所有的单字和bigram
+    '''
+    text = text.lower()
+    result = set(text)
+    result.update(text[i:i + 2] for i in xrange(len(text) - 1))
+    return result
+
+
+class TextIndex:
+    """
+    texts为 {文档编号: unicode文本}，postings为 {索引项: 文档编号集合}
+    从文件读入时倒排表先保持为array('I')，用到时才转换成set
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self.texts = {}
+        self.postings = {}
+        self.signature = None
+
+    def _posting(self, gram):
+        posting = self.postings.get(gram)
+        if posting is None:
+            return None
+        if not isinstance(posting, set):
+            posting = self.postings[gram] = set(posting)
+        return posting
+
+    def add(self, key, text):
+        if key in self.texts:
+            self.remove(key)
+        self.texts[key] = text
+        for gram in grams(text):
+            posting = self._posting(gram)
+            if posting is None:
+                posting = self.postings[gram] = set()
+            posting.add(key)
+
+    def remove(self, key):
+        text = self.texts.pop(key, None)
+        if text is None:
+            return
+        for gram in grams(text):
+            posting = self._posting(gram)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self.postings[gram]
+
+    def update(self, key, text):
+        '''
+        文档内容改变时调用，只更新该文档涉及的索引项；只改内存中的索引，需要时自行调用save
+        '''
+        self.add(key, text)
+
+    def search(self, query, limit=None):
+        '''
+        返回包含query（unicode，不区分大小写）的文档编号，按编号排序
+        '''
+        query = query.lower()
+        if not query:
+            return []
+        if len(query) == 1:
+            keys = sorted(self._posting(query) or ())
+        else:
+            postings = [self._posting(query[i:i + 2]) for i in xrange(len(query) - 1)]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            texts = self.texts
+            keys = sorted(key for key in candidates if query in texts[key].lower())
+        return keys[:limit] if limit is not None else keys
+
+    def save(self, path):
+        postings = {}
+        for gram, posting in self.postings.iteritems():
+            if isinstance(posting, set):
+                posting = array.array('I', sorted(posting))
+            postings[gram] = posting.tostring()
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            cPickle.dump((self.VERSION, self.signature, self.texts, postings), f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+
+    def load(self, path):
+        '''
+        读入索引文件，版本不对时返回False
+        '''
+        with open(path, 'rb') as f:
+            version, signature, texts, postings = cPickle.load(f)
+        if version != self.VERSION:
+            return False
+        self.signature = signature
+        self.texts = texts
+        self.postings = {}
+        for gram, data in postings.iteritems():
+            posting = array.array('I')
+            posting.fromstring(data)
+            self.postings[gram] = posting
+        return True
+
+
+def file_signature(paths):
+    return [(os.path.basename(p), os.path.getsize(p), int(os.path.getmtime(p))) for p in paths if p]
+
+
+def build_index(words, messages=None):
+    '''
+    words为text.WordStore，messages为text.MessageStore（可以为None）
+    '''
+    index = TextIndex()
+    for n in xrange(words.getWordCount()):
+        index.add(word_key(n), words.get(n).decode('utf8'))
+    if messages is not None:
+        for n, msg in messages.iter_messages():
+            index.add(message_key(n), msg.decode('utf8'))
+    return index
+
+
+def open_index(words, messages=None, sss_path=None, rebuild=False):
+    '''
+    打开word.dat所在目录中的TEXT.IDX，不存在或者数据文件已经改变时重新建立并保存
+    sss_path为SSS.MKF的路径（对话偏移表在其中），变化时同样重新建立
+    '''
+    path = os.path.join(os.path.dirname(os.path.abspath(words.path)), INDEX_NAME)
+    signature = file_signature([words.path, messages.path if messages else None, sss_path])
+    index = TextIndex()
+    if not rebuild and os.path.exists(path):
+        try:
+            if index.load(path) and index.signature == signature:
+                return index
+        except (EOFError, ValueError, cPickle.UnpicklingError):
+            pass
+    index = build_index(words, messages)
+    index.signature = signature
+    index.save(path)
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+    import locale
+    import sys
+    import time
+    from mkf_unpack import MKFDecoder
+    from text import WordStore, MessageStore
+
+    parser = argparse.ArgumentParser(description='search object names and dialog messages')
+    parser.add_argument('query')
+    parser.add_argument('-d', '--dir', default='.', help='directory of WORD.DAT, M.MSG and SSS.MKF')
+    parser.add_argument('-n', '--limit', type=int, default=50)
+    parser.add_argument('--rebuild', action='store_true', help='rebuild TEXT.IDX')
+    args = parser.parse_args()
+
+    words = WordStore(os.path.join(args.dir, 'WORD.DAT'))
+    sssPath = os.path.join(args.dir, 'SSS.MKF')
+    msgPath = os.path.join(args.dir, 'M.MSG')
+    messages = None
+    if os.path.exists(msgPath) and os.path.exists(sssPath):
+        with MKFDecoder(path=sssPath) as sss:
+            messages = MessageStore(sss, msgPath)
+    index = open_index(words, messages, sssPath if messages else None, args.rebuild)
+
+    query = args.query.decode(sys.stdin.encoding or locale.getpreferredencoding() or 'utf8')
+    start = time.time()
+    keys = index.search(query)
+    elapsed = time.time() - start
+    for key in keys[:args.limit]:
+        kind, n = split_key(key)
+        print '%s\t%d\t%s' % (kind, n, index.texts[key].encode('utf8'))
+    print '%d matches in %.3f ms' % (len(keys), elapsed * 1000)
@@ -0,0 +1,143 @@
+# coding=utf-8
+"""
+YJ_1解码速度对比：YJ1Decoder（逐位） vs YJ1TableDecoder（查表）
+
+用法：python yj1_bench.py FBP.MKF MGO.MKF [-n 次数] [-l 每个文件最多测试的子文件数] [-m 个数]
+
+对每个MKF中所有YJ_1压缩的子文件分别用两种解码器解压，先校验输出逐字节一致，
+再统计总耗时和吞吐量（按解压后的字节数计算）
+-m N 额外测量解压最大的N个子文件时的内存峰值增长（每次在单独的子进程中测量）
+"""
+import argparse
+import multiprocessing
+import Queue
+import resource
+import time
+from struct import unpack_from
+
+from mkf_unpack import MKFDecoder, YJ1Decoder, YJ1TableDecoder
+
+
+def best_of(repeat, func):
+    '''
+    执行func repeat次，返回最短的耗时（秒）
+    '''
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def time_decoder(decoder, chunks, repeat):
+    return best_of(repeat, lambda: [decoder.decode(chunk) for chunk in chunks])
+
+
+def peak_rss():
+    '''
+    当前进程的内存峰值（Linux下单位为KB）
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _subprocess_worker(func, args, queue):
+    try:
+        queue.put((True, func(*args)))
+    except Exception as e:
+        queue.put((False, repr(e)))
+
+
+def run_in_subprocess(func, *args):
+    '''
+    在单独的子进程中执行func(*args)并返回结果，这样测得的内存峰值不受之前的测试影响；
+    子进程中的异常以RuntimeError重新抛出，子进程没有返回结果就退出（例如被OOM杀掉）时同样抛出RuntimeError
+    '''
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_subprocess_worker, args=(func, args, queue))
+    proc.start()
+    while True:
+        try:
+            ok, result = queue.get(timeout=1)
+            break
+        except Queue.Empty:
+            if not proc.is_alive():
+                # 子进程退出前会把结果写完，再等一次以免与退出同时发生时漏掉结果
+                try:
+                    ok, result = queue.get(timeout=1)
+                    break
+                except Queue.Empty:
+                    proc.join()
+                    raise RuntimeError('subprocess exited with code %s without a result' % proc.exitcode)
+    proc.join()
+    if not ok:
+        raise RuntimeError(result)
+    return result
+
+
+def _peak_rss_growth(decoder, chunk):
+    before = peak_rss()
+    decoder.decode(chunk)
+    return peak_rss() - before
+
+
+def peak_rss_growth(decoder, chunk):
+    '''
+    在子进程中解压chunk，返回进程内存峰值的增长（Linux下单位为KB）
+    '''
+    return run_in_subprocess(_peak_rss_growth, decoder, chunk)
+
+
+def bench_memory(chunks, count):
+    # 按YJ_1文件头中的原始长度排序
+    largest = sorted(chunks, key=lambda c: unpack_from('I', c, 4)[0], reverse=True)[:count]
+    for chunk in largest:
+        print '  %7d bytes -> %8d bytes: YJ1Decoder +%dKB, YJ1TableDecoder +%dKB' % (
+            len(chunk), unpack_from('I', chunk, 4)[0],
+            peak_rss_growth(YJ1Decoder(), chunk), peak_rss_growth(YJ1TableDecoder(), chunk))
+
+
+def bench_archive(path, repeat, limit, memory=0):
+    mkf = MKFDecoder(path=path)
+    chunks = []
+    for i in xrange(mkf.getFileCount()):
+        if limit and len(chunks) >= limit:
+            break
+        raw = mkf.read_raw(i)
+        if len(raw) > 16 and mkf.isYJ1(i):
+            chunks.append(str(raw))
+    if not chunks:
+        print '%s: no YJ_1 chunk' % path
+        return
+
+    old, new = YJ1Decoder(), YJ1TableDecoder()
+    total = 0
+    for i, chunk in enumerate(chunks):
+        expected = old.decode(chunk)
+        if new.decode(chunk) != expected:
+            raise AssertionError('%s: chunk %d mismatch' % (path, i))
+        total += len(expected)
+
+    t_old = time_decoder(old, chunks, repeat)
+    t_new = time_decoder(new, chunks, repeat)
+    mb = total / 1048576.0
+    print '%s: %d chunks, %.2f MB decoded' % (path, len(chunks), mb)
+    print '  YJ1Decoder      %8.3fs  %7.3f MB/s' % (t_old, mb / t_old)
+    print '  YJ1TableDecoder %8.3fs  %7.3f MB/s  (x%.1f)' % (t_new, mb / t_new, t_old / t_new)
+    if memory:
+        print '  peak RSS growth:'
+        bench_memory(chunks, memory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='YJ_1 decoder benchmark')
+    parser.add_argument('archives', nargs='+', help='MKF files, e.g. FBP.MKF MGO.MKF')
+    parser.add_argument('-n', '--repeat', type=int, default=3)
+    parser.add_argument('-l', '--limit', type=int, default=0)
+    parser.add_argument('-m', '--memory', type=int, default=0,
+                        help='measure peak RSS growth on the N largest chunks')
+    args = parser.parse_args()
+    for path in args.archives:
+        bench_archive(path, args.repeat, args.limit, args.memory)